@@ -0,0 +1,169 @@
+import numpy as np
+
+# Frequency band (Hz) searched for the dominant respiratory component.
+MIN_FREQ = 1.0
+MAX_FREQ = 4.0
+
+
+def estimate_rr(signal, fps, min_f=MIN_FREQ, max_f=MAX_FREQ):
+    """
+    Returns the respiratory rate (BPM) of the dominant frequency in [min_f, max_f],
+    or None if the signal is too short to resolve any bin in that band.
+    """
+    signal = np.asarray(signal, dtype=np.float32)
+    signal = signal - np.mean(signal)
+    fft_result = np.fft.rfft(signal)
+    freqs = np.fft.rfftfreq(len(signal), d=1.0/fps)
+    magnitudes = np.abs(fft_result)
+    valid_idx = np.where((freqs >= min_f) & (freqs <= max_f))[0]
+    if len(valid_idx) == 0:
+        return None
+    max_idx = valid_idx[np.argmax(magnitudes[valid_idx])]
+    dominant_freq = freqs[max_idx]
+    return dominant_freq * 60.0  # Convert Hz to BPM.
+
+
+def sliding_rr(signal, fps, window_s=5, step_s=1.0, min_f=MIN_FREQ, max_f=MAX_FREQ,
+               zero_pad=1, chunk_windows=4096):
+    """
+    Vectorised RR over every full window of a whole trace at once.
+
+    Windows of window_s seconds, one every step_s seconds, are taken as strided
+    views of the trace (no copies), demeaned together and transformed with one
+    batched rfft per chunk of chunk_windows windows, so memory stays bounded for
+    day-long traces. zero_pad > 1 pads each window for a finer frequency grid.
+    Returns (end_indices, rr) where end_indices[i] is the exclusive end sample of
+    window i and rr[i] is its RR in BPM (NaN if the band holds no bin).
+    """
+    signal = np.asarray(signal, dtype=np.float32)
+    window = int(fps * window_s)
+    step = max(1, int(round(fps * step_s)))
+    if window < 2 or len(signal) < window:
+        return np.zeros(0, dtype=int), np.zeros(0)
+
+    n_fft = window * zero_pad
+    freqs = np.fft.rfftfreq(n_fft, d=1.0/fps)
+    band = np.where((freqs >= min_f) & (freqs <= max_f))[0]
+    windows = np.lib.stride_tricks.sliding_window_view(signal, window)[::step]
+    end_indices = np.arange(len(windows)) * step + window
+    if len(band) == 0:
+        return end_indices, np.full(len(windows), np.nan)
+
+    rr = np.empty(len(windows))
+    for start in range(0, len(windows), chunk_windows):
+        chunk = windows[start:start + chunk_windows]
+        chunk = chunk - chunk.mean(axis=1, keepdims=True)
+        magnitudes = np.abs(np.fft.rfft(chunk, n=n_fft, axis=1)[:, band])
+        rr[start:start + len(chunk)] = freqs[band[np.argmax(magnitudes, axis=1)]] * 60.0
+    return end_indices, rr
+
+
+def rr_series(intensities, fps, window_s=5, step_s=1.0, min_f=MIN_FREQ, max_f=MAX_FREQ):
+    """
+    Replays the rolling-buffer RR update over a whole intensity trace: every step_s
+    seconds of video the trailing window_s seconds are analysed (once at least half
+    the window is filled). Returns one RR value per update, NaN where none was found.
+    """
+    intensities = np.asarray(intensities, dtype=np.float32)
+    buffer_size = int(fps * window_s)
+    update_every = max(1, int(round(fps * step_s)))
+    # Updates before the buffer is full see a shorter window; there are at most a
+    # handful of them, so they go through estimate_rr one by one.
+    rr_values = []
+    end = update_every
+    while end < buffer_size and end <= len(intensities):
+        if end >= buffer_size // 2:
+            rr = estimate_rr(intensities[:end], fps, min_f, max_f)
+            rr_values.append(np.nan if rr is None else rr)
+        end += update_every
+    if end > len(intensities):
+        return np.asarray(rr_values)
+
+    # Every later update sees a full window ending at end, end + update_every, ...
+    tail = intensities[end - buffer_size:]
+    _, full_rr = sliding_rr(tail, fps, window_s, step_s, min_f, max_f)
+    return np.concatenate([rr_values, full_rr])
+
+
+def peak_prominences(signal):
+    """
+    For every sample that is a 3-point local maximum, returns (index, prominence)
+    where prominence = min(rise from the previous sample, fall to the next one).
+    That is exactly the quantity the live beep logic compares with peak_threshold.
+    """
+    signal = np.asarray(signal, dtype=np.float64)
+    if len(signal) < 3:
+        return np.zeros(0, dtype=int), np.zeros(0)
+    rise = signal[1:-1] - signal[:-2]
+    fall = signal[1:-1] - signal[2:]
+    is_peak = (rise > 0) & (fall > 0)
+    indices = np.flatnonzero(is_peak) + 1
+    return indices, np.minimum(rise, fall)[is_peak]
+
+
+def peak_counts(signal, thresholds):
+    """Number of peaks whose prominence exceeds each threshold, for all thresholds at once."""
+    _, prominences = peak_prominences(signal)
+    prominences = np.sort(prominences)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    return len(prominences) - np.searchsorted(prominences, thresholds, side="right")
+
+
+def sweep(signal, fps, window_lengths=(5,), bands=((MIN_FREQ, MAX_FREQ),), thresholds=(0.01,), step_s=1.0):
+    """
+    Reanalyses one trace over a grid of settings. Returns a list of dicts: one per
+    (window length, band) with RR statistics, and one per peak threshold with the
+    peak-derived breathing rate.
+    """
+    signal = np.asarray(signal, dtype=np.float32)
+    duration_min = len(signal) / fps / 60.0
+    results = []
+    for window_s in window_lengths:
+        for min_f, max_f in bands:
+            _, rr = sliding_rr(signal, fps, window_s, step_s, min_f, max_f)
+            valid = rr[~np.isnan(rr)]
+            results.append({
+                "window_s": window_s, "min_f": min_f, "max_f": max_f, "windows": len(rr),
+                "rr_mean": float(np.mean(valid)) if len(valid) else None,
+                "rr_median": float(np.median(valid)) if len(valid) else None,
+                "rr_std": float(np.std(valid)) if len(valid) else None,
+            })
+    for threshold, count in zip(thresholds, peak_counts(signal, thresholds)):
+        results.append({
+            "threshold": float(threshold), "peaks": int(count),
+            "peak_rate": int(count) / duration_min if duration_min > 0 else None,
+        })
+    return results
+
+
+def main():
+    import argparse
+    from BreatheTrace import TraceReader
+
+    parser = argparse.ArgumentParser(description="Reanalyse a saved Breathe trace over a grid of settings.")
+    parser.add_argument("trace", help="Path to a .trace file.")
+    parser.add_argument("--roi", type=int, default=0, help="ROI index within the trace (0-based).")
+    parser.add_argument("--window", type=float, nargs="+", default=[5], help="Window lengths in seconds.")
+    parser.add_argument("--band", type=float, nargs=2, action="append", metavar=("MIN_F", "MAX_F"),
+                        help="Frequency band in Hz; repeat for several bands.")
+    parser.add_argument("--threshold", type=float, nargs="+", default=[0.01], help="Peak thresholds.")
+    parser.add_argument("--step", type=float, default=1.0, help="Seconds between RR windows.")
+    args = parser.parse_args()
+
+    reader = TraceReader(args.trace)
+    signal = reader.column("intensity", args.roi)
+    fps = reader.fps
+    print(f"{len(signal)} samples at {fps:.2f} fps ({len(signal) / fps / 60.0:.1f} min)")
+    for row in sweep(signal, fps, args.window, args.band or [(MIN_FREQ, MAX_FREQ)], args.threshold, args.step):
+        if "threshold" in row:
+            rate = f"{row['peak_rate']:.1f}/min" if row["peak_rate"] is not None else "n/a"
+            print(f"threshold {row['threshold']:<8g} peaks {row['peaks']:>8}  rate {rate}")
+        else:
+            rr = f"{row['rr_median']:.1f} BPM (mean {row['rr_mean']:.1f}, sd {row['rr_std']:.1f})" \
+                if row["rr_median"] is not None else "no RR"
+            print(f"window {row['window_s']:>5g} s  band {row['min_f']:g}-{row['max_f']:g} Hz  "
+                  f"{row['windows']:>7} windows  median {rr}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import deque
+
+import cv2
+import numpy as np
+
+from BreatheAnalysis import estimate_rr
+from BreatheExtract import ExtractionConfig, iter_multi_intensities
+from BreathePeaks import BreathDetector
+from BreatheTrace import TraceWriter
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".m4v", ".wmv")
+BUFFER_DURATION = 5      # seconds for the rolling buffer
+RR_UPDATE_INTERVAL = 1.0  # seconds of video between RR updates
+
+
+# ================================
+# Job Discovery:
+# ================================
+def parse_roi(value):
+    """Converts an [x, y, w, h] list or {"x":..,"y":..,"w":..,"h":..} dict into an int tuple."""
+    if isinstance(value, dict):
+        value = [value["x"], value["y"], value["w"], value["h"]]
+    roi = tuple(int(v) for v in value)
+    if len(roi) != 4 or roi[2] <= 0 or roi[3] <= 0:
+        raise ValueError(f"Invalid ROI {value!r}; expected x, y, w, h with positive size.")
+    return roi
+
+
+def parse_rois(value):
+    """
+    Accepts one ROI, a list of ROIs, or a dict with "roi"/"rois" and returns a list of
+    ROI tuples. Several ROIs on one video are tracked from a single decode pass.
+    """
+    if isinstance(value, dict):
+        if "rois" in value:
+            value = value["rois"]
+        elif "roi" in value:
+            value = value["roi"]
+        else:
+            return [parse_roi(value)]
+    if value and isinstance(value[0], (list, tuple, dict)):
+        return [parse_roi(v) for v in value]
+    return [parse_roi(value)]
+
+
+def load_manifest(manifest_path):
+    """
+    Reads a list of (video_path, rois) jobs from a JSON or CSV manifest.
+    JSON: [{"video": "...", "roi": [x, y, w, h]} or {"video": "...", "rois": [[...], ...]}, ...]
+          or {"video.mp4": [x, y, w, h] or [[...], ...], ...}
+    CSV:  header row video,x,y,w,h; repeat a video on several rows for several ROIs.
+    Relative video paths are resolved against the manifest's directory.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = {}
+    if manifest_path.lower().endswith(".csv"):
+        with open(manifest_path, newline="", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                jobs.setdefault(row["video"], []).append(parse_roi(row))
+    else:
+        with open(manifest_path, encoding="utf-8") as f:
+            entries = json.load(f)
+        if isinstance(entries, dict):
+            entries = [{"video": k, "rois": v} for k, v in entries.items()]
+        for entry in entries:
+            jobs.setdefault(entry["video"], []).extend(parse_rois(entry))
+    return [(os.path.join(base_dir, video), rois) for video, rois in jobs.items()]
+
+
+def scan_directory(directory, default_roi=None):
+    """
+    Collects every video in a directory. The ROIs of each video are read from a
+    sidecar JSON next to it (<name>.json holding [x, y, w, h], a list of those, or
+    {"roi": [...]} / {"rois": [...]}), falling back to default_roi. Videos without
+    any ROI are skipped.
+    """
+    jobs = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(VIDEO_EXTENSIONS):
+            continue
+        video_path = os.path.join(directory, name)
+        sidecar = os.path.splitext(video_path)[0] + ".json"
+        if os.path.exists(sidecar):
+            with open(sidecar, encoding="utf-8") as f:
+                entry = json.load(f)
+            rois = parse_rois(entry)
+        elif default_roi is not None:
+            rois = [default_roi]
+        else:
+            print(f"Skipping {name}: no ROI sidecar and no --roi given.")
+            continue
+        jobs.append((video_path, rois))
+    return jobs
+
+
+# ================================
+# Headless Processing:
+# ================================
+def process_video(video_path, rois, output_dir, config=None):
+    """
+    Runs intensity extraction and RR estimation over a whole video without any GUI
+    calls and streams the results into <name>.trace in output_dir (see BreatheTrace;
+    one record per analysed frame and ROI, RR filled in on update frames). Detected
+    breaths go to <name>_events.csv. All ROIs are measured from the same decoded
+    frames. RR is updated once per second of *video* time, so results do not depend
+    on how fast the machine processes frames.
+    """
+    # Each worker process handles one file; keep OpenCV from spawning its own pool.
+    cv2.setNumThreads(1)
+    config = config or ExtractionConfig()
+    start_time = time.time()
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video source: {video_path}")
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if fps == 0:
+        fps = 60.0
+    sample_rate = fps / config.frame_step  # rate of the analysed samples
+    buffer_size = int(sample_rate * BUFFER_DURATION)
+    update_every = max(1, int(round(sample_rate * RR_UPDATE_INTERVAL)))
+    intensity_buffers = [deque(maxlen=buffer_size) for _ in rois]
+    rr_sums = np.zeros(len(rois))
+    rr_counts = np.zeros(len(rois), dtype=int)
+    events = []
+    detectors = [BreathDetector(sample_rate, sink=events.append, roi=i) for i in range(len(rois))]
+
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    trace_path = os.path.join(output_dir, f"{base_name}.trace")
+    metadata = {"source": video_path, "fps": sample_rate, "source_fps": fps, "rois": rois,
+                "frame_step": config.frame_step, "pyramid_level": config.pyramid_level}
+
+    current_frame = 0
+    samples = 0
+    try:
+        with TraceWriter(trace_path, metadata) as trace:
+            for current_frame, intensities in iter_multi_intensities(cap, rois, config):
+                samples += 1
+                update_rr = samples % update_every == 0
+                rrs = [None] * len(rois)
+                time_s = current_frame / fps
+                for i, (buffer, avg_intensity) in enumerate(zip(intensity_buffers, intensities)):
+                    buffer.append(avg_intensity)
+                    detectors[i].update(avg_intensity, time_s, current_frame)
+                    if update_rr and len(buffer) >= buffer_size // 2:
+                        rrs[i] = estimate_rr(buffer, sample_rate)
+                        if rrs[i] is not None:
+                            rr_sums[i] += rrs[i]
+                            rr_counts[i] += 1
+                trace.append_many(current_frame, time_s, intensities, rrs)
+    finally:
+        cap.release()
+
+    with open(os.path.join(output_dir, f"{base_name}_events.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["roi", "frame", "time_s", "latency_s", "amplitude"])
+        for event in events:
+            writer.writerow([event.roi + 1, event.frame, f"{event.time_s:.4f}",
+                             f"{event.latency_s:.4f}", f"{event.amplitude:.4f}"])
+
+    return {
+        "video": video_path,
+        "trace": trace_path,
+        "frames": current_frame,
+        "fps": fps,
+        "mean_rr": [rr_sum / n if n else None for rr_sum, n in zip(rr_sums, rr_counts)],
+        "breaths": [d.events for d in detectors],
+        "elapsed": time.time() - start_time,
+    }
+
+
+def run_batch(jobs, output_dir, workers=None, config=None):
+    """Fans the jobs out over a process pool and returns one summary per finished video."""
+    os.makedirs(output_dir, exist_ok=True)
+    summaries = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_video, video, rois, output_dir, config): video for video, rois in jobs}
+        for future in as_completed(futures):
+            video = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                print(f"❌ {os.path.basename(video)}: {e}")
+                continue
+            summaries.append(summary)
+            rr_text = ", ".join(f"{rr:.1f} BPM" if rr is not None else "no RR" for rr in summary["mean_rr"])
+            print(f"✅ {os.path.basename(video)}: {summary['frames']} frames, {rr_text} "
+                  f"({summary['frames'] / max(summary['elapsed'], 1e-9):.0f} frames/s)")
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless batch respiratory-rate extraction over many recorded videos.")
+    parser.add_argument("source", help="Directory of videos (ROIs from <name>.json sidecars) or a JSON/CSV manifest.")
+    parser.add_argument("-o", "--output", default="breathe_output", help="Directory for the per-video .trace results.")
+    parser.add_argument("--roi", type=int, nargs=4, metavar=("X", "Y", "W", "H"),
+                        help="Default ROI for videos in a directory that have no sidecar.")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Number of worker processes (default: all cores).")
+    parser.add_argument("--frame-step", type=int, default=1, help="Analyse every Nth frame (others are grabbed, not decoded).")
+    parser.add_argument("--pyramid", type=int, default=0, help="ROI downscale level (pixel stride 2**level).")
+    parser.add_argument("--exact-gray", action="store_true", help="Use cvtColor + np.mean instead of the luma shortcut.")
+    args = parser.parse_args()
+    config = ExtractionConfig(args.frame_step, args.pyramid, luma_only=not args.exact_gray)
+
+    if os.path.isdir(args.source):
+        jobs = scan_directory(args.source, parse_roi(args.roi) if args.roi else None)
+    else:
+        jobs = load_manifest(args.source)
+    if not jobs:
+        print("No videos to process.")
+        return
+
+    print(f"Processing {len(jobs)} video(s)...")
+    start_time = time.time()
+    summaries = run_batch(jobs, args.output, args.workers, config)
+    print(f"Finished {len(summaries)}/{len(jobs)} video(s) in {time.time() - start_time:.1f} s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from BreatheAnalysis import rr_series
+from BreatheExtract import ExtractionConfig, MultiRoiExtractor, iter_frames
+from BreatheSpectral import SlidingSpectrumEstimator
+from BreathePeaks import BreathDetector
+
+DEFAULT_RESOLUTIONS = ["640x360", "1280x720", "1920x1080"]
+DEFAULT_FPS = [30, 60]
+
+
+# ================================
+# Synthetic Videos:
+# ================================
+def make_synthetic_video(path, width, height, fps, duration_s, breath_hz,
+                         amplitude=6.0, noise=4.0, motion_px=2.0, seed=0):
+    """
+    Writes an MJPG .avi of a textured scene whose central "chest" patch brightens
+    and darkens at breath_hz. Gaussian pixel noise and a slow random camera jitter
+    of up to motion_px pixels are added on top. Returns the ROI (x, y, w, h) that
+    covers the breathing patch.
+    """
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    if not writer.isOpened():
+        raise IOError(f"Could not open video writer for {path}")
+
+    margin = int(np.ceil(motion_px)) + 1
+    background = rng.integers(60, 190, size=(height + 2 * margin, width + 2 * margin, 3), dtype=np.uint8)
+    background = cv2.GaussianBlur(background, (0, 0), 3)
+    roi = (width // 3, height // 3, width // 3, height // 3)
+    roi_x, roi_y, roi_w, roi_h = roi
+    chest = (slice(roi_y + margin, roi_y + roi_h + margin), slice(roi_x + margin, roi_x + roi_w + margin))
+
+    offset = np.zeros(2)
+    for i in range(int(fps * duration_s)):
+        scene = background.astype(np.int16)
+        scene[chest] += int(round(amplitude * np.sin(2.0 * np.pi * breath_hz * i / fps)))
+        if noise:
+            scene += rng.normal(0.0, noise, size=scene.shape).astype(np.int16)
+        # Smooth random-walk camera shake, clamped to +-motion_px.
+        offset = np.clip(offset + rng.normal(0.0, motion_px / 4.0, size=2), -motion_px, motion_px)
+        dx, dy = margin + int(round(offset[0])), margin + int(round(offset[1]))
+        frame = np.clip(scene[dy:dy + height, dx:dx + width], 0, 255).astype(np.uint8)
+        writer.write(frame)
+    writer.release()
+    return roi
+
+
+# ================================
+# Measurement:
+# ================================
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+
+def run_engine(video_path, roi, config, min_f, max_f):
+    """
+    Runs the headless extraction + RR + breath-detection engine over one video and
+    returns per-stage timings alongside the results.
+    """
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 60.0
+    sample_rate = fps / config.frame_step
+    extractor = MultiRoiExtractor([roi], config)
+    estimator = SlidingSpectrumEstimator(sample_rate, min_f=min_f, max_f=max_f, zero_pad=4, interpolate=True)
+    detector = BreathDetector(sample_rate)
+
+    stage_time = {"decode": 0.0, "extract": 0.0, "rr": 0.0, "peaks": 0.0}
+    intensities = []
+    rr_values = []
+    frames = iter_frames(cap, config.frame_step)
+    start_time = time.perf_counter()
+    while True:
+        t0 = time.perf_counter()
+        item = next(frames, None)
+        t1 = time.perf_counter()
+        stage_time["decode"] += t1 - t0
+        if item is None:
+            break
+        frame_number, frame = item
+        intensity = extractor(frame)[0]
+        t2 = time.perf_counter()
+        rr = estimator.update(intensity)
+        t3 = time.perf_counter()
+        detector.update(intensity, frame_number / fps, frame_number)
+        t4 = time.perf_counter()
+        stage_time["extract"] += t2 - t1
+        stage_time["rr"] += t3 - t2
+        stage_time["peaks"] += t4 - t3
+        intensities.append(intensity)
+        if rr is not None:
+            rr_values.append(rr)
+    elapsed = time.perf_counter() - start_time
+    cap.release()
+    return {
+        "samples": len(intensities),
+        "elapsed": elapsed,
+        "stage_time": stage_time,
+        "intensities": np.asarray(intensities),
+        "rr_live": np.asarray(rr_values),
+        "breaths": detector.events,
+        "sample_rate": sample_rate,
+    }
+
+
+def benchmark_case(work_dir, width, height, fps, duration_s, breath_hz, config, min_f, max_f, noise, motion_px):
+    video_path = os.path.join(work_dir, f"synthetic_{width}x{height}_{fps}fps.avi")
+    roi = make_synthetic_video(video_path, width, height, fps, duration_s, breath_hz,
+                               noise=noise, motion_px=motion_px)
+    result = run_engine(video_path, roi, config, min_f, max_f)
+    os.remove(video_path)
+
+    true_rr = breath_hz * 60.0
+    # Skip the first window: the live estimator is still filling up there.
+    live = result["rr_live"][int(result["sample_rate"] * 5):]
+    offline = rr_series(result["intensities"], result["sample_rate"], min_f=min_f, max_f=max_f)
+    offline = offline[~np.isnan(offline)]
+    return {
+        "resolution": f"{width}x{height}",
+        "fps": fps,
+        "frames_per_s": result["samples"] * config.frame_step / max(result["elapsed"], 1e-9),
+        "stage_ms": {k: 1000.0 * v / max(result["samples"], 1) for k, v in result["stage_time"].items()},
+        "live_rr_error": float(np.mean(np.abs(live - true_rr))) if len(live) else float("nan"),
+        "offline_rr_error": float(np.mean(np.abs(offline - true_rr))) if len(offline) else float("nan"),
+        "breath_error": result["breaths"] - (duration_s - 1.0) * breath_hz,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Breathe extraction and RR accuracy on synthetic videos.")
+    parser.add_argument("--resolutions", nargs="+", default=DEFAULT_RESOLUTIONS, help="WIDTHxHEIGHT list.")
+    parser.add_argument("--fps", type=int, nargs="+", default=DEFAULT_FPS)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per synthetic video.")
+    parser.add_argument("--breath-hz", type=float, default=1.5, help="Ground-truth breathing frequency.")
+    parser.add_argument("--band", type=float, nargs=2, default=(1.0, 4.0), metavar=("MIN_F", "MAX_F"))
+    parser.add_argument("--noise", type=float, default=4.0, help="Pixel noise standard deviation.")
+    parser.add_argument("--motion", type=float, default=2.0, help="Maximum camera jitter in pixels.")
+    parser.add_argument("--frame-step", type=int, default=1)
+    parser.add_argument("--pyramid", type=int, default=0)
+    parser.add_argument("--work-dir", default=None, help="Where to write the temporary videos.")
+    args = parser.parse_args()
+
+    config = ExtractionConfig(args.frame_step, args.pyramid)
+    print(f"Config: {config}, truth {args.breath_hz * 60.0:.1f} BPM, band {args.band[0]:g}-{args.band[1]:g} Hz")
+    print(f"{'video':<18}{'frames/s':>10}{'decode':>9}{'extract':>9}{'rr':>8}{'peaks':>8}"
+          f"{'live err':>10}{'offl err':>10}{'breaths':>9}{'RSS MB':>8}")
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+        for resolution in args.resolutions:
+            width, height = (int(v) for v in resolution.lower().split("x"))
+            for fps in args.fps:
+                r = benchmark_case(work_dir, width, height, fps, args.duration, args.breath_hz,
+                                   config, args.band[0], args.band[1], args.noise, args.motion)
+                ms = r["stage_ms"]
+                print(f"{r['resolution'] + '@' + str(r['fps']):<18}{r['frames_per_s']:>10.0f}"
+                      f"{ms['decode']:>9.3f}{ms['extract']:>9.3f}{ms['rr']:>8.3f}{ms['peaks']:>8.3f}"
+                      f"{r['live_rr_error']:>10.2f}{r['offline_rr_error']:>10.2f}"
+                      f"{r['breath_error']:>+9.0f}{r['peak_rss_mb']:>8.0f}")
+    print("Stage columns are ms per analysed frame; errors are mean absolute BPM against the "
+          "ground truth; breaths is detected minus expected.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from BreatheAnalysis import rr_series
+
+# BT.601 luma weights in OpenCV's BGR channel order (the same ones COLOR_BGR2GRAY uses).
+LUMA_WEIGHTS = (0.114, 0.587, 0.299)
+
+
+class ExtractionConfig:
+    """
+    Settings for the ROI intensity extraction engine.
+    frame_step:    analyse every Nth frame; the frames in between are only grabbed, never decoded.
+    pyramid_level: sample every 2**level-th pixel of the ROI in both directions.
+    luma_only:     take the mean luma straight from the per-channel means instead of
+                   converting the ROI to grayscale first.
+    """
+    def __init__(self, frame_step=1, pyramid_level=0, luma_only=True):
+        if frame_step < 1:
+            raise ValueError("frame_step must be >= 1")
+        if pyramid_level < 0:
+            raise ValueError("pyramid_level must be >= 0")
+        self.frame_step = int(frame_step)
+        self.pyramid_level = int(pyramid_level)
+        self.luma_only = luma_only
+
+    def __repr__(self):
+        return (f"ExtractionConfig(frame_step={self.frame_step}, "
+                f"pyramid_level={self.pyramid_level}, luma_only={self.luma_only})")
+
+
+# The original per-frame path: full-resolution ROI, grayscale conversion, then np.mean.
+FULL_RATE = ExtractionConfig(frame_step=1, pyramid_level=0, luma_only=False)
+
+
+def roi_intensity(frame, roi, config=None):
+    """Returns the average intensity of the ROI in one frame."""
+    config = config or ExtractionConfig()
+    roi_x, roi_y, roi_w, roi_h = roi
+    roi_frame = frame[roi_y:roi_y+roi_h, roi_x:roi_x+roi_w]
+    if config.pyramid_level:
+        # The mean is already a box filter over the whole ROI, so plain decimation
+        # (no pyrDown blur) is enough and costs nothing but a strided view.
+        stride = 1 << config.pyramid_level
+        roi_frame = roi_frame[::stride, ::stride]
+    if roi_frame.ndim == 2:
+        return float(cv2.mean(roi_frame)[0])
+    if config.luma_only:
+        # mean(w . pixel) == w . mean(pixel), so one cv2.mean replaces cvtColor + np.mean.
+        b, g, r, _ = cv2.mean(roi_frame)
+        return LUMA_WEIGHTS[0] * b + LUMA_WEIGHTS[1] * g + LUMA_WEIGHTS[2] * r
+    gray_roi = cv2.cvtColor(roi_frame, cv2.COLOR_BGR2GRAY)
+    return float(np.mean(gray_roi))
+
+
+class MultiRoiExtractor:
+    """
+    Average intensity of many ROIs from one frame in a single pass.
+
+    The bounding box of all ROIs is (optionally decimated and) turned into an
+    integral image once; every ROI mean is then four lookups, done for all ROIs
+    at once with fancy indexing. Overlapping ROIs cost nothing extra. When
+    decimating, each ROI samples every 2**level-th pixel from its own corner, as
+    roi_intensity does: ROIs sharing a grid phase share one integral image.
+    """
+    def __init__(self, rois, config=None):
+        self.config = config or ExtractionConfig()
+        self.rois = np.array(rois, dtype=np.int64).reshape(-1, 4)
+        if len(self.rois) == 0:
+            raise ValueError("At least one ROI is required.")
+        self._frame_shape = None
+
+    def _prepare(self, frame_shape):
+        """Clips the ROIs to the frame and precomputes their integral-image corners."""
+        height, width = frame_shape[:2]
+        x0 = np.clip(self.rois[:, 0], 0, width)
+        y0 = np.clip(self.rois[:, 1], 0, height)
+        x1 = np.clip(self.rois[:, 0] + self.rois[:, 2], 0, width)
+        y1 = np.clip(self.rois[:, 1] + self.rois[:, 3], 0, height)
+        if np.any(x1 <= x0) or np.any(y1 <= y0):
+            raise ValueError(f"Some ROIs lie outside the {width}x{height} frame.")
+        self._bbox = (int(x0.min()), int(y0.min()), int(x1.max()), int(y1.max()))
+        stride = 1 << self.config.pyramid_level
+        bx, by = self._bbox[0], self._bbox[1]
+
+        # One strided crop per grid phase, starting at bbox + phase, so every ROI corner
+        # is a sampled pixel. Its indices there are [(lo - origin) / s, ceil((hi - origin) / s)),
+        # never empty, and at level 0 there is a single phase.
+        phase_x = (x0 - bx) % stride
+        phase_y = (y0 - by) % stride
+        self._groups = []
+        for px, py in sorted(set(zip(phase_x.tolist(), phase_y.tolist()))):
+            rows = np.flatnonzero((phase_x == px) & (phase_y == py))
+            ox, oy = bx + px, by + py
+            self._groups.append((rows, ox, oy,
+                                 (x0[rows] - ox) // stride, -(-(x1[rows] - ox) // stride),
+                                 (y0[rows] - oy) // stride, -(-(y1[rows] - oy) // stride)))
+        self._area = np.empty(len(self.rois), dtype=np.float64)
+        for rows, _, _, cx0, cx1, cy0, cy1 in self._groups:
+            self._area[rows] = (cx1 - cx0) * (cy1 - cy0)
+        self._stride = stride
+        self._frame_shape = frame_shape
+
+    def __call__(self, frame):
+        """Returns an array with one average intensity per ROI."""
+        if self._frame_shape != frame.shape:
+            self._prepare(frame.shape)
+        _, _, bx1, by1 = self._bbox
+        means = None
+        for rows, ox, oy, cx0, cx1, cy0, cy1 in self._groups:
+            crop = frame[oy:by1:self._stride, ox:bx1:self._stride]
+            if crop.ndim == 3 and not self.config.luma_only:
+                crop = cv2.cvtColor(np.ascontiguousarray(crop), cv2.COLOR_BGR2GRAY)
+            integral = cv2.integral(np.ascontiguousarray(crop), sdepth=cv2.CV_64F)
+            if integral.ndim == 2:
+                integral = integral[:, :, None]
+            sums = (integral[cy1, cx1] - integral[cy0, cx1]
+                    - integral[cy1, cx0] + integral[cy0, cx0])
+            if means is None:
+                means = np.empty((len(self.rois), sums.shape[1]))
+            means[rows] = sums / self._area[rows, None]
+        if means.shape[1] == 3:
+            return means @ np.asarray(LUMA_WEIGHTS)
+        return means[:, 0]
+
+
+def iter_frames(cap, frame_step=1):
+    """
+    Yields (frame_number, frame) for every analysed frame of an open capture.
+    frame_number is 1-based and counts every source frame, including skipped ones.
+    """
+    frame_number = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            return
+        frame_number += 1
+        yield frame_number, frame
+        # Skipped frames are grabbed (demuxed and advanced) but never retrieved/converted.
+        for _ in range(frame_step - 1):
+            if not cap.grab():
+                return
+            frame_number += 1
+
+
+def iter_intensities(cap, roi, config=None):
+    """Yields (frame_number, avg_intensity) for every analysed frame of an open capture."""
+    config = config or ExtractionConfig()
+    for frame_number, frame in iter_frames(cap, config.frame_step):
+        yield frame_number, roi_intensity(frame, roi, config)
+
+
+def iter_multi_intensities(cap, rois, config=None):
+    """Yields (frame_number, intensities) with one value per ROI, from a single decode pass."""
+    extractor = MultiRoiExtractor(rois, config)
+    for frame_number, frame in iter_frames(cap, extractor.config.frame_step):
+        yield frame_number, extractor(frame)
+
+
+def extract_video(video_path, roi, config=None):
+    """
+    Extracts the whole intensity trace of a video.
+    Returns (frame_numbers, intensities, fps) where fps is the source frame rate.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video source: {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if fps == 0:
+        fps = 60.0
+    frames, intensities = [], []
+    for frame_number, intensity in iter_intensities(cap, roi, config):
+        frames.append(frame_number)
+        intensities.append(intensity)
+    cap.release()
+    return np.asarray(frames), np.asarray(intensities, dtype=np.float64), fps
+
+
+def compare_to_full_rate(video_path, roi, config):
+    """
+    Runs both the original full-rate path and the configured fast path over one video
+    and reports speed-up plus intensity and RR differences at the frames both analysed.
+    """
+    start_time = time.perf_counter()
+    ref_frames, ref_values, fps = extract_video(video_path, roi, FULL_RATE)
+    ref_elapsed = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    fast_frames, fast_values, _ = extract_video(video_path, roi, config)
+    fast_elapsed = time.perf_counter() - start_time
+
+    # Intensity delta at the frames the fast path analysed.
+    ref_at_fast = ref_values[fast_frames - 1]
+    intensity_error = np.abs(fast_values - ref_at_fast)
+
+    # RR delta: same window length in seconds, each path at its own sampling rate.
+    ref_rr = rr_series(ref_values, fps)
+    fast_rr = rr_series(fast_values, fps / config.frame_step)
+    n = min(len(ref_rr), len(fast_rr))
+    rr_error = np.abs(np.asarray(ref_rr[:n], dtype=float) - np.asarray(fast_rr[:n], dtype=float))
+    rr_error = rr_error[~np.isnan(rr_error)]
+
+    return {
+        "config": config,
+        "frames": len(ref_frames),
+        "analysed_frames": len(fast_frames),
+        "full_rate_s": ref_elapsed,
+        "fast_s": fast_elapsed,
+        "speedup": ref_elapsed / max(fast_elapsed, 1e-9),
+        "intensity_mae": float(np.mean(intensity_error)) if len(intensity_error) else float("nan"),
+        "intensity_max_error": float(np.max(intensity_error)) if len(intensity_error) else float("nan"),
+        "rr_mae": float(np.mean(rr_error)) if len(rr_error) else float("nan"),
+        "rr_max_error": float(np.max(rr_error)) if len(rr_error) else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a fast extraction configuration against the full-rate path.")
+    parser.add_argument("video", help="Recorded video to analyse.")
+    parser.add_argument("--roi", type=int, nargs=4, metavar=("X", "Y", "W", "H"), required=True)
+    parser.add_argument("--frame-step", type=int, default=1, help="Analyse every Nth frame.")
+    parser.add_argument("--pyramid", type=int, default=0, help="ROI downscale level (stride 2**level).")
+    parser.add_argument("--exact-gray", action="store_true", help="Use cvtColor + np.mean instead of the luma shortcut.")
+    args = parser.parse_args()
+
+    config = ExtractionConfig(args.frame_step, args.pyramid, luma_only=not args.exact_gray)
+    report = compare_to_full_rate(args.video, tuple(args.roi), config)
+    print(f"Configuration: {report['config']}")
+    print(f"Frames analysed: {report['analysed_frames']} of {report['frames']}")
+    print(f"Time: full-rate {report['full_rate_s']:.2f} s, fast {report['fast_s']:.2f} s "
+          f"({report['speedup']:.1f}x)")
+    print(f"Intensity delta: mean {report['intensity_mae']:.4f}, max {report['intensity_max_error']:.4f}")
+    print(f"RR delta: mean {report['rr_mae']:.2f} BPM, max {report['rr_max_error']:.2f} BPM")
+
+
+if __name__ == "__main__":
+    main()
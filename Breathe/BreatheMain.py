@@ -1,27 +1,58 @@
 import cv2
-import numpy as np
-import time
-from collections import deque
-import matplotlib.pyplot as plt
 import sys
 import threading
+from datetime import datetime
+
+from BreatheExtract import MultiRoiExtractor
+from BreathePeaks import BreathDetector
+from BreathePipeline import Pipeline
+from BreatheSpectral import SlidingSpectrumEstimator
+from BreatheTrace import TraceReader, TraceWriter, plot_trace
 
 # Define a non-blocking (asynchronous) beep function.
-def beep_async():
+def beep_async(frequency=1000):
     if sys.platform.startswith('win'):
         import winsound
         # Use winsound.Beep; note that we are now calling this in a separate thread.
-        winsound.Beep(1000, 100)  # 1000 Hz for 100 ms
+        winsound.Beep(frequency, 100)  # e.g. 1000 Hz for 100 ms
     else:
         # For non-Windows platforms, simply print the bell character.
         print("\a")
 
-def beep():
+def beep(frequency=1000):
     # Launch beep_async in a separate thread so it doesn't block the main loop.
-    t = threading.Thread(target=beep_async)
+    t = threading.Thread(target=beep_async, args=(frequency,))
     t.daemon = True
     t.start()
 
+
+class RoiTrack:
+    """Per-ROI analysis state: RR estimator and breath detector."""
+    def __init__(self, index, roi, fps, buffer_duration, min_beep_interval):
+        self.index = index
+        self.roi = roi
+        # Sliding-DFT estimator: a fresh RR every frame at constant cost. Zero-padding plus
+        # peak interpolation resolves well below the 1/buffer_duration Hz bin spacing.
+        self.rr_estimator = SlidingSpectrumEstimator(fps, window_s=buffer_duration, zero_pad=4, interpolate=True)
+        self.computed_rr = None
+        # Each subject beeps at its own pitch so they can be told apart.
+        self.beep_frequency = 1000 + 200 * index
+        # Adaptive-threshold detector clocked by video time; every breath event beeps.
+        self.breath_detector = BreathDetector(fps, sink=self.on_breath, roi=index,
+                                              refractory_s=min_beep_interval)
+
+    def on_breath(self, event):
+        beep(self.beep_frequency)  # This call is asynchronous.
+
+    def update(self, avg_intensity, time_s, frame_number):
+        # -------- RR Estimation --------
+        self.computed_rr = self.rr_estimator.update(avg_intensity)
+
+        # -------- Peak Detection for Audible Beat --------
+        self.breath_detector.update(avg_intensity, time_s, frame_number)
+        return self.computed_rr
+
+
 def main():
     # ================================
     # Video Source Setup:
@@ -48,131 +79,114 @@ def main():
         fps = 60.0
     print("FPS:", fps)
 
-    # ================================
-    # Rolling Buffer and Data Storage:
-    # ================================
-    buffer_duration = 5  # seconds for the rolling buffer
-    buffer_size = int(fps * buffer_duration)
-    intensity_buffer = deque(maxlen=buffer_size)
-    all_intensities = []  # Save average intensity for all frames
-    rr_values = []        # Save computed RR values (one per update)
-
     # ================================
     # ROI Selection:
     # ================================
-    # Read a frame to let the user select the ROI.
+    # Read a frame to let the user select one ROI per subject
+    # (ENTER/SPACE after each box, ESC when done).
     ret, first_frame = cap.read()
     if not ret:
         print("Error: Could not read first frame.")
         return
-    roi = cv2.selectROI("Select ROI", first_frame, showCrosshair=True, fromCenter=False)
-    cv2.destroyWindow("Select ROI")
-    roi_x, roi_y, roi_w, roi_h = [int(v) for v in roi]
+    rois = cv2.selectROIs("Select ROIs", first_frame, showCrosshair=True, fromCenter=False)
+    cv2.destroyWindow("Select ROIs")
+    rois = [tuple(int(v) for v in roi) for roi in rois if roi[2] > 0 and roi[3] > 0]
+    if not rois:
+        print("Error: No ROI selected.")
+        return
 
     # For recorded video, reset the video to the start.
     if not live_feed:
         cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
 
     # ================================
-    # Peak Detection Setup:
+    # Rolling Buffer and Data Storage:
     # ================================
-    peak_window = deque(maxlen=3)
-    min_beep_interval = 0.3  # Minimum seconds between beeps
-    last_beep_time = 0
+    buffer_duration = 5      # seconds for the rolling buffer
+    min_beep_interval = 0.3  # Minimum seconds (video time) between beeps
+    tracks = [RoiTrack(i, roi, fps, buffer_duration, min_beep_interval) for i, roi in enumerate(rois)]
+    # All ROI means come from one integral image per frame.
+    extractor = MultiRoiExtractor(rois)
+    # Every frame's intensity and RR go straight to disk instead of growing lists,
+    # so long live sessions keep constant memory and survive a crash.
+    trace_path = f"breathe_{datetime.now().strftime('%y%m%d_%H%M%S')}.trace"
+    trace = TraceWriter(trace_path, {"source": str(video_source), "fps": fps, "rois": rois})
+    print("Saving trace to:", trace_path)
 
     # ================================
-    # Processing Loop:
+    # Analysis Stage (runs on the pipeline's worker thread):
     # ================================
-    current_frame = 0
-    last_rr_update_time = time.time()
-    computed_rr = None
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        current_frame += 1
+    def analyze(packet):
+        # Live cameras may not report a position; fall back to the nominal frame time.
+        time_s = packet.video_msec / 1000.0 if packet.video_msec > 0 else packet.frame_number / fps
 
         # -------- ROI Processing --------
-        roi_frame = frame[roi_y:roi_y+roi_h, roi_x:roi_x+roi_w]
-        gray_roi = cv2.cvtColor(roi_frame, cv2.COLOR_BGR2GRAY)
-        avg_intensity = np.mean(gray_roi)
+        intensities = extractor(packet.frame)
+        rr = [track.update(value, time_s, packet.frame_number)
+              for track, value in zip(tracks, intensities)]
 
-        # Save intensity for the rolling buffer and later plotting.
-        intensity_buffer.append(avg_intensity)
-        all_intensities.append(avg_intensity)
+        # -------- Save to Trace --------
+        trace.append_many(packet.frame_number, time_s, intensities, rr)
+        return rr
 
-        # -------- Peak Detection for Audible Beat --------
-        peak_window.append(avg_intensity)
-        if len(peak_window) == 3:
-            a, b, c = peak_window[0], peak_window[1], peak_window[2]
-            # Check for a local peak.
-            peak_threshold = 0.01  # Adjust this value based on your signal scale.
-            if b > a and b > c and (b - a) > peak_threshold and (b - c) > peak_threshold:
-                if time.time() - last_beep_time >= min_beep_interval:
-                    beep()  # This call is now asynchronous.
-                    last_beep_time = time.time()
-
-        # -------- Update RR every 1 second --------
-        current_time = time.time()
-        if (current_time - last_rr_update_time >= 1.0) and (len(intensity_buffer) >= buffer_size // 2):
-            signal = np.array(intensity_buffer, dtype=np.float32)
-            signal -= np.mean(signal)
-            fft_result = np.fft.rfft(signal)
-            freqs = np.fft.rfftfreq(len(signal), d=1.0/fps)
-            magnitudes = np.abs(fft_result)
-            min_f = 1.0
-            max_f = 4.0
-            valid_idx = np.where((freqs >= min_f) & (freqs <= max_f))[0]
-            if len(valid_idx) > 0:
-                max_idx = valid_idx[np.argmax(magnitudes[valid_idx])]
-                dominant_freq = freqs[max_idx]
-                computed_rr = dominant_freq * 60.0  # Convert Hz to BPM.
-                rr_values.append(computed_rr)
+    # ================================
+    # Display Stage (main thread):
+    # ================================
+    # Capture and analysis run on their own threads; frames that the display cannot
+    # keep up with are dropped here, never in the analysis stage.
+    pipeline = Pipeline(cap, analyze).start()
+    for packet in pipeline.frames():
+        if packet is not None:
+            frame = packet.frame
+
+            # -------- Overlay Information on Frame --------
+            if live_feed:
+                count_text = f"Frame: {packet.frame_number}"
             else:
-                computed_rr = None
-            last_rr_update_time = current_time
-
-        # -------- Overlay Information on Frame --------
-        if live_feed:
-            count_text = f"Frame: {current_frame}"
-        else:
-            count_text = f"Frame: {current_frame}/{total_frames}"
-        cv2.putText(frame, count_text, (10, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
-        if computed_rr is not None:
-            rr_text = f"RR: {computed_rr:.0f} BPM"
-        else:
-            rr_text = "RR: calculating..."
-        cv2.putText(frame, rr_text, (10, 80),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        cv2.rectangle(frame, (roi_x, roi_y), (roi_x + roi_w, roi_y + roi_h), (0, 255, 0), 2)
-
-        cv2.imshow("Video Playback", frame)
+                count_text = f"Frame: {packet.frame_number}/{total_frames}"
+            cv2.putText(frame, count_text, (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
+            for track, rr in zip(tracks, packet.result):
+                if rr is not None:
+                    rr_text = f"#{track.index + 1} RR: {rr:.0f} BPM"
+                else:
+                    rr_text = f"#{track.index + 1} RR: calculating..."
+                cv2.putText(frame, rr_text, (10, 80 + 40 * track.index),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+                roi_x, roi_y, roi_w, roi_h = track.roi
+                cv2.rectangle(frame, (roi_x, roi_y), (roi_x + roi_w, roi_y + roi_h), (0, 255, 0), 2)
+                cv2.putText(frame, f"#{track.index + 1}", (roi_x + 4, roi_y + 24),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+
+            cv2.imshow("Video Playback", frame)
         key = cv2.waitKey(1)
         if key == 27 or key == ord('q'):
             break
 
+    pipeline.stop()
+    trace.close()
     cap.release()
     cv2.destroyAllWindows()
+    print(pipeline.report())
 
     # -------------------------------
     # After Loop: Plot and Report
     # -------------------------------
-    if all_intensities:
-        plt.figure(figsize=(10, 4))
-        plt.plot(all_intensities, label="Avg Intensity")
-        plt.xlabel("Frame")
-        plt.ylabel("Average Intensity")
-        plt.title("Average Intensity Over Time")
-        plt.legend()
-        plt.show()
-
-    if rr_values:
-        avg_rr = np.mean(rr_values)
-        print("Average RR over run: {:.1f} BPM".format(avg_rr))
-    else:
-        print("No RR values computed.")
+    # The trace is read back memory-mapped, so this works for sessions of any length.
+    reader = TraceReader(trace_path)
+    if len(reader):
+        plot_trace(trace_path)
+
+    for track in tracks:
+        avg_rr = reader.nanmean("rr", track.index)
+        if avg_rr is not None:
+            print("#{} Average RR over run: {:.1f} BPM".format(track.index + 1, avg_rr))
+        else:
+            print("#{} No RR values computed.".format(track.index + 1))
+        detector = track.breath_detector
+        if detector.events:
+            print("#{} Breaths detected: {} (mean detection latency {:.0f} ms)".format(
+                track.index + 1, detector.events, 1000.0 * detector.mean_latency_s))
 
 if __name__ == "__main__":
     main()
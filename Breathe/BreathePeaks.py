@@ -0,0 +1,123 @@
+import math
+import time
+from collections import namedtuple
+
+# time_s / frame: video time and frame number of the detected peak.
+# detected_time_s: video time of the sample at which the peak was confirmed.
+# latency_s: detected_time_s - time_s, i.e. how far behind the peak the event fires.
+# detected_at: time.perf_counter() when the event was emitted (for end-to-end latency).
+BreathEvent = namedtuple("BreathEvent", "roi frame time_s detected_time_s latency_s amplitude detected_at")
+
+
+class BreathDetector:
+    """
+    Streaming breath (peak) detector, O(1) per sample and clocked by video time.
+
+    The signal is smoothed with a short EMA and detrended by a slow EMA baseline.
+    A slow EMA of the absolute deviation tracks the breathing amplitude, so the
+    threshold is relative (in units of that amplitude) and works at any signal
+    scale or frame rate. A peak is confirmed once the smoothed signal has risen
+    above `threshold` and then fallen `hysteresis` below its running maximum; the
+    detector re-arms once the signal drops back under the baseline, and peaks within
+    the refractory period (video seconds) of the previous event are suppressed.
+
+    Events go to `sink`, which may be a callable or anything with put_nowait()
+    (e.g. a queue.Queue).
+    """
+    def __init__(self, fps, sink=None, roi=0, smoothing_s=0.15, baseline_s=6.0,
+                 threshold=0.5, hysteresis=0.3, refractory_s=0.3, warmup_s=1.0):
+        self.fps = float(fps)
+        self.sink = sink
+        self.roi = roi
+        self.smoothing_s = smoothing_s
+        self.baseline_s = baseline_s
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.refractory_s = refractory_s
+        self.warmup_s = warmup_s
+        self.reset()
+
+    def reset(self):
+        self._start_time = None
+        self._last_time = None
+        self._smoothed = None
+        self._baseline = None
+        self._amplitude = 0.0
+        self._armed = False  # first arms on a dip below baseline, so a half-seen peak is skipped
+        self._in_peak = False
+        self._peak_value = -math.inf
+        self._peak_time = None
+        self._peak_frame = None
+        self._last_event_time = -math.inf
+        self.events = 0
+        self.latency_sum = 0.0
+
+    @staticmethod
+    def _alpha(dt, tau):
+        return 1.0 - math.exp(-dt / tau) if tau > 0 else 1.0
+
+    def update(self, value, time_s, frame=None):
+        """Feeds one sample at video time time_s (seconds). Returns a BreathEvent or None."""
+        value = float(value)
+        if self._smoothed is None:
+            self._smoothed = self._baseline = value
+            self._start_time = self._last_time = time_s
+            return None
+
+        # Variable dt keeps the filters right when frames are skipped or fps drifts.
+        dt = time_s - self._last_time
+        if dt <= 0:
+            dt = 1.0 / self.fps
+        self._last_time = time_s
+        self._smoothed += self._alpha(dt, self.smoothing_s) * (value - self._smoothed)
+        slow = self._alpha(dt, self.baseline_s)
+        self._baseline += slow * (self._smoothed - self._baseline)
+        deviation = self._smoothed - self._baseline
+        self._amplitude += slow * (abs(deviation) - self._amplitude)
+        # Until the amplitude estimate has settled, any wiggle would look like a breath.
+        if self._amplitude <= 1e-12 or time_s - self._start_time < self.warmup_s:
+            return None
+        level = deviation / self._amplitude
+
+        if not self._armed:
+            if level < 0:
+                self._armed = True
+            return None
+
+        if not self._in_peak:
+            if level > self.threshold:
+                self._in_peak = True
+                self._peak_value = level
+                self._peak_time, self._peak_frame = time_s, frame
+            return None
+
+        if level > self._peak_value:
+            self._peak_value = level
+            self._peak_time, self._peak_frame = time_s, frame
+            return None
+        if level < self._peak_value - self.hysteresis:
+            self._in_peak = False
+            self._armed = False
+            if self._peak_time - self._last_event_time < self.refractory_s:
+                return None  # too close to the previous breath: treat as the same one
+            return self._emit(time_s)
+        return None
+
+    def _emit(self, time_s):
+        event = BreathEvent(self.roi, self._peak_frame, self._peak_time, time_s,
+                            time_s - self._peak_time, self._peak_value * self._amplitude,
+                            time.perf_counter())
+        self._last_event_time = self._peak_time
+        self.events += 1
+        self.latency_sum += event.latency_s
+        if self.sink is not None:
+            if hasattr(self.sink, "put_nowait"):
+                self.sink.put_nowait(event)
+            else:
+                self.sink(event)
+        return event
+
+    @property
+    def mean_latency_s(self):
+        """Mean delay (video seconds) between a peak and the sample that confirmed it."""
+        return self.latency_sum / self.events if self.events else None
@@ -0,0 +1,187 @@
+import queue
+import threading
+import time
+
+import cv2
+
+
+class StageStats:
+    """Per-stage counters: items handled, busy time, end-to-end latency and drops."""
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.dropped = 0
+        self.busy_time = 0.0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, busy, latency):
+        with self._lock:
+            self.count += 1
+            self.busy_time += busy
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def record_drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = max(time.perf_counter() - self.started, 1e-9)
+            count = max(self.count, 1)
+            return {
+                "stage": self.name,
+                "count": self.count,
+                "dropped": self.dropped,
+                "throughput": self.count / elapsed,        # items per second
+                "busy_ms": 1000.0 * self.busy_time / count,  # mean time spent inside the stage
+                "latency_ms": 1000.0 * self.latency_sum / count,  # mean capture-to-stage-exit latency
+                "latency_max_ms": 1000.0 * self.latency_max,
+            }
+
+    def __str__(self):
+        s = self.snapshot()
+        return (f"{s['stage']:<8} {s['count']:>7} items  {s['throughput']:7.1f}/s  "
+                f"busy {s['busy_ms']:6.2f} ms  latency {s['latency_ms']:7.2f} ms "
+                f"(max {s['latency_max_ms']:.1f})  dropped {s['dropped']}")
+
+
+class FramePacket:
+    """One captured frame travelling through the pipeline."""
+    __slots__ = ("frame_number", "video_msec", "captured_at", "frame", "result")
+
+    def __init__(self, frame_number, video_msec, captured_at, frame):
+        self.frame_number = frame_number
+        self.video_msec = video_msec
+        self.captured_at = captured_at
+        self.frame = frame
+        self.result = None
+
+
+# Marks the end of the stream; never dropped.
+_END = object()
+
+
+def put_drop_oldest(q, item, stats=None):
+    """Puts item into a bounded queue, discarding the oldest queued item when it is full."""
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+                if stats is not None:
+                    stats.record_drop()
+            except queue.Empty:
+                pass
+
+
+class Pipeline:
+    """
+    Staged capture -> analysis -> display pipeline.
+
+    The capture and analysis stages run on their own threads; the display stage is
+    consumed on the caller's thread through frames(), since OpenCV's HighGUI must stay
+    on the main thread. The analysis queue is blocking so every captured frame is
+    analysed; the display queue drops the oldest frame, so slow rendering never
+    delays analysis.
+
+    analyze(packet) is called on the analysis thread for every frame and its return
+    value is attached to the packet as packet.result.
+    """
+    def __init__(self, cap, analyze, analysis_queue_size=32, display_queue_size=2):
+        self.cap = cap
+        self.analyze = analyze
+        self.analysis_queue = queue.Queue(maxsize=analysis_queue_size)
+        self.display_queue = queue.Queue(maxsize=display_queue_size)
+        self.stop_event = threading.Event()
+        self.stats = {name: StageStats(name) for name in ("capture", "analysis", "display")}
+        self.threads = [
+            threading.Thread(target=self._capture_loop, name="breathe-capture", daemon=True),
+            threading.Thread(target=self._analysis_loop, name="breathe-analysis", daemon=True),
+        ]
+
+    def start(self):
+        for t in self.threads:
+            t.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        # Unblock a producer waiting on a full queue.
+        for q in (self.analysis_queue, self.display_queue):
+            try:
+                while True:
+                    q.get_nowait()
+            except queue.Empty:
+                pass
+        for t in self.threads:
+            t.join(timeout=2.0)
+
+    def _put(self, q, item):
+        """Blocking put that still notices stop()."""
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _capture_loop(self):
+        stats = self.stats["capture"]
+        frame_number = 0
+        while not self.stop_event.is_set():
+            t0 = time.perf_counter()
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            frame_number += 1
+            t1 = time.perf_counter()
+            packet = FramePacket(frame_number, self.cap.get(cv2.CAP_PROP_POS_MSEC), t1, frame)
+            stats.record(t1 - t0, t1 - t0)
+            if not self._put(self.analysis_queue, packet):
+                return
+        self._put(self.analysis_queue, _END)
+
+    def _analysis_loop(self):
+        stats = self.stats["analysis"]
+        while not self.stop_event.is_set():
+            try:
+                packet = self.analysis_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if packet is _END:
+                put_drop_oldest(self.display_queue, _END, self.stats["display"])
+                return
+            t0 = time.perf_counter()
+            packet.result = self.analyze(packet)
+            t1 = time.perf_counter()
+            stats.record(t1 - t0, t1 - packet.captured_at)
+            put_drop_oldest(self.display_queue, packet, self.stats["display"])
+
+    def frames(self, timeout=0.05):
+        """
+        Yields analysed packets on the calling thread until the stream ends or stop()
+        is called. Yields None when nothing new arrived within timeout, so the caller
+        can keep its event loop (e.g. cv2.waitKey) responsive.
+        """
+        while not self.stop_event.is_set():
+            try:
+                packet = self.display_queue.get(timeout=timeout)
+            except queue.Empty:
+                yield None
+                continue
+            if packet is _END:
+                return
+            t0 = time.perf_counter()
+            yield packet
+            t1 = time.perf_counter()
+            self.stats["display"].record(t1 - t0, t1 - packet.captured_at)
+
+    def report(self):
+        return "\n".join(str(s) for s in self.stats.values())
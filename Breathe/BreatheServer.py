@@ -0,0 +1,335 @@
+import argparse
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+
+from BreatheAnalysis import MIN_FREQ, MAX_FREQ, estimate_rr
+from BreatheExtract import MultiRoiExtractor
+from BreathePeaks import BreathDetector
+
+BUFFER_DURATION = 5      # seconds for the rolling buffer
+RR_UPDATE_INTERVAL = 1.0  # seconds between RR updates
+RECONNECT_DELAY = 2.0     # seconds before reopening a failed source
+SUBSCRIBER_QUEUE_SIZE = 256
+SAMPLE_QUEUE_SIZE = 1024  # samples between the capture thread and the analysis loop
+HANDOFF_POLL = 0.5        # seconds between stop checks while a recorded file waits for the loop
+LIVE_PREFIXES = ("rtsp:", "http:", "https:")
+
+
+def estimate_rr_windows(windows, fps, min_f=MIN_FREQ, max_f=MAX_FREQ):
+    """Process-pool task: RR of each ROI's window (rows of a 2-D array)."""
+    return [estimate_rr(window, fps, min_f, max_f) for window in windows]
+
+
+class Publisher:
+    """Fans messages out to subscriber queues; a slow subscriber loses its oldest messages."""
+    def __init__(self):
+        self.subscribers = set()
+
+    def subscribe(self):
+        q = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        self.subscribers.discard(q)
+
+    def publish(self, message):
+        for q in self.subscribers:
+            if q.full():
+                q.get_nowait()
+            q.put_nowait(message)
+
+
+class StreamWorker:
+    """
+    One video source. Capture and ROI extraction run in an executor thread (the
+    blocking cap.read() never touches the event loop); samples are handed to the
+    loop, where breath detection runs per sample and RR estimation is dispatched to
+    the shared process pool once per second.
+    """
+    def __init__(self, name, source, rois, publisher, thread_pool, process_pool):
+        self.name = name
+        self.source = source
+        self.rois = [tuple(int(v) for v in roi) for roi in rois]
+        # Live sources (cameras, network streams) drop their oldest samples when analysis
+        # falls behind; recorded files wait instead, so every frame is analysed.
+        self.live = not isinstance(source, str) or source.startswith(LIVE_PREFIXES)
+        self.publisher = publisher
+        self.thread_pool = thread_pool
+        self.process_pool = process_pool
+        self.stop_event = threading.Event()
+        self.samples = None  # asyncio.Queue, created on the loop in run()
+
+        self.status = "starting"
+        self.error = None
+        self.fps = None
+        self.frames = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self.last_capture_at = None
+        self.lag = 0.0         # seconds from capture to analysis of the latest sample
+        self.rr_latency = 0.0  # seconds spent in the process pool for the latest RR update
+        self.rr = [None] * len(self.rois)
+        self._rate_window = deque(maxlen=120)
+
+    # -------- Capture thread --------
+    def _capture_loop(self, loop):
+        cap = None
+        try:
+            while not self.stop_event.is_set():
+                cap = cv2.VideoCapture(self.source)
+                if not cap.isOpened():
+                    self.status = "reconnecting"
+                    self.stop_event.wait(RECONNECT_DELAY)
+                    self.reconnects += 1
+                    continue
+                fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+                extractor = MultiRoiExtractor(self.rois)
+                self.status = "running"
+                frame_number = 0
+                while not self.stop_event.is_set():
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    frame_number += 1
+                    msec = cap.get(cv2.CAP_PROP_POS_MSEC)
+                    time_s = msec / 1000.0 if msec > 0 else frame_number / fps
+                    sample = (frame_number, time_s, fps, time.monotonic(), extractor(frame))
+                    if self.live:
+                        loop.call_soon_threadsafe(self._enqueue, sample)
+                    elif not self._put_blocking(loop, sample):
+                        break  # stopped while waiting
+                cap.release()
+                if not self.live:
+                    self.status = "finished"  # recorded file: do not loop
+                    break
+                self.status = "reconnecting"
+                self.reconnects += 1
+                self.stop_event.wait(RECONNECT_DELAY)
+        except Exception as e:  # e.g. an ROI outside the frame: stop this stream, keep the server up
+            self.status = "error"
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"Stream {self.name} stopped: {self.error}")
+        finally:
+            if cap is not None:
+                cap.release()
+            # Always wake run() so it can finish: a recorded file hands the end over like
+            # its samples; otherwise (or once stopped) the end evicts the oldest sample.
+            if self.live or not self._put_blocking(loop, None):
+                loop.call_soon_threadsafe(self._enqueue, None)
+
+    def _put_blocking(self, loop, sample):
+        """Waits until the loop has room for the sample; False if the stream was stopped first."""
+        future = asyncio.run_coroutine_threadsafe(self.samples.put(sample), loop)
+        while True:
+            try:
+                future.result(HANDOFF_POLL)
+                return True
+            except FutureTimeout:
+                if self.stop_event.is_set():
+                    future.cancel()
+                    return False
+
+    def _enqueue(self, sample):
+        """Drop-oldest hand-off (live sources and the end-of-stream sentinel)."""
+        if self.samples.full():
+            self.samples.get_nowait()
+            self.dropped += 1
+        self.samples.put_nowait(sample)
+
+    # -------- Analysis on the event loop --------
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.samples = asyncio.Queue(maxsize=SAMPLE_QUEUE_SIZE)
+        capture = loop.run_in_executor(self.thread_pool, self._capture_loop, loop)
+
+        buffers = None
+        detectors = None
+        rr_task = None
+        next_rr_time = None
+        while True:
+            sample = await self.samples.get()
+            if sample is None:
+                break
+            frame_number, time_s, fps, captured_at, intensities = sample
+            if buffers is None or self.fps != fps:
+                self.fps = fps
+                buffers = [deque(maxlen=int(fps * BUFFER_DURATION)) for _ in self.rois]
+                detectors = [BreathDetector(fps, sink=self._on_breath, roi=i) for i in range(len(self.rois))]
+                next_rr_time = time_s + RR_UPDATE_INTERVAL
+
+            self.frames += 1
+            self.last_capture_at = captured_at
+            self._rate_window.append(captured_at)
+            for buffer, detector, value in zip(buffers, detectors, intensities):
+                buffer.append(value)
+                detector.update(value, time_s, frame_number)
+            self.lag = time.monotonic() - captured_at
+
+            # At most one RR job in flight per stream; a busy pool delays, never queues up.
+            if time_s >= next_rr_time and len(buffers[0]) >= buffers[0].maxlen // 2 \
+                    and (rr_task is None or rr_task.done()):
+                next_rr_time = time_s + RR_UPDATE_INTERVAL
+                windows = np.array([list(b) for b in buffers], dtype=np.float32)
+                rr_task = asyncio.ensure_future(self._update_rr(loop, windows, fps, time_s))
+
+        await capture
+        if rr_task is not None:
+            await rr_task
+
+    async def _update_rr(self, loop, windows, fps, time_s):
+        start = time.monotonic()
+        rr_values = await loop.run_in_executor(self.process_pool, estimate_rr_windows, windows, fps)
+        self.rr_latency = time.monotonic() - start
+        self.rr = rr_values
+        for roi, rr in enumerate(rr_values):
+            self.publisher.publish({"type": "rr", "stream": self.name, "roi": roi,
+                                    "time_s": round(time_s, 3), "rr": None if rr is None else round(rr, 2)})
+
+    def _on_breath(self, event):
+        self.publisher.publish({"type": "breath", "stream": self.name, "roi": event.roi,
+                                "frame": event.frame, "time_s": round(event.time_s, 3),
+                                "latency_s": round(event.latency_s, 3)})
+
+    def stop(self):
+        self.stop_event.set()
+
+    def metrics(self):
+        rate = None
+        if len(self._rate_window) >= 2:
+            span = self._rate_window[-1] - self._rate_window[0]
+            rate = (len(self._rate_window) - 1) / span if span > 0 else None
+        return {
+            "name": self.name,
+            "source": str(self.source),
+            "status": self.status,
+            "error": self.error,
+            "rois": self.rois,
+            "source_fps": self.fps,
+            "measured_fps": rate,
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "reconnects": self.reconnects,
+            "lag_ms": 1000.0 * self.lag,
+            "rr_latency_ms": 1000.0 * self.rr_latency,
+            "last_frame_age_s": None if self.last_capture_at is None else time.monotonic() - self.last_capture_at,
+            "rr": self.rr,
+        }
+
+
+# ================================
+# HTTP Endpoint:
+# ================================
+class BreatheServer:
+    """
+    GET /health            per-stream status, fps, lag and latest RR (JSON)
+    GET /events[?stream=]  Server-Sent Events stream of RR updates and breath events
+    """
+    def __init__(self, streams, host="127.0.0.1", port=8765):
+        self.host = host
+        self.port = port
+        self.publisher = Publisher()
+        self.thread_pool = ThreadPoolExecutor(max_workers=max(1, len(streams)))
+        self.process_pool = ProcessPoolExecutor()
+        self.workers = [StreamWorker(s["name"], s["source"], s["rois"], self.publisher,
+                                     self.thread_pool, self.process_pool) for s in streams]
+
+    async def serve(self):
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"Serving {len(self.workers)} stream(s) on http://{self.host}:{self.port}")
+        tasks = [asyncio.ensure_future(w.run()) for w in self.workers]
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for w in self.workers:
+                w.stop()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.thread_pool.shutdown(wait=False)
+            self.process_pool.shutdown(wait=False)
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass  # headers are not needed
+            parts = request_line.decode("latin-1").split()
+            if len(parts) < 2 or parts[0] != "GET":
+                await self._respond(writer, 405, {"error": "only GET is supported"})
+                return
+            url = urlsplit(parts[1])
+            if url.path == "/health":
+                await self._respond(writer, 200, {"streams": [w.metrics() for w in self.workers]})
+            elif url.path == "/events":
+                stream = parse_qs(url.query).get("stream", [None])[0]
+                await self._stream_events(writer, stream)
+            else:
+                await self._respond(writer, 404, {"error": "not found"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        reason = {200: "OK", 404: "Not Found", 405: "Method Not Allowed"}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+    async def _stream_events(self, writer, stream):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        await writer.drain()
+        q = self.publisher.subscribe()
+        try:
+            while True:
+                message = await q.get()
+                if stream is not None and message["stream"] != stream:
+                    continue
+                writer.write(f"event: {message['type']}\ndata: {json.dumps(message)}\n\n".encode("utf-8"))
+                await writer.drain()
+        finally:
+            self.publisher.unsubscribe(q)
+
+
+def load_config(path):
+    """
+    {"host": "127.0.0.1", "port": 8765,
+     "streams": [{"name": "bed1", "source": 0, "rois": [[x, y, w, h], ...]}, ...]}
+    An integer source is a local camera index; a string is a file path or stream URL.
+    """
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    for stream in config["streams"]:
+        if not stream.get("rois"):
+            raise ValueError(f"Stream {stream.get('name')!r} has no ROIs.")
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve live RR and breath events for several video sources.")
+    parser.add_argument("config", help="JSON file listing the streams and their ROIs.")
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=None)
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    server = BreatheServer(config["streams"], args.host or config.get("host", "127.0.0.1"),
+                           args.port or config.get("port", 8765))
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
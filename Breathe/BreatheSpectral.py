@@ -0,0 +1,99 @@
+import numpy as np
+
+from BreatheAnalysis import MIN_FREQ, MAX_FREQ
+
+
+class SlidingSpectrumEstimator:
+    """
+    Incremental RR estimator over a rolling window of the last window_s seconds.
+
+    Instead of re-running a full rfft over a copy of the buffer, it keeps a
+    preallocated ring buffer, a running sum for demeaning, and a sliding DFT of
+    only the bins inside [min_f, max_f]. Each new sample updates those bins in
+    O(K) (K = number of band bins), independent of the window length:
+
+        X'(w) = e^{jw} * (X(w) - x_oldest) + x_newest * e^{-jw(N-1)}
+
+    zero_pad > 1 evaluates the band on a zero_pad-times denser frequency grid (the
+    spectrum of the window zero-padded to zero_pad * N samples); interpolate=True
+    refines the peak with a parabola through the three bins around the maximum.
+    """
+    def __init__(self, fps, window_s=5.0, min_f=MIN_FREQ, max_f=MAX_FREQ,
+                 zero_pad=1, interpolate=False, min_fill=0.5):
+        self.fps = float(fps)
+        self.size = int(self.fps * window_s)
+        if self.size < 2:
+            raise ValueError("Window must hold at least two samples.")
+        self.min_count = max(1, int(self.size * min_fill))
+        self.interpolate = interpolate
+
+        # Band bins on the (optionally zero-padded) DFT grid, same spacing as rfftfreq.
+        self.bin_width = self.fps / (self.size * zero_pad)
+        first_bin = int(np.ceil(min_f / self.bin_width))
+        last_bin = int(np.floor(max_f / self.bin_width))
+        self.freqs = np.arange(first_bin, last_bin + 1) * self.bin_width
+        omega = 2.0 * np.pi * self.freqs / self.fps
+        self._shift = np.exp(1j * omega)                    # moves every sample one slot older
+        self._newest = np.exp(-1j * omega * (self.size - 1))  # weight of the newest slot
+        # Per-slot weights, only used to resynchronise the recursion (see _resync).
+        self._basis = np.exp(-1j * np.outer(np.arange(self.size), omega))
+
+        self.reset()
+
+    def reset(self):
+        self._ring = np.zeros(self.size, dtype=np.float64)
+        self._pos = 0          # next ring slot to overwrite (= oldest sample when full)
+        self.count = 0
+        self._sum = 0.0
+        self._spectrum = np.zeros(len(self.freqs), dtype=np.complex128)
+        # DFT of a window whose filled slots are all 1.0; mean * this is the DC part to remove.
+        self._ones_spectrum = np.zeros(len(self.freqs), dtype=np.complex128)
+        self._since_resync = 0
+        self.rr = None
+
+    def update(self, sample):
+        """Adds one sample and returns the current RR (BPM), or None while the window is filling."""
+        sample = float(sample)
+        oldest = self._ring[self._pos]
+        self._ring[self._pos] = sample
+        self._pos = (self._pos + 1) % self.size
+
+        if self.count < self.size:
+            # Filled slots sit at the newest end of the window: N-count .. N-1.
+            self.count += 1
+            self._ones_spectrum = self._shift * self._ones_spectrum + self._newest
+            self._spectrum = self._shift * self._spectrum + sample * self._newest
+            self._sum += sample
+        else:
+            self._spectrum = self._shift * (self._spectrum - oldest) + sample * self._newest
+            self._sum += sample - oldest
+
+        # The recursion accumulates rounding error; recompute exactly once per window
+        # length, which keeps the amortised cost O(K) per sample.
+        self._since_resync += 1
+        if self._since_resync >= self.size:
+            self._resync()
+
+        if self.count < self.min_count or len(self.freqs) == 0:
+            self.rr = None
+        else:
+            self.rr = self._peak_frequency() * 60.0  # Convert Hz to BPM.
+        return self.rr
+
+    def _resync(self):
+        window = np.roll(self._ring, -self._pos)  # oldest .. newest
+        self._spectrum = window @ self._basis
+        self._sum = float(window[self.size - self.count:].sum())
+        self._since_resync = 0
+
+    def _peak_frequency(self):
+        mean = self._sum / self.count
+        magnitudes = np.abs(self._spectrum - mean * self._ones_spectrum)
+        idx = int(np.argmax(magnitudes))
+        freq = self.freqs[idx]
+        if self.interpolate and 0 < idx < len(magnitudes) - 1:
+            a, b, c = magnitudes[idx - 1], magnitudes[idx], magnitudes[idx + 1]
+            denom = a - 2.0 * b + c
+            if denom < 0:
+                freq += 0.5 * (a - c) / denom * self.bin_width
+        return freq
@@ -0,0 +1,199 @@
+import json
+import os
+import time
+import warnings
+
+import numpy as np
+
+# One record per analysed frame and ROI. RR is NaN until the estimator has an answer.
+TRACE_DTYPE = np.dtype([
+    ("frame", "<i8"),
+    ("time_s", "<f8"),
+    ("roi", "<u2"),
+    ("intensity", "<f4"),
+    ("rr", "<f4"),
+])
+
+
+def meta_path(trace_path):
+    return trace_path + ".json"
+
+
+class TraceWriter:
+    """
+    Append-only on-disk trace store.
+
+    Records are buffered in a small preallocated array and appended to a flat
+    binary file of TRACE_DTYPE records, so memory stays constant however long the
+    session runs. The buffer is flushed every flush_records records or flush_interval
+    seconds, whichever comes first; a crash loses at most that much. A JSON sidecar
+    (<path>.json) holds the record layout plus session metadata such as fps and ROIs.
+    """
+    def __init__(self, path, metadata=None, flush_records=4096, flush_interval=2.0, fsync=False):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._buffer = np.zeros(flush_records, dtype=TRACE_DTYPE)
+        self._count = 0
+        self._last_flush = time.monotonic()
+        self.records_written = 0
+
+        meta = dict(metadata or {})
+        meta["dtype"] = TRACE_DTYPE.descr
+        with open(meta_path(path), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        self._file = open(path, "wb")
+
+    def append(self, frame, time_s, intensity, rr=None, roi=0):
+        row = self._buffer[self._count]
+        row["frame"] = frame
+        row["time_s"] = time_s
+        row["roi"] = roi
+        row["intensity"] = intensity
+        row["rr"] = np.nan if rr is None else rr
+        self._count += 1
+        if self._count == len(self._buffer) or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def append_many(self, frame, time_s, intensities, rrs):
+        """Appends one record per ROI for the same frame."""
+        for roi, (intensity, rr) in enumerate(zip(intensities, rrs)):
+            self.append(frame, time_s, intensity, rr, roi)
+
+    def flush(self):
+        if self._count:
+            self._file.write(self._buffer[:self._count].tobytes())
+            self.records_written += self._count
+            self._count = 0
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TraceReader:
+    """
+    Memory-mapped view of a trace written by TraceWriter. Nothing is loaded until it
+    is sliced, so sessions of any length can be reanalysed chunk by chunk. A partially
+    written last record (e.g. after a crash) is ignored.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(meta_path(path), encoding="utf-8") as f:
+            self.metadata = json.load(f)
+        self.dtype = np.dtype([tuple(field) for field in self.metadata["dtype"]])
+        n_records = os.path.getsize(path) // self.dtype.itemsize
+        if n_records:
+            self.records = np.memmap(path, dtype=self.dtype, mode="r", shape=(n_records,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def fps(self):
+        return self.metadata.get("fps")
+
+    @property
+    def roi_count(self):
+        return len(self.metadata.get("rois", [None]))
+
+    def iter_chunks(self, chunk_records=1 << 20):
+        """Yields consecutive record arrays of at most chunk_records records."""
+        for start in range(0, len(self.records), chunk_records):
+            yield self.records[start:start + chunk_records]
+
+    def column(self, name, roi=0):
+        """Returns one field for one ROI as an in-memory array."""
+        parts = [chunk[name][chunk["roi"] == roi] for chunk in self.iter_chunks()]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=self.dtype[name])
+
+    def downsampled(self, name, roi=0, max_points=20000):
+        """
+        Returns (time_s, values) reduced to about max_points by min/max decimation,
+        chunk by chunk, which keeps breathing peaks visible when plotting a
+        day-long session without loading it.
+        """
+        n_values = len(self.records) // max(self.roi_count, 1)
+        bucket = max(1, int(np.ceil(n_values / max(max_points // 2, 1))))
+        out_times, out_values = [], []
+        carry_times = np.zeros(0)
+        carry_values = np.zeros(0)
+        for chunk in self.iter_chunks():
+            selected = chunk[chunk["roi"] == roi]
+            times = np.concatenate([carry_times, selected["time_s"]])
+            values = np.concatenate([carry_values, selected[name]])
+            if bucket == 1:
+                out_times.append(times)
+                out_values.append(values)
+                continue
+            usable = (len(values) // bucket) * bucket
+            if usable:
+                out_times.append(np.repeat(times[:usable:bucket], 2))
+                out_values.append(_min_max(values[:usable].reshape(-1, bucket)))
+            carry_times, carry_values = times[usable:], values[usable:]
+        if len(carry_values):
+            out_times.append(np.repeat(carry_times[:1], 2))
+            out_values.append(_min_max(carry_values.reshape(1, -1)))
+        if not out_values:
+            return np.zeros(0), np.zeros(0)
+        return np.concatenate(out_times), np.concatenate(out_values)
+
+    def nanmean(self, name, roi=0):
+        """Mean of one field for one ROI, ignoring NaNs, computed chunk by chunk."""
+        total, count = 0.0, 0
+        for chunk in self.iter_chunks():
+            values = chunk[name][chunk["roi"] == roi]
+            values = values[~np.isnan(values)]
+            total += float(values.sum(dtype=np.float64))
+            count += len(values)
+        return total / count if count else None
+
+
+def _min_max(shaped):
+    """Interleaved per-row (min, max) of a 2-D array; all-NaN rows stay NaN."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.column_stack([np.nanmin(shaped, axis=1), np.nanmax(shaped, axis=1)]).ravel()
+
+
+def plot_trace(path, max_points=20000):
+    """Replots intensity and RR of every ROI in a saved trace."""
+    import matplotlib.pyplot as plt
+
+    reader = TraceReader(path)
+    fig, (ax_intensity, ax_rr) = plt.subplots(2, 1, figsize=(10, 6), sharex=True)
+    for roi in range(reader.roi_count):
+        times, values = reader.downsampled("intensity", roi, max_points)
+        ax_intensity.plot(times, values, label=f"#{roi + 1} Avg Intensity")
+        times, values = reader.downsampled("rr", roi, max_points)
+        ax_rr.plot(times, values, label=f"#{roi + 1} RR")
+    ax_intensity.set_ylabel("Average Intensity")
+    ax_intensity.set_title("Average Intensity Over Time")
+    ax_intensity.legend()
+    ax_rr.set_xlabel("Time (s)")
+    ax_rr.set_ylabel("RR (BPM)")
+    ax_rr.legend()
+    plt.show()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replot a saved Breathe trace.")
+    parser.add_argument("trace", help="Path to a .trace file written by TraceWriter.")
+    parser.add_argument("--max-points", type=int, default=20000, help="Points per curve after decimation.")
+    args = parser.parse_args()
+    plot_trace(args.trace, args.max_points)
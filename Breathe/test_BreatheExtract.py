@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from BreatheExtract import ExtractionConfig, MultiRoiExtractor, roi_intensity
+
+ROIS = [(3, 5, 10, 7),   # corners off the stride grid
+        (0, 0, 16, 16),
+        (21, 2, 1, 1),   # narrower than the stride
+        (9, 30, 2, 9),
+        (22, 17, 5, 3)]
+
+
+@pytest.fixture
+def frame():
+    return np.random.default_rng(0).integers(0, 256, size=(48, 64, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("level", [0, 1, 2, 3])
+@pytest.mark.parametrize("luma_only", [True, False])
+def test_matches_single_roi_path(frame, level, luma_only):
+    config = ExtractionConfig(pyramid_level=level, luma_only=luma_only)
+    expected = [roi_intensity(frame, roi, config) for roi in ROIS]
+    np.testing.assert_allclose(MultiRoiExtractor(ROIS, config)(frame), expected, rtol=1e-9)
+
+
+def test_roi_value_does_not_depend_on_the_other_rois(frame):
+    config = ExtractionConfig(pyramid_level=2)
+    alone = MultiRoiExtractor([ROIS[0]], config)(frame)[0]
+    together = MultiRoiExtractor(ROIS, config)(frame)[0]
+    assert alone == pytest.approx(together)
+
+
+def test_roi_outside_frame_is_rejected(frame):
+    with pytest.raises(ValueError):
+        MultiRoiExtractor([(100, 100, 5, 5)])(frame)
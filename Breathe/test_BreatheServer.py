@@ -0,0 +1,48 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+import BreatheServer
+from BreatheServer import Publisher, StreamWorker
+
+
+def make_video(path, frames, size=(64, 48), fps=30.0):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+    for i in range(frames):
+        writer.write(np.full((size[1], size[0], 3), 100 + (i % 20), np.uint8))
+    writer.release()
+
+
+def test_end_of_stream_reaches_a_full_queue():
+    async def scenario():
+        worker = StreamWorker("cam", "rtsp://camera", [(0, 0, 8, 8)], Publisher(), None, None)
+        worker.samples = asyncio.Queue(maxsize=4)
+        for i in range(4):
+            worker._enqueue(i)
+        worker._enqueue(None)
+        items = [worker.samples.get_nowait() for _ in range(worker.samples.qsize())]
+        return worker, items
+
+    worker, items = asyncio.run(scenario())
+    assert items == [1, 2, 3, None]
+    assert worker.dropped == 1
+
+
+def test_recorded_file_waits_for_analysis_instead_of_dropping(tmp_path, monkeypatch):
+    monkeypatch.setattr(BreatheServer, "SAMPLE_QUEUE_SIZE", 4)
+    video = tmp_path / "clip.avi"
+    make_video(video, 40)
+
+    async def scenario():
+        with ThreadPoolExecutor(1) as pool:
+            worker = StreamWorker("clip", str(video), [(0, 0, 16, 16)], Publisher(), pool, None)
+            await asyncio.wait_for(worker.run(), timeout=30)
+        return worker
+
+    worker = asyncio.run(scenario())
+    assert not worker.live
+    assert worker.status == "finished"
+    assert worker.frames == 40
+    assert worker.dropped == 0
@@ -1,8 +1,161 @@
+import getpass
 import os
 import tkinter as tk
 from tkinter import filedialog, messagebox
+import numpy as np
 import pandas as pd
-from datetime import datetime
+
+from reviewdb import ReviewStore, store_path
+from reviewindex import PatientIndex
+from reviewio import (BackgroundWriter, ReviewJournal, apply_journal, detect_patient_id_column,
+                      journal_path, read_review_csv, review_file_path, reviewed_mask)
+from reviewlazy import LazyReviewTable, read_columns
+
+# The full _reviewed_ CSV is rewritten only every COMPACT_EVERY edits, every
+# COMPACT_INTERVAL_MS, on Save and on exit; each edit in between is a journal append.
+# A shared session only commits its SQLite store then; its CSV is written on Save.
+COMPACT_EVERY = 200
+COMPACT_INTERVAL_MS = 5 * 60 * 1000
+# All of that I/O runs on a BackgroundWriter thread; the status bar polls it.
+STATUS_POLL_MS = 500
+# Lists larger than this open lazily: only patient ID and Comments are loaded and the
+# other columns are read from disk for the current patient.
+LAZY_THRESHOLD_BYTES = 64 * 1024 * 1024
+
+
+class ProgressStrip:
+    """
+    Scalable progress bar on a Tk canvas.
+
+    Top row (overview): all patients. With one cell per patient when they fit,
+    otherwise patients are bucketed into equal segments whose colour blends from
+    red (none reviewed) to green (all reviewed). Bottom row (detail): one numbered
+    cell per patient for the page of patients around the current one. Clicking a
+    cell in either row calls on_select(index).
+
+    Canvas items are created only when the layout changes (resize, detail page
+    change); a navigation or comment edit just recolours the affected items and
+    moves the blue current-patient markers, so each update is O(1) Tk calls.
+    """
+    MIN_CELL = 6       # px per overview cell
+    DETAIL_CELL = 24   # px per detail cell
+    OVERVIEW_HEIGHT = 14
+    DETAIL_TOP = 18
+    DETAIL_HEIGHT = 24
+
+    def __init__(self, canvas, reviewed, on_select=None):
+        self.canvas = canvas
+        self.reviewed = np.asarray(reviewed, dtype=bool).copy()
+        self.on_select = on_select
+        self.current = 0
+        self.width = 0
+        self.bucket_size = 1
+        self.bucket_counts = np.zeros(0, dtype=int)
+        self.overview_items = []
+        self.detail_start = 0
+        self.detail_items = []
+        self.detail_labels = []
+        self.canvas.bind("<Configure>", self._on_configure)
+        self.canvas.bind("<Button-1>", self._on_click)
+
+    # -------- Layout (only on resize / page change) --------
+    def _on_configure(self, event):
+        if event.width != self.width:
+            self.width = event.width
+            self.rebuild()
+
+    def rebuild(self):
+        self.canvas.delete("all")
+        n = len(self.reviewed)
+        if n == 0 or self.width <= 1:
+            return
+        max_cells = max(1, self.width // self.MIN_CELL)
+        self.bucket_size = max(1, -(-n // max_cells))  # ceil division
+        starts = np.arange(0, n, self.bucket_size)
+        self.bucket_counts = np.add.reduceat(self.reviewed.astype(int), starts)
+        cell = self.width / len(starts)
+        self.overview_items = [
+            self.canvas.create_rectangle(i * cell, 0, (i + 1) * cell, self.OVERVIEW_HEIGHT,
+                                         fill=self._bucket_color(i), outline="")
+            for i in range(len(starts))
+        ]
+        self.overview_marker = self.canvas.create_rectangle(0, 0, 0, 0, outline="blue", width=2)
+        self.detail_items = []
+        self._build_detail_page(self.current)
+        self.set_current(self.current)
+
+    def _build_detail_page(self, index):
+        for item in self.detail_items + self.detail_labels:
+            self.canvas.delete(item)
+        per_page = max(1, self.width // self.DETAIL_CELL)
+        self.detail_start = (index // per_page) * per_page
+        stop = min(len(self.reviewed), self.detail_start + per_page)
+        y0, y1 = self.DETAIL_TOP, self.DETAIL_TOP + self.DETAIL_HEIGHT
+        self.detail_items, self.detail_labels = [], []
+        for i in range(self.detail_start, stop):
+            x1 = (i - self.detail_start) * self.DETAIL_CELL
+            x2 = x1 + self.DETAIL_CELL
+            self.detail_items.append(self.canvas.create_rectangle(
+                x1, y0, x2, y1, fill=self._patient_color(i), outline="black"))
+            self.detail_labels.append(self.canvas.create_text(
+                (x1 + x2) // 2, (y0 + y1) // 2, text=str(i + 1), font=("Helvetica", 7), fill="white"))
+
+    # -------- Incremental updates --------
+    def set_current(self, index):
+        if not self.overview_items:
+            self.current = index
+            return
+        previous, self.current = self.current, index
+        if not self.detail_start <= index < self.detail_start + len(self.detail_items):
+            self._build_detail_page(index)
+        else:
+            self._recolor_detail(previous)
+            self._recolor_detail(index)
+        bucket = index // self.bucket_size
+        cell = self.width / len(self.overview_items)
+        self.canvas.coords(self.overview_marker, bucket * cell + 1, 1, (bucket + 1) * cell - 1, self.OVERVIEW_HEIGHT - 1)
+        self.canvas.tag_raise(self.overview_marker)
+
+    def set_reviewed(self, index, reviewed):
+        if self.reviewed[index] == reviewed:
+            return
+        self.reviewed[index] = reviewed
+        if not self.overview_items:
+            return
+        bucket = index // self.bucket_size
+        self.bucket_counts[bucket] += 1 if reviewed else -1
+        self.canvas.itemconfig(self.overview_items[bucket], fill=self._bucket_color(bucket))
+        self._recolor_detail(index)
+
+    def _recolor_detail(self, index):
+        offset = index - self.detail_start
+        if 0 <= offset < len(self.detail_items):
+            self.canvas.itemconfig(self.detail_items[offset], fill=self._patient_color(index))
+
+    # -------- Colours and clicks --------
+    def _patient_color(self, index):
+        if index == self.current:
+            return "blue"
+        return "green" if self.reviewed[index] else "red"
+
+    def _bucket_color(self, bucket):
+        size = min(self.bucket_size, len(self.reviewed) - bucket * self.bucket_size)
+        fraction = self.bucket_counts[bucket] / size
+        # Linear blend red (#cc0000) -> green (#008000).
+        red = int(0xcc * (1 - fraction))
+        green = int(0x80 * fraction)
+        return f"#{red:02x}{green:02x}00"
+
+    def _on_click(self, event):
+        if not self.overview_items or self.on_select is None:
+            return
+        if event.y < self.OVERVIEW_HEIGHT:
+            bucket = int(event.x / (self.width / len(self.overview_items)))
+            index = bucket * self.bucket_size
+        else:
+            index = self.detail_start + event.x // self.DETAIL_CELL
+        if 0 <= index < len(self.reviewed):
+            self.on_select(index)
 
 
 class MacroApp:
@@ -13,9 +166,12 @@ class MacroApp:
 
         self.file_path = None
         self.data = None
+        self.table = None  # LazyReviewTable when the list is opened lazily
+        self.index = None  # PatientIndex for search and filtered navigation
         self.save_file_path = None
         self.current_index = 0
         self.patient_id_column = None
+        self.writer = None
 
         # Create frames
         self.frame1 = tk.Frame(self.root)
@@ -31,6 +187,17 @@ class MacroApp:
         # Text instruction
         tk.Label(self.frame1, text="Locate .csv file with Patient ID column", font=("Helvetica", 18)).pack(pady=20)
 
+        # Shared session: comments go to <list>.review.sqlite, one row per patient per reviewer
+        shared_frame = tk.Frame(self.frame1)
+        shared_frame.pack(pady=5)
+        self.shared_session = tk.BooleanVar(value=False)
+        tk.Checkbutton(shared_frame, text="Shared session (SQLite)", variable=self.shared_session,
+                       font=("Helvetica", 12)).pack(side=tk.LEFT, padx=10)
+        tk.Label(shared_frame, text="Reviewer:", font=("Helvetica", 12)).pack(side=tk.LEFT)
+        self.reviewer_entry = tk.Entry(shared_frame, width=14, font=("Helvetica", 12))
+        self.reviewer_entry.insert(0, getpass.getuser())
+        self.reviewer_entry.pack(side=tk.LEFT, padx=5)
+
         # File selection button
         find_button = tk.Button(self.frame1, text="Find 🔎", command=self.load_file, font=("Helvetica", 18), fg="green")
         find_button.pack(pady=10, fill="none", expand=False)
@@ -51,20 +218,46 @@ class MacroApp:
         self.reviewing_label = tk.Label(self.frame2, text=f"Currently reviewing: {self.file_path}", font=("Helvetica", 12), fg="green")
         self.reviewing_label.pack(pady=20, fill="x", expand=False)
 
-        # Horizontal progress bar
-        self.progress_canvas = tk.Canvas(self.frame2, height=30, bg="white")
+        # Horizontal progress bar: overview of all patients plus a page of numbered cells.
+        # It lays itself out when the canvas is first mapped (and on every resize).
+        self.progress_canvas = tk.Canvas(self.frame2, height=44, bg="white", highlightthickness=0)
         self.progress_canvas.pack(pady=10, fill="x", padx=20)
-        # Delay updating the progress bar to ensure the canvas is fully initialized
-        self.root.after(100, self.update_progress_bar)  # Update after 100ms
+        self.progress = ProgressStrip(self.progress_canvas, reviewed_mask(self.data['Comments']),
+                                      on_select=self.jump_to_patient)
 
         # Progress display
         self.progress_label = tk.Label(self.frame2, text="", font=("Helvetica", 16))
         self.progress_label.pack(pady=20, fill="x", expand=False)
 
+        # Search and filter: jump to an ID (prefix), next unreviewed, filtered Prev/Next
+        search_frame = tk.Frame(self.frame2)
+        search_frame.pack(pady=5, fill="x", padx=20)
+        tk.Label(search_frame, text="Go to ID:", font=("Helvetica", 12)).pack(side=tk.LEFT)
+        self.search_entry = tk.Entry(search_frame, width=14, font=("Helvetica", 12))
+        self.search_entry.pack(side=tk.LEFT, padx=5)
+        self.search_entry.bind("<Return>", lambda event: self.search_patient())
+        tk.Button(search_frame, text="Next unreviewed ⏭", command=self.next_unreviewed,
+                  font=("Helvetica", 12)).pack(side=tk.LEFT, padx=10)
+        tk.Label(search_frame, text="Show:", font=("Helvetica", 12)).pack(side=tk.LEFT, padx=(20, 0))
+        self.filter_status = tk.StringVar(value="all")
+        tk.OptionMenu(search_frame, self.filter_status, "all", "unreviewed", "reviewed",
+                      command=lambda value: self.apply_filter()).pack(side=tk.LEFT)
+        tk.Label(search_frame, text="Comment contains:", font=("Helvetica", 12)).pack(side=tk.LEFT)
+        self.filter_entry = tk.Entry(search_frame, width=16, font=("Helvetica", 12))
+        self.filter_entry.pack(side=tk.LEFT, padx=5)
+        self.filter_entry.bind("<Return>", lambda event: self.apply_filter())
+        self.search_label = tk.Label(search_frame, text="", font=("Helvetica", 11), fg="gray")
+        self.search_label.pack(side=tk.LEFT, padx=10)
+
         # Current patient ID display
         self.patient_id_label = tk.Label(self.frame2, text="", font=("Helvetica", 24), fg="red")
         self.patient_id_label.pack(pady=20, fill="x", expand=False)
 
+        # Other columns of the current patient
+        self.details_label = tk.Label(self.frame2, text="", font=("Helvetica", 11), fg="gray",
+                                      wraplength=900, justify="left")
+        self.details_label.pack(pady=5, fill="x", expand=False)
+
         # Reminder textbox
         reminder_frame = tk.Frame(self.frame2)
         reminder_frame.pack(fill="both", expand=True, padx=10, pady=10)
@@ -95,27 +288,36 @@ class MacroApp:
         save_button = tk.Button(self.frame2, text="Save", command=self.save_progress, font=("Helvetica", 16))
         save_button.pack(pady=20, fill="none", expand=False)
 
+        # Save status bar: updated by polling the background writer, never a dialog.
+        self.status_label = tk.Label(self.frame2, text="", font=("Helvetica", 11), anchor="w", fg="gray")
+        self.status_label.pack(side=tk.BOTTOM, fill="x", padx=10, pady=5)
+
     def load_file(self):
         try:
             filename = filedialog.askopenfilename(filetypes=[("CSV Files", "*.csv")])
             if not filename:
                 return  # User canceled
             self.file_path = filename
-            self.data = pd.read_csv(self.file_path, encoding='utf-8')  # Load with UTF-8 encoding
-            self.data.columns = self.data.columns.str.strip()  # Strip whitespace from column names
-            if 'Comments' not in self.data.columns:
-                self.data['Comments'] = ""  # Ensure the Comments column exists
+            if os.path.getsize(self.file_path) > LAZY_THRESHOLD_BYTES:
+                self.table = LazyReviewTable(self.file_path)
+                self.data = self.table.keys()
+            else:
+                self.table = None
+                self.data = read_review_csv(self.file_path)
             self.patient_id_column = self.auto_detect_patient_id_column()
             self.current_index = 0
 
-            # Generate the save file path
-            base_name = os.path.basename(self.file_path).rsplit(".", 1)[0]
-            directory = os.path.dirname(self.file_path)
-            timestamp = datetime.now().strftime("%y%m%d")
-            self.save_file_path = os.path.join(directory, f"{base_name}_reviewed_{timestamp}.csv")
+            if self.shared_session.get():
+                # The store is the save file; the CSV is only an export, named per reviewer.
+                reviewer = self.reviewer_entry.get().strip() or getpass.getuser()
+                self.save_file_path = review_file_path(self.file_path, reviewer=reviewer)
+                self.open_shared_store(reviewer)
+            else:
+                # Generate the save file path
+                self.save_file_path = review_file_path(self.file_path)
 
-            # Check if the save file exists
-            self.check_save_file()
+                # Check if the save file exists
+                self.check_save_file()
 
             self.file_label.config(text=self.file_path)
             self.start_button.config(state=tk.NORMAL)
@@ -123,7 +325,11 @@ class MacroApp:
             messagebox.showerror("Error", f"Failed to load file: {str(e)}")
 
     def check_save_file(self):
-        if os.path.exists(self.save_file_path):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        pending_journal = journal_path(self.save_file_path)
+        if os.path.exists(self.save_file_path) or os.path.exists(pending_journal):
             choice = messagebox.askyesno(
                 "Save File Exists",
                 "A save file already exists. Do you want to overwrite it?\n"
@@ -137,25 +343,49 @@ class MacroApp:
                 if overwrite_confirm:
                     # Overwrite: Clear all comments and create a new save file
                     self.data['Comments'] = ""  # Clear all comments
+                    journal = ReviewJournal(pending_journal)
+                    journal.clear()
+                    self.writer = BackgroundWriter(journal, self.save_file_path)
                     self.save_to_file()
                     messagebox.showinfo("Overwrite", "All progress has been reset.")
-                else:
-                    # User canceled the overwrite in the second prompt
-                    messagebox.showinfo("Canceled", "Overwrite canceled. Loading saved file.")
-                    self.data = pd.read_csv(self.save_file_path, encoding='utf-8')
+                    return
+                # User canceled the overwrite in the second prompt
+                messagebox.showinfo("Canceled", "Overwrite canceled. Loading saved file.")
+            self.load_saved_progress()
+        self.writer = BackgroundWriter(ReviewJournal(pending_journal), self.save_file_path)
+
+    def open_shared_store(self, reviewer):
+        """Loads this reviewer's comments from the list's SQLite store and writes edits back to it."""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        store = ReviewStore(store_path(self.file_path), reviewer)
+        store.register_list(self.data[self.patient_id_column])
+        self.data['Comments'] = store.load_comments(len(self.data))
+        self.writer = BackgroundWriter(store, self.save_file_path)
+
+    def load_saved_progress(self):
+        """Loads the last compacted save file, then replays journal edits made after it."""
+        if os.path.exists(self.save_file_path):
+            if self.table is not None:
+                # Lazy: only the comments are taken from the save file.
+                saved = read_columns(self.save_file_path, {'Comments'})
+                if 'Comments' in saved.columns and len(saved) == len(self.data):
+                    self.data['Comments'] = saved['Comments'].astype(object).to_numpy()
             else:
-                # Continue: Load existing save file
-                self.data = pd.read_csv(self.save_file_path, encoding='utf-8')
+                self.data = read_review_csv(self.save_file_path)
+        entries = ReviewJournal.replay(journal_path(self.save_file_path))
+        apply_journal(self.data, self.patient_id_column, entries)
 
     def auto_detect_patient_id_column(self):
-        possible_names = ['PatientID', 'patient_id', 'Patient Id', 'patientid']
-        for name in possible_names:
-            if name in self.data.columns:
-                return name
-        raise ValueError("No known patient ID column found.")
+        return detect_patient_id_column(self.data.columns)
 
     def start_review(self):
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(COMPACT_INTERVAL_MS, self.periodic_compact)
+        self.root.after(STATUS_POLL_MS, self.poll_save_status)
         self.frame1.pack_forget()
+        self.index = PatientIndex(self.data[self.patient_id_column], self.data['Comments'])
         self.setup_frame2()
         self.show_patient()
         self.copy_patient_id_to_clipboard()
@@ -165,10 +395,15 @@ class MacroApp:
             # Update patient ID display
             patient_id = self.data.iloc[self.current_index][self.patient_id_column]
             self.patient_id_label.config(text=f"Patient ID: {patient_id}")
+            self.details_label.config(text=self.patient_details())
 
             # Update progress display
             total_patients = len(self.data)
-            self.progress_label.config(text=f"Patient {self.current_index + 1} of {total_patients}")
+            progress_text = f"Patient {self.current_index + 1} of {total_patients}"
+            rows = self.filtered_rows()
+            if rows is not None:
+                progress_text += f"  ({len(rows)} shown by filter)"
+            self.progress_label.config(text=progress_text)
 
             # Show existing comments if any
             existing_comment = self.data.loc[self.current_index, 'Comments']
@@ -181,24 +416,96 @@ class MacroApp:
             # Update progress bar
             self.update_progress_bar()
 
-    def next_patient(self):
-        if self.current_index < len(self.data) - 1:
+    def patient_details(self):
+        """'column: value' text for the current patient's other columns."""
+        if self.table is not None:
+            record = self.table.row(self.current_index)
+        else:
+            record = self.data.iloc[self.current_index].to_dict()
+        skip = (self.patient_id_column, 'Comments')
+        return "   ".join(f"{k}: {v}" for k, v in record.items()
+                           if k not in skip and not pd.isna(v) and str(v) != "")
+
+    def jump_to_patient(self, index):
+        if index != self.current_index:
             self.save_comment()
-            self.current_index += 1
+            self.current_index = index
             self.copy_patient_id_to_clipboard()
             self.show_patient()
+
+    def filtered_rows(self):
+        """Rows allowed by the status/comment filter (list order), or None when unfiltered."""
+        status = self.filter_status.get()
+        text = self.filter_entry.get().strip()
+        if status == "all" and not text:
+            return None
+        return self.index.view(status, text)
+
+    def step_patient(self, step):
+        """Row of the next (step=1) or previous (step=-1) patient in the current view, or None."""
+        rows = self.filtered_rows()
+        if rows is None:
+            target = self.current_index + step
+            return target if 0 <= target < len(self.data) else None
+        if step > 0:
+            i = np.searchsorted(rows, self.current_index, side="right")
+        else:
+            i = np.searchsorted(rows, self.current_index, side="left") - 1
+        return int(rows[i]) if 0 <= i < len(rows) else None
+
+    def next_patient(self):
+        self.save_comment()  # first, so a status filter sees this patient's new state
+        target = self.step_patient(1)
+        if target is not None:
+            self.jump_to_patient(target)
         else:
             messagebox.showinfo("End", "You have reached the end of the patient list.")
 
     def prev_patient(self):
-        if self.current_index > 0:
-            self.save_comment()
-            self.current_index -= 1
-            self.copy_patient_id_to_clipboard()
-            self.show_patient()
+        self.save_comment()
+        target = self.step_patient(-1)
+        if target is not None:
+            self.jump_to_patient(target)
         else:
             messagebox.showinfo("Start", "You are already at the first patient.")
 
+    def next_unreviewed(self):
+        self.save_comment()
+        target = self.index.next_unreviewed(self.current_index)
+        if target is None:
+            self.search_label.config(text="All patients reviewed ✔")
+        else:
+            self.jump_to_patient(target)
+
+    def search_patient(self):
+        query = self.search_entry.get().strip()
+        if not query:
+            return
+        rows = self.index.find(query)
+        if len(rows) == 0:
+            rows = self.index.find_prefix(query)
+        if len(rows) == 0:
+            self.search_label.config(text=f"No patient ID starts with {query!r}")
+            return
+        # Repeated Enter cycles through the matches after the current patient.
+        later = rows[rows > self.current_index]
+        target = int(later[0]) if len(later) else int(rows[0])
+        self.search_label.config(text=f"{len(rows)} match(es)")
+        self.jump_to_patient(target)
+
+    def apply_filter(self):
+        rows = self.filtered_rows()
+        if rows is None:
+            self.search_label.config(text="")
+        elif len(rows) == 0:
+            self.search_label.config(text="No patients match the filter")
+        else:
+            self.search_label.config(text=f"{len(rows)} patient(s) match")
+            if not np.any(rows == self.current_index):
+                self.jump_to_patient(int(rows[0]))
+                return
+        self.show_patient()
+
     def copy_reminder_to_comment(self):
         existing_comment = self.comments_text.get("1.0", tk.END).strip()
         if existing_comment:
@@ -214,45 +521,69 @@ class MacroApp:
 
     def save_comment(self):
         comment = self.comments_text.get("1.0", tk.END).strip()
+        existing_comment = self.data.loc[self.current_index, 'Comments']
+        if pd.isna(existing_comment):
+            existing_comment = ""
+        if comment == str(existing_comment):
+            return  # Nothing changed: no disk I/O at all
         self.data.loc[self.current_index, 'Comments'] = comment
-        self.save_to_file()
+        self.progress.set_reviewed(self.current_index, comment != "")
+        self.index.set_comment(self.current_index, comment)
+        patient_id = self.data.iloc[self.current_index][self.patient_id_column]
+        # Only queued here; the writer thread journals it (bursts coalesced per row).
+        self.writer.submit(patient_id, self.current_index, comment)
+        if self.writer.pending_edits >= COMPACT_EVERY:
+            self.save_to_file()
+
+    def periodic_compact(self):
+        if self.writer is not None and self.writer.pending_edits:
+            self.save_to_file()
+        self.root.after(COMPACT_INTERVAL_MS, self.periodic_compact)
+
+    def poll_save_status(self):
+        status = self.writer.status()
+        if status["last_error"]:
+            text, color = f"⚠ Save failed, retrying: {status['last_error']}", "red"
+        elif status["busy"]:
+            text, color = "Saving...", "gray"
+        elif status["last_saved"] is not None:
+            text, color = f"All changes saved at {status['last_saved']:%H:%M:%S}", "green"
+        else:
+            text, color = "No changes yet", "gray"
+        self.status_label.config(text=text, fg=color)
+        self.root.after(STATUS_POLL_MS, self.poll_save_status)
+
+    def on_close(self):
+        if self.data is not None and self.writer is not None:
+            self.save_comment()
+            self.save_to_file()
+            self.writer.close()  # waits for the final compaction
+        self.root.destroy()
 
     def save_progress(self):
-        self.save_to_file()
-        messagebox.showinfo("Saved", f"Progress saved to {self.save_file_path}")
-        self.update_progress_bar()  # Update the progress bar after saving
+        # Non-blocking: the status bar reports when the write has finished.
+        self.save_comment()
+        self.save_to_file(export=True)
 
     def update_progress_bar(self):
-        """Updates the progress bar on the canvas."""
-        self.progress_canvas.delete("all")  # Clear the canvas
-        self.progress_canvas.update_idletasks()  # Ensure canvas dimensions are updated
-
-        if self.data is not None:
-            total_patients = len(self.data)
-            bar_width = self.progress_canvas.winfo_width()
-            rect_width = max(10, bar_width // total_patients)  # Minimum width for rectangles
-            rect_height = 30
-
-            # Draw rectangles for progress
-            for i in range(total_patients):
-                x1 = i * rect_width
-                x2 = x1 + rect_width
-
-                # Highlight the current patient with blue
-                if i == self.current_index:
-                    color = "blue"
-                else:
-                    color = "green" if pd.notna(self.data.loc[i, 'Comments']) and self.data.loc[i, 'Comments'].strip() != "" else "red"
-
-                self.progress_canvas.create_rectangle(x1, 0, x2, rect_height, fill=color, outline="black")
-                self.progress_canvas.create_text((x1 + x2) // 2, rect_height // 2, text=str(i + 1), font=("Helvetica", 8), fill="white")
-
-    def save_to_file(self):
+        """Moves the current-patient markers; colours are updated as comments change."""
+        self.progress.set_current(self.current_index)
+
+    def save_to_file(self, export=False):
+        """
+        Queues a compaction (full review CSV, journal emptied) on the writer thread. A
+        shared session only commits unless export is set (the Save button).
+        """
         if self.data is not None and self.save_file_path:
-            try:
-                self.data.to_csv(self.save_file_path, index=False, encoding='utf-8-sig')  # Use 'utf-8-sig'
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to save file: {str(e)}")
+            # Only Comments ever changes, so a shallow copy with its own Comments
+            # column is a consistent snapshot the writer can use while review goes on.
+            if self.table is not None:
+                # Lazy: the writer streams the other columns from the source list.
+                snapshot = self.table.snapshot(self.data['Comments'].copy())
+            else:
+                snapshot = self.data.copy(deep=False)
+                snapshot['Comments'] = self.data['Comments'].copy()
+            self.writer.request_compact(snapshot, export)
     
     def copy_patient_id_to_clipboard(self):
         if self.data is not None and 0 <= self.current_index < len(self.data):
@@ -261,7 +592,9 @@ class MacroApp:
             self.root.clipboard_append(patient_id)
             self.root.update()  # Keeps the clipboard updated
 
-# Main window
-root = tk.Tk()
-app = MacroApp(root)
-root.mainloop()
+if __name__ == "__main__":
+    # Main window (created only when run as the app, so the module can be imported headless)
+    root = tk.Tk()
+    app = MacroApp(root)
+    root.mainloop()
+
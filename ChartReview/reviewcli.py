@@ -0,0 +1,268 @@
+# Headless ChartReview tools (no Tk import on this path):
+#
+#     python reviewcli.py merge a_reviewed_250101.csv b_reviewed_250102.csv -o merged.csv --strategy newest
+#     python reviewcli.py stats list_reviewed_250101.csv --by Department
+#     python reviewcli.py apply list_reviewed_250101.csv --ids excluded.txt --template "Excluded: {Reason}"
+#     python reviewcli.py export list.csv -o all_reviewers.csv
+#
+# Review files are read with any pending .journal edits applied. All row work is
+# done with vectorised pandas operations (joins, groupby, isin), never row loops.
+
+import argparse
+import json
+import os
+import string
+import sys
+
+import pandas as pd
+
+from reviewdb import ReviewStore, store_path
+from reviewio import (ReviewJournal, apply_journal, detect_patient_id_column, journal_path,
+                      read_review_csv, reviewed_mask, write_csv_atomic)
+
+STRATEGIES = ("last", "newest", "concat")
+CONCAT_SEPARATOR = " | "
+
+
+def read_review(path):
+    """A review CSV with its pending journal applied. Returns (data, id_column)."""
+    data = read_review_csv(path)
+    id_column = detect_patient_id_column(data.columns)
+    apply_journal(data, id_column, ReviewJournal.replay(journal_path(path)))
+    return data, id_column
+
+
+def occurrence_key(ids):
+    """(patient ID, n-th occurrence) so lists with repeated IDs still align row for row."""
+    ids = ids.astype(str).str.strip()
+    return pd.DataFrame({"_id": ids, "_n": ids.groupby(ids, sort=False).cumcount()})
+
+
+# ================================
+# Merge:
+# ================================
+def merge_reviews(paths, strategy="last"):
+    """
+    Merges several review files of the same list. The first file supplies every
+    column but Comments; comments are aligned by patient ID (and occurrence, for
+    repeated IDs). Where files disagree:
+      last   - the file listed later wins
+      newest - the most recently modified file wins
+      concat - the distinct comments are joined with " | " in file order
+    Returns (merged DataFrame, conflicts DataFrame [ID, occurrence, file, comment]).
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy {strategy!r}; use one of {', '.join(STRATEGIES)}.")
+    base, id_column = read_review(paths[0])
+    ranks = range(len(paths))
+    if strategy == "newest":
+        ranks = pd.Series([os.path.getmtime(p) for p in paths]).rank(method="first").astype(int).tolist()
+
+    long = []
+    for rank, path in zip(ranks, paths):
+        data = base if path == paths[0] else read_review(path)[0]
+        part = occurrence_key(data[detect_patient_id_column(data.columns)])
+        part["comment"] = data["Comments"].fillna("").astype(str).str.strip().to_numpy()
+        part["rank"] = rank
+        part["file"] = os.path.basename(path)
+        long.append(part[part["comment"] != ""])
+    # Stable sort by rank only: within each key, later rows are the preferred ones.
+    long = pd.concat(long, ignore_index=True).sort_values("rank", kind="stable")
+
+    keys = ["_id", "_n"]
+    distinct = long.drop_duplicates(keys + ["comment"])
+    counts = distinct.groupby(keys, sort=False)["comment"].transform("size")
+    conflicting = distinct[counts > 1]
+    conflicts = conflicting.sort_values(keys, kind="stable")[keys + ["file", "comment"]].rename(
+        columns={"_id": id_column, "_n": "occurrence"})
+
+    if strategy == "concat":
+        # Only conflicting rows need a string join; the rest already have one comment.
+        joined = conflicting.groupby(keys, sort=False)["comment"].agg(CONCAT_SEPARATOR.join).reset_index()
+        resolved = pd.concat([distinct[counts == 1][keys + ["comment"]], joined], ignore_index=True)
+    else:
+        resolved = long.drop_duplicates(keys, keep="last")[keys + ["comment"]]
+
+    merged = base.drop(columns=["Comments"])
+    comments = occurrence_key(base[id_column]).merge(resolved, on=keys, how="left")["comment"]
+    merged["Comments"] = comments.fillna("").to_numpy()
+    return merged, conflicts
+
+
+# ================================
+# Statistics:
+# ================================
+def review_stats(data, id_column, by=None, top=5):
+    """Completion statistics, optionally broken down by a column, as a JSON-able dict."""
+    reviewed = pd.Series(reviewed_mask(data["Comments"]), index=data.index)
+    comments = data["Comments"].fillna("").astype(str).str.strip()
+    stats = {
+        "rows": int(len(data)),
+        "reviewed": int(reviewed.sum()),
+        "percent": round(100.0 * reviewed.mean(), 2) if len(data) else 0.0,
+        "patients": int(data[id_column].nunique()),
+        "patients_reviewed": int(data.loc[reviewed, id_column].nunique()),
+        "top_comments": comments[reviewed].value_counts().head(top).to_dict(),
+    }
+    if by is not None:
+        groups = reviewed.groupby(data[by].fillna("(blank)"))
+        table = pd.DataFrame({"rows": groups.size(), "reviewed": groups.sum()})
+        table["percent"] = (100.0 * table["reviewed"] / table["rows"]).round(2)
+        stats["by"] = {by: {str(k): {"rows": int(row["rows"]), "reviewed": int(row["reviewed"]),
+                                     "percent": float(row["percent"])}
+                            for k, row in table.iterrows()}}
+    return stats
+
+
+def print_stats(path, stats):
+    print(f"{path}: {stats['reviewed']}/{stats['rows']} rows reviewed ({stats['percent']:.1f}%), "
+          f"{stats['patients_reviewed']}/{stats['patients']} patients")
+    for comment, count in stats["top_comments"].items():
+        print(f"    {count:>8}  {comment[:60]}")
+    for column, table in stats.get("by", {}).items():
+        print(f"  by {column}:")
+        for key, row in table.items():
+            print(f"    {key:<24}{row['reviewed']:>8}/{row['rows']:<8}{row['percent']:>7.1f}%")
+
+
+# ================================
+# Bulk apply:
+# ================================
+def read_id_list(path, id_column=None):
+    """Patient IDs from a text file (one per line) or a CSV with a patient ID column."""
+    if path.lower().endswith(".csv"):
+        ids = pd.read_csv(path, dtype=str, encoding="utf-8")
+        ids.columns = ids.columns.str.strip()
+        return ids[id_column or detect_patient_id_column(ids.columns)].dropna().str.strip()
+    with open(path, encoding="utf-8-sig") as f:
+        return pd.Series([line.strip() for line in f if line.strip()], dtype=str)
+
+
+def render_template(template, data):
+    """
+    Fills a str.format-style template ("Excluded: {Reason}") for every row at once
+    by concatenating the literal parts with whole columns.
+    """
+    result = pd.Series("", index=data.index, dtype=object)
+    for literal, field, _spec, _conversion in string.Formatter().parse(template):
+        result = result + literal
+        if field is not None:
+            if field not in data.columns:
+                raise KeyError(f"Template field {{{field}}} is not a column.")
+            result = result + data[field].fillna("").astype(str)
+    return result
+
+
+def apply_comments(data, id_column, ids, template, mode="overwrite"):
+    """
+    Sets the templated comment on every row whose patient ID is in ids.
+      overwrite - replace existing comments
+      append    - add after an existing comment (" | " separated)
+      empty     - only fill rows without a comment
+    Returns the number of rows changed.
+    """
+    selected = data[id_column].astype(str).str.strip().isin(set(ids))
+    existing = data["Comments"].fillna("").astype(str)
+    if mode == "empty":
+        selected &= existing.str.strip() == ""
+    new = render_template(template, data[selected])
+    if mode == "append":
+        old = existing[selected]
+        new = old.where(old.str.strip() == "", old + CONCAT_SEPARATOR) + new
+    data["Comments"] = data["Comments"].astype(object)
+    changed = selected.copy()
+    changed[selected] = existing[selected] != new
+    data.loc[selected, "Comments"] = new
+    return int(changed.sum())
+
+
+# ================================
+# Command Line:
+# ================================
+def cmd_merge(args):
+    merged, conflicts = merge_reviews(args.files, args.strategy)
+    write_csv_atomic(merged, args.output)
+    print(f"Merged {len(args.files)} files into {args.output}: {int(reviewed_mask(merged['Comments']).sum())} "
+          f"of {len(merged)} rows reviewed, {conflicts.iloc[:, :2].drop_duplicates().shape[0]} conflicting rows.")
+    if args.conflicts:
+        write_csv_atomic(conflicts, args.conflicts)
+        print(f"Conflicts written to {args.conflicts}")
+
+
+def cmd_stats(args):
+    results = {}
+    for path in args.files:
+        data, id_column = read_review(path)
+        results[path] = review_stats(data, id_column, by=args.by, top=args.top)
+    if args.json:
+        json.dump(results, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        for path, stats in results.items():
+            print_stats(path, stats)
+
+
+def cmd_apply(args):
+    data, id_column = read_review(args.file)
+    ids = read_id_list(args.ids)
+    changed = apply_comments(data, id_column, ids, args.template, args.mode)
+    output = args.output or args.file
+    write_csv_atomic(data, output)
+    if output == args.file:
+        # The journal has been folded into the file just written.
+        journal = ReviewJournal(journal_path(args.file))
+        journal.clear()
+        journal.close()
+    print(f"{changed} rows updated for {len(ids)} listed IDs; saved to {output}")
+
+
+def cmd_export(args):
+    if not os.path.exists(store_path(args.list)):
+        sys.exit(f"No shared session found for {args.list} ({store_path(args.list)}).")
+    data = read_review_csv(args.list)
+    store = ReviewStore(store_path(args.list), reviewer=args.reviewer or "")
+    store.export_csv(data, args.output, reviewer=args.reviewer)
+    store.close()
+    print(f"Exported {'reviewer ' + args.reviewer if args.reviewer else 'latest comments of all reviewers'} "
+          f"to {args.output}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless tools for ChartReview review files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    merge = commands.add_parser("merge", help="Merge several _reviewed_ CSVs of the same list.")
+    merge.add_argument("files", nargs="+")
+    merge.add_argument("-o", "--output", required=True)
+    merge.add_argument("--strategy", choices=STRATEGIES, default="last",
+                       help="Conflict resolution: later file, newest file, or join all comments.")
+    merge.add_argument("--conflicts", help="Also write the conflicting comments to this CSV.")
+    merge.set_defaults(func=cmd_merge)
+
+    stats = commands.add_parser("stats", help="Review completion statistics.")
+    stats.add_argument("files", nargs="+")
+    stats.add_argument("--by", help="Break completion down by this column.")
+    stats.add_argument("--top", type=int, default=5, help="Most common comments to list.")
+    stats.add_argument("--json", action="store_true")
+    stats.set_defaults(func=cmd_stats)
+
+    apply = commands.add_parser("apply", help="Bulk-apply a templated comment to listed patient IDs.")
+    apply.add_argument("file", help="Review CSV to update.")
+    apply.add_argument("--ids", required=True, help="Text file (one ID per line) or CSV with a patient ID column.")
+    apply.add_argument("--template", required=True, help='Comment text; {Column} inserts that row\'s value.')
+    apply.add_argument("--mode", choices=("overwrite", "append", "empty"), default="overwrite")
+    apply.add_argument("-o", "--output", help="Write here instead of updating the file in place.")
+    apply.set_defaults(func=cmd_apply)
+
+    export = commands.add_parser("export", help="Export a shared SQLite session to the CSV layout.")
+    export.add_argument("list", help="The patient list the session belongs to.")
+    export.add_argument("-o", "--output", required=True)
+    export.add_argument("--reviewer", help="One reviewer's comments (default: latest of all reviewers).")
+    export.set_defaults(func=cmd_export)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import os
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from reviewio import write_csv_atomic
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    row        INTEGER PRIMARY KEY,
+    patient_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS patients_id ON patients (patient_id);
+CREATE TABLE IF NOT EXISTS comments (
+    row        INTEGER NOT NULL REFERENCES patients (row),
+    reviewer   TEXT NOT NULL,
+    patient_id TEXT NOT NULL,
+    comment    TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (row, reviewer)
+);
+CREATE INDEX IF NOT EXISTS comments_patient ON comments (patient_id);
+CREATE INDEX IF NOT EXISTS comments_reviewer ON comments (reviewer, updated_at);
+"""
+
+
+def store_path(file_path):
+    """<list>.review.sqlite next to the reviewed list: one store per list, not per day."""
+    return os.path.splitext(file_path)[0] + ".review.sqlite"
+
+
+class ReviewStore:
+    """
+    Shared SQLite review session for one patient list.
+
+    The database runs in WAL mode, so several reviewers (separate app instances on
+    the machine holding the file; WAL does not work over network shares) can read
+    while one writes. Each reviewer has their own row per patient in `comments`,
+    keyed (row, reviewer), so nobody overwrites anybody else and an edit is a
+    single-row upsert instead of a file rewrite.
+
+    It has the same record/sync/compact/close/pending interface as ReviewJournal,
+    so BackgroundWriter drives it unchanged: edits are upserted and committed in
+    one transaction per coalesced batch. The database is the save file, so compact()
+    only commits; the CSV is written by export() (Save, or `reviewcli export`).
+    """
+    def __init__(self, path, reviewer, timeout=30.0):
+        self.path = path
+        self.reviewer = reviewer
+        self.pending = 0  # edits since the last export (drives COMPACT_EVERY like the journal)
+        # Opened on the main thread, then used only by the writer thread.
+        self.conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # durable at each WAL checkpoint; fast commits
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    # -------- Patient list --------
+    def register_list(self, patient_ids):
+        """Stores the list's row -> patient ID map once; refuses a different list."""
+        ids = pd.Series(patient_ids).astype(str).tolist()
+        count, = self.conn.execute("SELECT COUNT(*) FROM patients").fetchone()
+        if count == 0:
+            with self.conn:
+                self.conn.executemany("INSERT OR IGNORE INTO patients (row, patient_id) VALUES (?, ?)",
+                                      enumerate(ids))
+            return
+        stored = [pid for pid, in self.conn.execute("SELECT patient_id FROM patients ORDER BY row")]
+        if stored != ids:
+            raise ValueError(f"{self.path} belongs to a different patient list.")
+
+    # -------- Journal interface (used by BackgroundWriter) --------
+    def record(self, patient_id, row, comment):
+        self.conn.execute(
+            "INSERT INTO comments (row, reviewer, patient_id, comment, updated_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (row, reviewer) DO UPDATE SET comment = excluded.comment, updated_at = excluded.updated_at",
+            (int(row), self.reviewer, str(patient_id), comment, datetime.now().isoformat(timespec="seconds")))
+        self.pending += 1
+
+    def sync(self):
+        self.conn.commit()
+
+    def compact(self, data, save_file_path, export=False):
+        """Commits; with export=True also writes this reviewer's view as the _reviewed_ CSV."""
+        self.sync()
+        if export:
+            write_csv_atomic(data, save_file_path)
+        self.pending = 0
+
+    def clear(self):
+        """Deletes this reviewer's comments (other reviewers are untouched)."""
+        with self.conn:
+            self.conn.execute("DELETE FROM comments WHERE reviewer = ?", (self.reviewer,))
+        self.pending = 0
+
+    def close(self):
+        self.sync()
+        self.conn.close()
+
+    # -------- Queries --------
+    def load_comments(self, n_rows, reviewer=None):
+        """Object array of n_rows comments for one reviewer ("" where none)."""
+        comments = np.full(n_rows, "", dtype=object)
+        cursor = self.conn.execute("SELECT row, comment FROM comments WHERE reviewer = ?",
+                                   (reviewer or self.reviewer,))
+        for row, comment in cursor:
+            if 0 <= row < n_rows:
+                comments[row] = comment
+        return comments
+
+    def comments(self, patient_id=None):
+        """All reviewers' comments as a DataFrame, optionally for one patient ID (indexed)."""
+        query = "SELECT row, patient_id, reviewer, comment, updated_at FROM comments"
+        params = ()
+        if patient_id is not None:
+            query += " WHERE patient_id = ?"
+            params = (str(patient_id),)
+        return pd.read_sql_query(query + " ORDER BY row, updated_at", self.conn, params=params)
+
+    def reviewers(self):
+        return [r for r, in self.conn.execute("SELECT DISTINCT reviewer FROM comments ORDER BY reviewer")]
+
+    def export_csv(self, data, path, reviewer=None):
+        """
+        Writes data (the patient list) with its Comments column filled from the store:
+        one reviewer's comments, or with reviewer=None the latest comment of any
+        reviewer for each patient.
+        """
+        if reviewer is not None:
+            comments = self.load_comments(len(data), reviewer)
+        else:
+            # The newest edit per row wins even if it cleared the comment.
+            latest = pd.read_sql_query(
+                "SELECT row, comment FROM (SELECT row, comment, ROW_NUMBER() OVER "
+                "(PARTITION BY row ORDER BY updated_at DESC, rowid DESC) AS rank FROM comments) WHERE rank = 1",
+                self.conn)
+            comments = np.full(len(data), "", dtype=object)
+            rows = latest["row"].to_numpy()
+            valid = (rows >= 0) & (rows < len(data))
+            comments[rows[valid]] = latest["comment"].to_numpy()[valid]
+        export = data.copy(deep=False)
+        export['Comments'] = comments
+        write_csv_atomic(export, path)
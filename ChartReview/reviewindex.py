@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+SEPARATOR = "\x00"  # cannot occur in a comment typed into Tk
+
+
+class PatientIndex:
+    """
+    In-memory lookups for navigation, independent of the DataFrame.
+
+    - find_prefix(): patient IDs kept sorted in a numpy array, so a prefix is two
+      binary searches.
+    - next_unreviewed() / view(): a boolean reviewed bitmap, searched with numpy.
+    - comment search: each distinct comment gets a code (review comments are
+      mostly repeated templates). The distinct comments, lower-cased, are joined
+      into one string that str.find() scans at C speed; matching codes are then
+      mapped to rows with one vectorised lookup. New comments are appended, so
+      nothing is rebuilt when a comment changes.
+
+    Row numbers are positions in the review list (current_index in MacroApp).
+    """
+    def __init__(self, ids, comments):
+        ids = pd.Series(ids).astype(str).to_numpy(dtype=str)
+        self.order = np.argsort(ids, kind="stable")
+        self.sorted_ids = ids[self.order]
+        comments = pd.Series(comments).fillna("").astype(str)
+        codes, uniques = pd.factorize(comments, sort=False)
+        self.codes = codes.astype(np.int64)
+        self.uniques = list(uniques)
+        self._lookup = {c: i for i, c in enumerate(self.uniques)}
+        self.reviewed = np.array(comments.str.strip() != "", dtype=bool)
+        self._pieces = [c.lower() + SEPARATOR for c in self.uniques]
+        self._starts = np.cumsum([0] + [len(p) for p in self._pieces])[:-1].astype(np.int64)
+        self._text = None
+
+    def __len__(self):
+        return len(self.reviewed)
+
+    # -------- Updates --------
+    def comment(self, row):
+        return self.uniques[self.codes[row]]
+
+    def set_comment(self, row, comment):
+        comment = "" if comment is None or pd.isna(comment) else str(comment)
+        code = self._lookup.get(comment)
+        if code is None:
+            code = self._lookup[comment] = len(self.uniques)
+            self.uniques.append(comment)
+            piece = comment.lower() + SEPARATOR
+            self._starts = np.append(self._starts,
+                                     (self._starts[-1] + len(self._pieces[-1])) if len(self._starts) else 0)
+            self._pieces.append(piece)
+            if self._text is not None:
+                self._text += piece
+        self.codes[row] = code
+        self.reviewed[row] = comment.strip() != ""
+
+    # -------- Patient ID --------
+    def find_prefix(self, prefix, limit=None):
+        """Rows whose patient ID starts with prefix, in list order."""
+        prefix = str(prefix).strip()
+        lo = np.searchsorted(self.sorted_ids, prefix, side="left")
+        hi = np.searchsorted(self.sorted_ids, prefix + "\U0010ffff", side="left")
+        rows = np.sort(self.order[lo:hi])
+        return rows if limit is None else rows[:limit]
+
+    def find(self, patient_id):
+        """Rows with exactly this patient ID."""
+        patient_id = str(patient_id).strip()
+        lo = np.searchsorted(self.sorted_ids, patient_id, side="left")
+        hi = np.searchsorted(self.sorted_ids, patient_id, side="right")
+        return np.sort(self.order[lo:hi])
+
+    # -------- Status --------
+    def next_unreviewed(self, row, step=1):
+        """First unreviewed row after row (before it if step is -1), wrapping around; None if all are done."""
+        pending = np.flatnonzero(~self.reviewed)
+        if len(pending) == 0:
+            return None
+        if step > 0:
+            i = np.searchsorted(pending, row, side="right")
+            return int(pending[i % len(pending)])
+        i = np.searchsorted(pending, row, side="left") - 1
+        return int(pending[i])  # -1 wraps to the last one
+
+    # -------- Comment text --------
+    def search_comments(self, text):
+        """Rows whose comment contains text (case-insensitive), in list order."""
+        text = text.lower()
+        if not text:
+            return np.arange(len(self))
+        if self._text is None:
+            self._text = "".join(self._pieces)
+        matches = np.zeros(len(self.uniques), dtype=bool)
+        find = self._text.find
+        position = find(text)
+        while position != -1:
+            code = int(np.searchsorted(self._starts, position, side="right")) - 1
+            matches[code] = True
+            # Skip to the next distinct comment: one hit per comment is enough.
+            if code + 1 >= len(self._starts):
+                break
+            position = find(text, int(self._starts[code + 1]))
+        return np.flatnonzero(matches[self.codes])
+
+    def view(self, status="all", text=""):
+        """
+        Rows matching a status ("all", "reviewed", "unreviewed") and a comment
+        substring, in list order, for filtered navigation.
+        """
+        rows = self.search_comments(text) if text else None
+        if status == "all":
+            return rows if rows is not None else np.arange(len(self))
+        mask = self.reviewed if status == "reviewed" else ~self.reviewed
+        if rows is None:
+            return np.flatnonzero(mask)
+        return rows[mask[rows]]
@@ -0,0 +1,272 @@
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+
+def review_file_path(file_path, timestamp=None, reviewer=None):
+    """
+    Returns the <name>_reviewed_YYMMDD.csv path next to the reviewed list, or
+    <name>_reviewed_<reviewer>.csv for a reviewer's export from a shared session.
+    """
+    base_name = os.path.basename(file_path).rsplit(".", 1)[0]
+    directory = os.path.dirname(file_path)
+    if reviewer:
+        # The reviewer name is free text: keep it to one safe path component.
+        safe_reviewer = re.sub(r"[^\w.-]", "_", reviewer).strip(".") or "_"
+        return os.path.join(directory, f"{base_name}_reviewed_{safe_reviewer}.csv")
+    timestamp = timestamp or datetime.now().strftime("%y%m%d")
+    return os.path.join(directory, f"{base_name}_reviewed_{timestamp}.csv")
+
+
+def journal_path(save_file_path):
+    return save_file_path + ".journal"
+
+
+def write_csv_atomic(data, path):
+    """Writes the DataFrame to a temp file next to path, then renames it over path."""
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        data.to_csv(tmp_path, index=False, encoding='utf-8-sig')  # Use 'utf-8-sig'
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class ReviewJournal:
+    """
+    Append-only write-ahead journal of comment edits.
+
+    Each edit is one JSON line {"id", "row", "comment", "ts"}, so a navigation click
+    costs a single small append instead of rewriting the whole CSV. Lines are flushed
+    immediately and fsynced at most every fsync_interval seconds (and on close).
+    compact() writes the full _reviewed_ CSV and empties the journal; replay() reads
+    edits that were not compacted yet, e.g. after a crash.
+    """
+    def __init__(self, path, fsync_interval=5.0):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.pending = 0  # edits appended since the last compaction
+        self._last_fsync = time.monotonic()
+        self._file = open(path, "a", encoding="utf-8")
+        # After a crash the last line may be torn; start a fresh line so the next
+        # entry is not glued onto it.
+        if self._file.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+
+    def record(self, patient_id, row, comment):
+        entry = {"id": str(patient_id), "row": int(row), "comment": comment,
+                 "ts": datetime.now().isoformat(timespec="seconds")}
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.pending += 1
+        if time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_fsync = time.monotonic()
+
+    def compact(self, data, save_file_path, export=True):
+        """Writes the full review CSV (the save file, so export is implied), then truncates the journal."""
+        self.sync()
+        write_csv_atomic(data, save_file_path)
+        self._file.seek(0)
+        self._file.truncate()
+        self.sync()
+        self.pending = 0
+
+    def clear(self):
+        self._file.seek(0)
+        self._file.truncate()
+        self.sync()
+        self.pending = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    @staticmethod
+    def replay(path):
+        """Returns the journal entries in order; a torn last line from a crash is skipped."""
+        entries = []
+        if not os.path.exists(path):
+            return entries
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return entries
+
+
+class BackgroundWriter:
+    """
+    Owns a ReviewJournal and does all review-file I/O on one worker thread.
+
+    submit() only records the edit in a dict keyed by row and returns at once, so a
+    burst of Next clicks is coalesced: the worker waits coalesce_s after the first
+    edit and then journals just the latest comment per row. request_compact() hands
+    over a snapshot DataFrame; the newest snapshot wins and is written atomically
+    (export=True asks a ReviewStore, which otherwise only commits, for the CSV too).
+    Failed writes are kept and retried. The Tk side polls status() from the main
+    thread; the worker never touches Tk.
+    """
+    def __init__(self, journal, save_file_path, coalesce_s=0.5, retry_s=5.0):
+        self.journal = journal
+        self.save_file_path = save_file_path
+        self.coalesce_s = coalesce_s
+        self.retry_s = retry_s
+        self._edits = {}          # row -> (patient_id, comment)
+        self._snapshot = None     # DataFrame waiting to be compacted
+        self._export = False      # whether that compaction was an explicit Save
+        self._busy = False
+        self._closing = False
+        self._cond = threading.Condition()
+        self.last_saved = None    # datetime of the last successful write
+        self.last_error = None
+        self._thread = threading.Thread(target=self._run, name="review-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def pending_edits(self):
+        """Edits journaled since the last compaction plus those still queued."""
+        return self.journal.pending + len(self._edits)
+
+    def submit(self, patient_id, row, comment):
+        with self._cond:
+            self._edits[row] = (patient_id, comment)
+            self._cond.notify()
+
+    def request_compact(self, snapshot, export=False):
+        with self._cond:
+            self._snapshot = snapshot
+            self._export = self._export or export
+            self._cond.notify()
+
+    def status(self):
+        with self._cond:
+            queued = len(self._edits) + (self._snapshot is not None)
+            return {"busy": self._busy or queued > 0, "last_saved": self.last_saved,
+                    "last_error": self.last_error}
+
+    def flush(self, timeout=None):
+        """Blocks until everything submitted so far is on disk (or timeout). Returns True if idle."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._edits or self._snapshot is not None or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=10.0):
+        self.flush(timeout)
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self.journal.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._edits or self._snapshot is not None or self._closing):
+                    self._cond.wait()
+                if self._closing and not self._edits and self._snapshot is None:
+                    return
+            # Let a burst of clicks accumulate before touching the disk.
+            if not self._closing:
+                time.sleep(self.coalesce_s)
+            with self._cond:
+                edits, self._edits = self._edits, {}
+                snapshot, self._snapshot = self._snapshot, None
+                export, self._export = self._export, False
+                self._busy = True
+            try:
+                # Compact first: edits queued after the snapshot was taken are not in
+                # it, so they must land in the fresh journal rather than be truncated.
+                if snapshot is not None:
+                    self.journal.compact(snapshot, self.save_file_path, export)
+                for row, (patient_id, comment) in edits.items():
+                    self.journal.record(patient_id, row, comment)
+                self.journal.sync()
+                self.last_saved = datetime.now()
+                self.last_error = None
+                failed = False
+            except Exception as e:
+                self.last_error = str(e)
+                failed = True
+                with self._cond:
+                    # Keep the failed work unless newer versions arrived meanwhile.
+                    for row, edit in edits.items():
+                        self._edits.setdefault(row, edit)
+                    if self._snapshot is None:
+                        self._snapshot = snapshot
+                    self._export = self._export or export
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+            if failed and not self._closing:
+                time.sleep(self.retry_s)
+
+
+def apply_journal(data, id_column, entries):
+    """
+    Applies journal entries to the Comments column, last edit winning. An entry goes
+    to its recorded row if that row still holds the same patient ID, otherwise to
+    every row with that ID. Returns the number of entries applied.
+    """
+    if not entries:
+        return 0
+    ids = data[id_column].astype(str)
+    rows_by_id = None
+    applied = 0
+    for entry in entries:
+        row = entry.get("row")
+        if row is not None and 0 <= row < len(data) and ids.iat[row] == entry["id"]:
+            data.loc[row, 'Comments'] = entry["comment"]
+            applied += 1
+            continue
+        if rows_by_id is None:
+            rows_by_id = ids.groupby(ids).groups
+        rows = rows_by_id.get(entry["id"])
+        if rows is not None:
+            data.loc[rows, 'Comments'] = entry["comment"]
+            applied += 1
+    return applied
+
+
+def detect_patient_id_column(columns):
+    possible_names = ['PatientID', 'patient_id', 'Patient Id', 'patientid']
+    for name in possible_names:
+        if name in columns:
+            return name
+    raise ValueError("No known patient ID column found.")
+
+
+def read_review_csv(path):
+    data = pd.read_csv(path, encoding='utf-8')  # Load with UTF-8 encoding
+    data.columns = data.columns.str.strip()  # Strip whitespace from column names
+    if 'Comments' not in data.columns:
+        data['Comments'] = ""  # Ensure the Comments column exists
+    # An all-empty Comments column is parsed as float NaN; keep it able to hold text.
+    data['Comments'] = data['Comments'].astype(object)
+    return data
+
+
+def reviewed_mask(comments):
+    """Boolean array: True where the comment is non-empty after stripping whitespace."""
+    return comments.fillna("").astype(str).str.strip().ne("").to_numpy(dtype=bool)
@@ -0,0 +1,157 @@
+import csv
+import importlib.util
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from reviewio import detect_patient_id_column
+
+SCAN_CHUNK = 8 * 1024 * 1024   # bytes per read when building the row index
+EXPORT_CHUNK_ROWS = 100_000    # rows per chunk when rewriting the full CSV
+
+# pyarrow parses the two key columns several times faster when it is installed.
+READ_ENGINE = "pyarrow" if importlib.util.find_spec("pyarrow") is not None else "c"
+
+
+def index_path(csv_path):
+    return csv_path + ".rowidx.npz"
+
+
+def read_header(path):
+    """Column names of a CSV as written (raw) and with whitespace stripped."""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        raw = next(csv.reader(f), [])
+    return raw, [name.strip() for name in raw]
+
+
+def scan_row_offsets(path, chunk_size=SCAN_CHUNK):
+    """
+    Byte ranges (starts, ends) of every data row in a CSV, header excluded.
+
+    Newlines inside quoted fields are skipped by tracking quote parity across the
+    whole file, and blank lines are dropped as pandas does, so row i here is row i
+    of pd.read_csv. One sequential pass, vectorised per chunk with numpy.
+    """
+    boundaries = []
+    parity = 0
+    position = 0
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(chunk_size)
+            if not buf:
+                break
+            a = np.frombuffer(buf, dtype=np.uint8)
+            # Running XOR of quote characters: 1 while inside a quoted field.
+            inside = np.bitwise_xor.accumulate((a == ord('"')).astype(np.uint8)) ^ parity
+            newlines = np.flatnonzero((a == ord("\n")) & (inside == 0))
+            boundaries.append(position + newlines + 1)
+            parity = int(inside[-1])
+            position += len(buf)
+    bounds = np.concatenate(boundaries) if boundaries else np.zeros(0, dtype=np.int64)
+    if len(bounds) == 0 or bounds[-1] < position:
+        bounds = np.append(bounds, position)  # last row without a trailing newline
+    starts, ends = bounds[:-1].astype(np.int64), bounds[1:].astype(np.int64)
+    lengths = ends - starts
+    keep = lengths > 2
+    if np.any(~keep):
+        # Rows of 1-2 bytes can only be "\n", "\r\n" or a one-character value; read those few.
+        with open(path, "rb") as f:
+            for i in np.flatnonzero(~keep):
+                f.seek(starts[i])
+                keep[i] = f.read(lengths[i]).strip() != b""
+    return starts[keep], ends[keep]
+
+
+def load_row_offsets(path):
+    """Row offsets from the .rowidx.npz sidecar if it matches the CSV, otherwise scanned and cached."""
+    stat = os.stat(path)
+    cache = index_path(path)
+    if os.path.exists(cache):
+        try:
+            with np.load(cache) as index:
+                if int(index["size"]) == stat.st_size and int(index["mtime_ns"]) == stat.st_mtime_ns:
+                    return index["starts"], index["ends"]
+        except (OSError, KeyError, ValueError):
+            pass
+    starts, ends = scan_row_offsets(path)
+    try:
+        np.savez(cache, starts=starts, ends=ends, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    except OSError:
+        pass  # read-only folder: just rescan next time
+    return starts, ends
+
+
+def read_columns(path, wanted):
+    """Reads only the named (stripped) columns as strings; missing ones are skipped."""
+    raw, stripped = read_header(path)
+    usecols = [r for r, s in zip(raw, stripped) if s in wanted]
+    data = pd.read_csv(path, usecols=usecols, dtype=str, encoding="utf-8", engine=READ_ENGINE)
+    data.columns = data.columns.str.strip()
+    return data
+
+
+class LazyReviewTable:
+    """
+    A review CSV opened without loading it.
+
+    Only the patient ID and Comments columns are materialised (keys()); any other
+    column of a single patient is read on demand with row(), which seeks straight to
+    the row through the byte-offset index. The index is cached next to the CSV
+    (<name>.csv.rowidx.npz), so after the first open startup is one small read of
+    the key columns and the cached index.
+    """
+    def __init__(self, path, id_column=None):
+        self.path = path
+        self.raw_columns, self.columns = read_header(path)
+        self.id_column = id_column or detect_patient_id_column(self.columns)
+        self.starts, self.ends = load_row_offsets(path)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def keys(self):
+        """DataFrame of [ID column, Comments] for every row; Comments is created if absent."""
+        data = read_columns(self.path, {self.id_column, "Comments"})
+        if len(data) != len(self):
+            raise ValueError(f"Row index of {self.path} is out of date ({len(self)} vs {len(data)} rows).")
+        if "Comments" not in data.columns:
+            data["Comments"] = ""
+        data["Comments"] = data["Comments"].astype(object)
+        return data
+
+    def row(self, index):
+        """All columns of one row as {column: value}, read from disk."""
+        with open(self.path, "rb") as f:
+            f.seek(self.starts[index])
+            raw = f.read(self.ends[index] - self.starts[index])
+        values = next(csv.reader(io.StringIO(raw.decode("utf-8"), newline="")), [])
+        return dict(zip(self.columns, values))
+
+    def snapshot(self, comments):
+        return LazySnapshot(self, comments)
+
+
+class LazySnapshot:
+    """
+    Review file contents = the source CSV with its Comments replaced by `comments`.
+
+    Provides DataFrame.to_csv's signature so write_csv_atomic and the background
+    writer can compact it like a DataFrame; the source is streamed in chunks, so
+    writing never needs the whole file in memory. Other columns are copied as text.
+    """
+    def __init__(self, table, comments):
+        self.table = table
+        self.comments = pd.Series(comments).reset_index(drop=True)
+
+    def to_csv(self, path, index=False, encoding="utf-8-sig"):
+        offset = 0
+        with open(path, "w", encoding=encoding, newline="") as f:
+            chunks = pd.read_csv(self.table.path, dtype=str, keep_default_na=False,
+                                 encoding="utf-8", chunksize=EXPORT_CHUNK_ROWS)
+            for number, chunk in enumerate(chunks):
+                chunk.columns = chunk.columns.str.strip()
+                chunk["Comments"] = self.comments.iloc[offset:offset + len(chunk)].to_numpy()
+                offset += len(chunk)
+                chunk.to_csv(f, index=index, header=number == 0)
@@ -0,0 +1,24 @@
+import numpy as np
+
+from reviewindex import PatientIndex
+
+
+def test_empty_list():
+    index = PatientIndex([], [])
+    assert len(index) == 0
+    assert len(index._starts) == len(index._pieces) == 0
+    assert index.find_prefix("1").size == 0
+    assert index.search_comments("x").size == 0
+    assert index.view("unreviewed").size == 0
+    assert index.next_unreviewed(0) is None
+
+
+def test_new_comments_are_searchable():
+    index = PatientIndex(["3", "1", "2"], ["", "Normal", ""])
+    index.set_comment(0, "Follow up")
+    index.set_comment(2, "normal variant")
+    assert len(index._starts) == len(index._pieces) == len(index.uniques)
+    np.testing.assert_array_equal(index.search_comments("normal"), [1, 2])
+    np.testing.assert_array_equal(index.search_comments("FOLLOW"), [0])
+    np.testing.assert_array_equal(index.view("unreviewed"), [])
+    np.testing.assert_array_equal(index.find_prefix("2"), [2])
@@ -0,0 +1,112 @@
+# async_search.py (Concurrent Batch Querying with Rate Limiting)
+
+import time
+import asyncio
+import statistics
+
+# --- Defaults ---
+DEFAULT_CONCURRENCY = 4      # batch requests in flight at once
+DEFAULT_RATE = 2.0           # requests per second (sustained)
+DEFAULT_BURST = 4            # requests allowed back to back before the rate applies
+DEFAULT_TIMEOUT = 60.0       # seconds per request
+
+
+class TokenBucket:
+    """Async token bucket: acquire() waits until a token is available, refilled at `rate` per second."""
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:  # one waiter refills at a time, so tokens are handed out in order
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+
+class CallStats:
+    """Per-call latency and outcome counts for one search."""
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.cancelled = 0
+        self.started_at = time.perf_counter()
+        self.elapsed = None
+
+    def summary(self):
+        lat = sorted(self.latencies)
+        text = f"{len(lat)} call(s), {self.errors} error(s), {self.cancelled} cancelled"
+        if lat:
+            p95 = lat[min(len(lat) - 1, int(round(0.95 * (len(lat) - 1))))]
+            text += (f"; latency mean {statistics.mean(lat):.2f}s, median {statistics.median(lat):.2f}s, "
+                     f"p95 {p95:.2f}s, max {lat[-1]:.2f}s")
+        if self.elapsed is not None:
+            text += f"; wall time {self.elapsed:.2f}s (sequential would be ~{sum(lat):.2f}s)"
+        return text
+
+
+async def generate_async(model, prompt, timeout=DEFAULT_TIMEOUT):
+    """Uses the model's native async call when it has one, else runs the blocking call in a thread."""
+    if hasattr(model, "generate_content_async"):
+        call = model.generate_content_async(prompt)
+    else:
+        call = asyncio.to_thread(model.generate_content, prompt)
+    return await asyncio.wait_for(call, timeout)
+
+
+async def search_batches_async(model, batches, build_prompt, match, concurrency=DEFAULT_CONCURRENCY,
+                               rate=DEFAULT_RATE, burst=DEFAULT_BURST, timeout=DEFAULT_TIMEOUT):
+    """
+    Sends every batch concurrently: at most `concurrency` requests in flight, started
+    no faster than the token bucket allows. build_prompt(batch) makes the prompt and
+    match(reply_text) returns a result or None. As soon as one batch yields a match
+    the outstanding requests are cancelled. Returns (batch number, result, stats);
+    batch number is None when nothing matched.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(rate, burst)
+    stats = CallStats()
+
+    async def run(number, batch):
+        async with semaphore:
+            await bucket.acquire()
+            print(f"🔎 Sending Batch {number} of {len(batches)}...")
+            started = time.perf_counter()
+            try:
+                response = await generate_async(model, build_prompt(batch), timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                stats.errors += 1
+                print(f"An error occurred during local search on Batch {number}: {e}")
+                return number, None
+            stats.latencies.append(time.perf_counter() - started)
+            result = match(response.text.strip())
+            if result is None:
+                print(f"No definitive match found in Batch {number}.")
+            return number, result
+
+    tasks = [asyncio.ensure_future(run(i + 1, batch)) for i, batch in enumerate(batches)]
+    found = (None, None)
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            number, result = await next_done
+            if result is not None:
+                found = (number, result)
+                break
+    finally:
+        pending = [t for t in tasks if not t.done()]
+        for task in pending:
+            task.cancel()
+        stats.cancelled = len(pending)
+        await asyncio.gather(*pending, return_exceptions=True)
+        stats.elapsed = time.perf_counter() - stats.started_at
+    return found[0], found[1], stats
@@ -0,0 +1,213 @@
+# bulk.py (Bulk Identification with Streaming, Resumable Results)
+
+import os
+import csv
+import json
+import time
+import argparse
+import threading
+import PIL.Image
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import main
+from main import IMAGE_DIR, add_search_arguments, identify_image, load_resources
+from service_common import IMAGE_EXTENSIONS, PhaseMetrics
+
+# --- Defaults ---
+DEFAULT_WORKERS = 4          # identifications running at once
+DEFAULT_DECODE_THREADS = 2   # threads decoding and hashing images ahead of them
+SUCCESS_STATUSES = ("LOCAL_SUCCESS", "WEB_SUCCESS")
+CSV_FIELDS = ["image", "status", "pill_id", "name", "text", "error",
+              "shape_s", "local_search_s", "web_s", "total_s"]
+
+
+# --- Inputs ---
+def list_inputs(source):
+    """
+    Image paths from a folder (every image file, sorted) or a manifest: a .csv with a
+    'path' or 'filename' column, or a text file with one path per line. Relative
+    manifest paths are taken from the manifest's folder.
+    """
+    if os.path.isdir(source):
+        return [os.path.join(source, name) for name in sorted(os.listdir(source))
+                if name.lower().endswith(IMAGE_EXTENSIONS)]
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, newline="", encoding="utf-8-sig") as f:
+        if source.lower().endswith(".csv"):
+            reader = csv.DictReader(f)
+            column = "path" if "path" in (reader.fieldnames or []) else "filename"
+            paths = [row[column] for row in reader if row.get(column)]
+        else:
+            paths = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    return [p if os.path.isabs(p) else os.path.join(base, p) for p in paths]
+
+
+# --- Output ---
+class ResultWriter:
+    """
+    Appends one record per finished image to a JSONL or CSV file (by extension) and
+    flushes it at once, so a crash loses at most the images still in flight.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.is_csv = path.lower().endswith(".csv")
+        self._lock = threading.Lock()
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new_file:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"  # a record cut off by a crash
+        self.file = open(path, "a", newline="", encoding="utf-8")
+        if not new_file and torn:
+            self.file.write("\n")
+        if self.is_csv:
+            self.csv = csv.DictWriter(self.file, fieldnames=CSV_FIELDS)
+            if new_file:
+                self.csv.writeheader()
+
+    def write(self, record):
+        with self._lock:
+            if self.is_csv:
+                row = {k: v for k, v in record.items() if k in CSV_FIELDS}
+                for name, seconds in record.get("timings", {}).items():
+                    row[f"{name}_s"] = f"{seconds:.3f}"
+                self.csv.writerow(row)
+            else:
+                self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def finished_images(path):
+    """Images that already have a successful record in a previous output (resume)."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            records = csv.DictReader(f)
+        else:
+            records = []
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue  # torn last line
+        for record in records:
+            if record.get("status") in SUCCESS_STATUSES:
+                done.add(record["image"])
+    return done
+
+
+# --- Pipeline ---
+def decode_image(path):
+    """Opens and fully decodes an image and warms the cache's image hash (decode threads)."""
+    img = PIL.Image.open(path)
+    img.load()
+    if isinstance(main.model, main.CachedModel):
+        main.model.hash_image(img)
+    return img
+
+
+def make_record(path, status, result, timings):
+    record = {"image": path, "status": status, "timings": timings}
+    if status == "LOCAL_SUCCESS":
+        record["pill_id"] = int(result['품목일련번호'])
+        record["name"] = str(result.get('품목명', ''))
+    elif status == "WEB_SUCCESS":
+        record["text"] = result
+    else:
+        record["status"] = "ERROR"
+        record["error"] = status
+    return record
+
+
+def run_bulk(paths, catalogue, pill_index, writer, workers=DEFAULT_WORKERS, decode_threads=DEFAULT_DECODE_THREADS,
+             async_mode=False, concurrency=main.DEFAULT_CONCURRENCY, rate=main.DEFAULT_RATE, use_vision=True):
+    """
+    Identifies every path with up to `workers` identifications at once. Decoding runs
+    ahead on its own pool, but at most 2 * workers decoded images wait in memory.
+    Each result is written as soon as it finishes; returns the PhaseMetrics.
+    """
+    metrics = PhaseMetrics()
+    ready = threading.BoundedSemaphore(2 * workers)
+
+    def decode(path):
+        ready.acquire()
+        try:
+            return decode_image(path)
+        except Exception:
+            ready.release()
+            raise
+
+    def identify(path, decoded):
+        timings = {}
+        metrics.begin()
+        status, result = "ERROR", None
+        try:
+            img = decoded.result()
+        except Exception as e:
+            status = f"❌ ERROR: Could not read image '{path}': {e}"
+        else:
+            try:
+                started = time.perf_counter()
+                status, result = identify_image(img, catalogue, pill_index, async_mode, concurrency, rate,
+                                                timings, use_vision)
+                timings["total"] = time.perf_counter() - started
+            except Exception as e:
+                status = f"❌ ERROR: Identification failed: {e}"
+            finally:
+                ready.release()
+        record = make_record(path, status, result, timings)
+        metrics.end(record["status"], timings)
+        writer.write(record)
+        return record
+
+    with ThreadPoolExecutor(decode_threads, thread_name_prefix="decode") as decoders, \
+            ThreadPoolExecutor(workers, thread_name_prefix="identify") as identifiers:
+        futures = [identifiers.submit(identify, path, decoders.submit(decode, path)) for path in paths]
+        for count, future in enumerate(as_completed(futures), start=1):
+            record = future.result()
+            label = record.get("name") or record.get("error") or "web result"
+            mark = "✅" if record["status"] in SUCCESS_STATUSES else "❌"
+            print(f"{mark} [{count}/{len(paths)}] {os.path.basename(record['image'])}: {record['status']} {label}")
+    return metrics
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Identify every pill image in a folder or manifest, streaming results to JSONL/CSV.")
+    parser.add_argument("source", nargs="?", default=IMAGE_DIR, help=f"Folder of images or manifest file (default: {IMAGE_DIR}).")
+    parser.add_argument("--out", default="bulk_results.jsonl", help="Results file (.jsonl or .csv); reruns resume from it.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Identifications running at once.")
+    parser.add_argument("--decode-threads", type=int, default=DEFAULT_DECODE_THREADS, help="Threads decoding images ahead.")
+    parser.add_argument("--restart", action="store_true", help="Ignore earlier results in --out and redo every image.")
+    add_search_arguments(parser)
+    args = parser.parse_args()
+
+    paths = list_inputs(args.source)
+    if args.restart and os.path.exists(args.out):
+        os.remove(args.out)
+    done = finished_images(args.out)
+    todo = [p for p in paths if p not in done]
+    print(f"Found {len(paths)} image(s); {len(paths) - len(todo)} already done in '{args.out}', {len(todo)} to go.")
+    if todo:
+        catalogue, pill_index = load_resources(args)
+        if catalogue is not None:
+            writer = ResultWriter(args.out)
+            started = time.perf_counter()
+            try:
+                metrics = run_bulk(todo, catalogue, pill_index, writer, args.workers, args.decode_threads,
+                                   args.async_mode, args.concurrency, args.rate, not args.no_vision)
+            finally:
+                writer.close()
+            elapsed = time.perf_counter() - started
+            report = metrics.snapshot()
+            print(f"\nFinished {len(todo)} image(s) in {elapsed:.1f}s ({len(todo) / elapsed:.2f} images/s): {report['statuses']}")
+            for name, phase in report["phases"].items():
+                if phase["count"]:
+                    print(f"  {name}: mean {phase['mean']:.2f}s, p95 {phase['p95']:.2f}s over {phase['count']} image(s)")
+            if isinstance(main.model, main.CachedModel):
+                print(main.model.cache.report())
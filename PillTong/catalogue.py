@@ -0,0 +1,137 @@
+# catalogue.py (Load-Time Candidate Catalogue with Binary Cache)
+
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from pill_index import color_tokens
+
+# --- Constants ---
+CATALOGUE_FORMAT = 2
+PROMPT_HEADER = "Here is a list of candidate pills from our database:\n\n"
+
+
+def render_snippets(df):
+    """
+    The per-pill prompt text used by the local search, for every row at once
+    (column-wise string concatenation instead of iterrows and +=).
+    """
+    def col(name, default):
+        if name in df.columns:
+            return df[name].astype(str)
+        return pd.Series(default, index=df.index)
+
+    snippets = ("- 품목일련번호 (ID): " + col('품목일련번호', 'N/A') + "\n"
+                + "  품목명 (Name): " + col('품목명', 'N/A') + "\n"
+                + "  각인 (Imprint): 앞 '" + col('표시앞', '') + "', 뒤 '" + col('표시뒤', '') + "'\n"
+                + "  모양 (Shape): " + col('제형', 'N/A') + "\n"
+                + "  색상 (Color): " + col('색상', 'N/A') + "\n\n")
+    return snippets.tolist()
+
+
+def catalogue_path_for(xlsx_path):
+    return os.path.splitext(xlsx_path)[0] + ".catalogue.pkl"
+
+
+class PillCatalogue:
+    """
+    Everything a query needs from the pill table, built once at load time:
+      - shape partitions: row positions per 제형, so filtering by shape is a dict
+        lookup and batches are position slices (no DataFrame scan or copy)
+      - colour partitions: row positions per 색상 word (a two-tone pill is in both)
+      - prompt snippets: the text of each pill for the local-search prompt, so a
+        batch prompt is one ''.join over its positions
+      - an ID -> row position dict for the final 품목일련번호 lookup
+    The whole object is pickled next to the database, keyed by the xlsx size and
+    mtime, so later starts skip pd.read_excel entirely.
+    """
+    def __init__(self, df, source_key=None):
+        self.df = df.reset_index(drop=True)
+        self.source_key = source_key
+        self.snippets = np.array(render_snippets(self.df), dtype=object)
+        shapes = self.df['제형'].astype(str) if '제형' in self.df.columns else pd.Series([""] * len(self.df))
+        self.shape_rows = {shape: np.asarray(rows, dtype=np.int64)
+                           for shape, rows in shapes.groupby(shapes, sort=False).indices.items()}
+        colors = self.df['색상'].tolist() if '색상' in self.df.columns else []
+        color_lists = {}
+        for position, text in enumerate(colors):
+            for color in color_tokens(text):
+                color_lists.setdefault(color, []).append(position)
+        self.color_rows = {color: np.asarray(rows, dtype=np.int64) for color, rows in color_lists.items()}
+        ids = self.df['품목일련번호'].tolist() if '품목일련번호' in self.df.columns else []
+        self.id_to_row = {}
+        for position, pill_id in enumerate(ids):
+            self.id_to_row.setdefault(int(pill_id), position)  # first row wins, as with iloc[0]
+
+    def __len__(self):
+        return len(self.df)
+
+    def all_rows(self):
+        return np.arange(len(self.df))
+
+    def rows_for_shape(self, shape):
+        """Row positions with this 제형 (empty if none)."""
+        return self.shape_rows.get(shape, np.zeros(0, dtype=np.int64))
+
+    def rows_for_colors(self, colors, within=None):
+        """Row positions having any of these 색상 words, optionally restricted to `within` (order kept)."""
+        parts = [self.color_rows[c] for c in colors if c in self.color_rows]
+        rows = np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+        if within is not None:
+            rows = within[np.isin(within, rows)]
+        return rows
+
+    def prompt_text(self, positions):
+        """The candidate list for a prompt, for the given row positions."""
+        return PROMPT_HEADER + "".join(self.snippets[positions])
+
+    def lookup(self, pill_id):
+        """The row for a 품목일련번호, or None."""
+        position = self.id_to_row.get(int(pill_id))
+        return None if position is None else self.df.iloc[position]
+
+    # --- Binary cache ---
+    @staticmethod
+    def source_key_for(xlsx_path):
+        stat = os.stat(xlsx_path)
+        return (CATALOGUE_FORMAT, stat.st_size, stat.st_mtime_ns)
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load_or_build(cls, xlsx_path, loader, cache_path=None):
+        """
+        Returns the cached catalogue if it was built from this xlsx (same size and
+        mtime); otherwise loader(xlsx_path) reads the DataFrame, and the catalogue is
+        built and cached. Returns None if the loader fails.
+        """
+        cache_path = cache_path or catalogue_path_for(xlsx_path)
+        if not os.path.exists(xlsx_path):
+            return cls._build(xlsx_path, loader, cache_path, None)
+        key = cls.source_key_for(xlsx_path)
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, "rb") as f:
+                    catalogue = pickle.load(f)
+                if isinstance(catalogue, cls) and catalogue.source_key == key:
+                    print(f"✅ Loaded {len(catalogue)} pills from the catalogue cache {cache_path}")
+                    return catalogue
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable catalogue cache '{cache_path}': {e}")
+        return cls._build(xlsx_path, loader, cache_path, key)
+
+    @classmethod
+    def _build(cls, xlsx_path, loader, cache_path, key):
+        df = loader(xlsx_path)
+        if df is None:
+            return None
+        catalogue = cls(df, key)
+        try:
+            catalogue.save(cache_path)
+        except OSError as e:
+            print(f"⚠️ Could not save the catalogue cache: {e}")
+        return catalogue
@@ -0,0 +1,66 @@
+# fake_model.py (Offline Stand-in for the Gemini Model)
+
+import re
+import json
+import time
+import random
+import asyncio
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """
+    Answers the prompts main.py sends without any network access, for offline tests
+    and benchmarks. It "sees" the pill whose 품목일련번호 is target_id:
+      - shape question        -> that pill's 제형
+      - feature question      -> JSON with its 제형, 색상, 표시앞 and 표시뒤
+      - database batch prompt -> target_id if it is listed in the batch, else NO_MATCH_FOUND
+      - anything else (web)   -> a canned description
+    Each call sleeps a random latency in `latency` seconds (time.sleep, or asyncio.sleep
+    for generate_content_async); calls are counted in .calls.
+    """
+    def __init__(self, pill_database_df=None, target_id=None, latency=(0.2, 0.8), seed=0):
+        self.target = None
+        if pill_database_df is not None and target_id is not None:
+            rows = pill_database_df[pill_database_df['품목일련번호'] == int(target_id)]
+            if not rows.empty:
+                self.target = rows.iloc[0]
+        self.target_id = target_id
+        self.model_name = f"fake-model:{target_id}"  # cache key: answers depend on the target
+        self.is_fake = True
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def _answer(self, prompt):
+        self.calls += 1
+        text = "\n".join(p for p in prompt if isinstance(p, str)) if isinstance(prompt, (list, tuple)) else str(prompt)
+        target = self.target
+        if "--- Database Batch ---" in text:
+            listed = re.findall(r"품목일련번호 \(ID\): (\d+)", text)
+            return str(self.target_id) if str(self.target_id) in listed else "NO_MATCH_FOUND"
+        if "JSON object" in text:
+            if target is None:
+                return "{}"
+            return json.dumps({"shape": str(target.get('제형', '')), "color": str(target.get('색상', '')),
+                               "imprint_front": str(target.get('표시앞', '')), "imprint_back": str(target.get('표시뒤', ''))},
+                              ensure_ascii=False)
+        if "2D shape" in text:
+            return str(target.get('제형', '기타')) if target is not None else "기타"
+        return "A white round tablet (offline fake model: no web search performed)."
+
+    def _delay(self):
+        low, high = self.latency
+        return self.random.uniform(low, high)
+
+    def generate_content(self, prompt, request_options=None):
+        time.sleep(self._delay())
+        return FakeResponse(self._answer(prompt))
+
+    async def generate_content_async(self, prompt, request_options=None):
+        await asyncio.sleep(self._delay())
+        return FakeResponse(self._answer(prompt))
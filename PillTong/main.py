@@ -3,30 +3,81 @@
 import os
 import argparse
 import pandas as pd
-import google.generativeai as genai
-from dotenv import load_dotenv
+import numpy as np
 import PIL.Image
 import math
+import json
+import time
+import asyncio
+import contextlib
+from pill_index import COLOR_LIST, PillIndex, database_version, index_path_for
+from async_search import DEFAULT_CONCURRENCY, DEFAULT_RATE, search_batches_async
+from response_cache import DEFAULT_MAX_BYTES, CachedModel, ResponseCache
+from catalogue import PROMPT_HEADER, PillCatalogue, render_snippets
 
 # --- Constants ---
 SECRETS_DIR = "secrets"
 DATABASE_PATH = os.path.join(SECRETS_DIR, "tablet_info.xlsx")
 IMAGE_DIR = "sample_images"
+CACHE_PATH = os.path.join(SECRETS_DIR, "response_cache.sqlite")
+FAKE_CACHE_PATH = os.path.join(SECRETS_DIR, "response_cache.fake.sqlite")  # never mixed with real answers
 LOCAL_SEARCH_BATCH_SIZE = 300
+SHORTLIST_SIZE = 30  # candidates sent to the model after local retrieval
+SHAPE_LIST = "마름모형, 반원형, 사각형, 삼각형, 오각형, 원형, 육각형, 장방형, 타원형, 팔각형, 기타"
+
+# --- Model (set by configure_model) ---
+model = None
 
 # --- Configuration ---
-load_dotenv(dotenv_path=os.path.join(SECRETS_DIR, ".env"))
-try:
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        raise KeyError
-    genai.configure(api_key=api_key)
-except KeyError:
-    print("❌ ERROR: GEMINI_API_KEY not found. Please check your .env file inside the 'secrets' folder.")
-    exit()
-
-# --- Model Initialization ---
-model = genai.GenerativeModel('gemini-1.5-flash')
+def configure_model(fake_target_id=None, pill_database_df=None):
+    """
+    Sets up the module-level model: Gemini with the key from secrets/.env, or with
+    fake_target_id an offline FakeModel that recognises that pill (no API key needed).
+    """
+    global model
+    if fake_target_id is not None:
+        from fake_model import FakeModel
+        model = FakeModel(pill_database_df, fake_target_id)
+        print(f"⚠️ Using the offline fake model (pretending the image is pill {fake_target_id}).")
+        return model
+
+    import google.generativeai as genai
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=os.path.join(SECRETS_DIR, ".env"))
+    try:
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            raise KeyError
+        genai.configure(api_key=api_key)
+    except KeyError:
+        print("❌ ERROR: GEMINI_API_KEY not found. Please check your .env file inside the 'secrets' folder.")
+        exit()
+
+    # --- Model Initialization ---
+    model = genai.GenerativeModel('gemini-1.5-flash')
+    return model
+
+def enable_cache(db_version, cache_path=None, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Wraps the configured model in a persistent response cache (see response_cache).
+    Entries are keyed by the model's name, and the offline fake model gets its own
+    cache file, so its canned answers never come back as real results.
+    """
+    global model
+    if cache_path is None:
+        cache_path = FAKE_CACHE_PATH if getattr(model, "is_fake", False) else CACHE_PATH
+    model = CachedModel(model, ResponseCache(cache_path, max_bytes), db_version)
+    return model
+
+@contextlib.contextmanager
+def timed_phase(timings, name):
+    """Adds the time spent in the block to timings[name] (no-op when timings is None)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
 
 # --- Helper functions (load_pill_database and format helpers are unchanged) ---
 def load_pill_database(xlsx_path):
@@ -55,7 +106,7 @@ def get_pill_shape(image_obj):
     print("Pre-analysis: Determining pill shape...")
     try:
         # Provide the exact list of possible shapes to the LLM
-        shape_list = "마름모형, 반원형, 사각형, 삼각형, 오각형, 원형, 육각형, 장방형, 타원형, 팔각형, 기타"
+        shape_list = SHAPE_LIST
         shape_prompt = [
             f"Analyze the 2D shape of the pill in the image. "
             f"Respond with ONLY ONE of the following Korean words from this list: {shape_list}.",
@@ -75,17 +126,75 @@ def get_pill_shape(image_obj):
         print(f"⚠️ Could not determine shape from image. Error: {e}")
         return None
 
+def estimate_locally(image_obj):
+    """Local shape/colour estimate from the photo (see vision), or None if OpenCV is not installed."""
+    try:
+        from vision import estimate_features
+    except ImportError as e:
+        print(f"⚠️ Local pre-filter unavailable ({e}). Asking the model for the shape.")
+        return None
+    return estimate_features(image_obj)
+
+def get_pill_features(image_obj, estimate=None):
+    """
+    Asks the LLM once for every feature the local index searches on: shape, colour
+    and the imprint on each face. When the local estimate (see vision) is confident
+    about shape and colour, only the imprint is asked for and the local values are
+    used. Returns a dict, or None if the reply is unusable.
+    """
+    known = {}
+    if estimate is not None and estimate.shape_confident and estimate.color_confident:
+        known = {"shape": estimate.shape, "color": estimate.color}
+        print(f"Pre-analysis: Shape and color read locally ({known['shape']}, {known['color']}); reading imprint...")
+        keys = []
+    else:
+        print("Pre-analysis: Reading pill shape, color and imprint...")
+        keys = [f'"shape": ONE of these Korean words: {SHAPE_LIST}.',
+                f'"color": the Korean color name(s) from this list, comma separated: {COLOR_LIST}.']
+    try:
+        features_prompt = [
+            "Describe the pill in the image as a JSON object with exactly these keys:",
+            *keys,
+            '"imprint_front" and "imprint_back": the exact letters/numbers printed or engraved on each face, '
+            'or "" if a face is not visible or has no imprint.',
+            "Respond with ONLY the JSON object.",
+            image_obj
+        ]
+        response = model.generate_content(features_prompt, request_options={'timeout': 20})
+        text = response.text.strip().strip("`")
+        if text.startswith("json"):
+            text = text[4:]
+        features = json.loads(text)
+        features.update(known)
+        if features.get("shape") not in SHAPE_LIST.split(', '):
+            features["shape"] = None  # unknown shape: do not score on it
+        print(f"Detected features: {features}")
+        return features
+    except Exception as e:
+        print(f"⚠️ Could not read pill features from image. Error: {e}")
+        return None
+
+def build_local_prompt(database_text, img):
+    """Prompt asking the model to pick one candidate from database_text (or NO_MATCH_FOUND)."""
+    return [
+        "You are a pill identification expert. Your task is to identify the pill in the image using ONLY the provided database text.",
+        "Carefully compare the image's features (shape, color, imprint) to each entry in the list.",
+        "If you find a confident match, respond with ONLY the '품목일련번호 (ID)' of that pill and nothing else.",
+        "If you CANNOT find a confident match in this batch, respond with the exact keyword: NO_MATCH_FOUND",
+        "\n--- Database Batch ---\n", database_text,
+        "\n--- Image to Analyze ---\n", img
+    ]
+
+def match_local_result(local_result, catalogue):
+    """The database row for a model reply naming a pill ID, or None for NO_MATCH_FOUND / unknown IDs."""
+    if local_result != "NO_MATCH_FOUND" and local_result.isdigit():
+        return catalogue.lookup(local_result)
+    return None
+
 def format_database_for_prompt(df):
     """Formats the DataFrame into a detailed string for the LLM's local search."""
-    # This function remains the same
-    formatted_string = "Here is a list of candidate pills from our database:\n\n"
-    for index, row in df.iterrows():
-        formatted_string += f"- 품목일련번호 (ID): {row.get('품목일련번호', 'N/A')}\n"
-        formatted_string += f"  품목명 (Name): {row.get('품목명', 'N/A')}\n"
-        formatted_string += f"  각인 (Imprint): 앞 '{row.get('표시앞', '')}', 뒤 '{row.get('표시뒤', '')}'\n"
-        formatted_string += f"  모양 (Shape): {row.get('제형', 'N/A')}\n"
-        formatted_string += f"  색상 (Color): {row.get('색상', 'N/A')}\n\n"
-    return formatted_string
+    # The search itself uses the catalogue's precomputed snippets (PillCatalogue.prompt_text)
+    return PROMPT_HEADER + "".join(render_snippets(df))
 
 def format_pill_details(pill_row):
     """Formats a single row of pill data into the final user-facing output."""
@@ -103,57 +212,165 @@ def format_pill_details(pill_row):
     )
     return details
 
-def identify_pill(image_path, pill_database_df):
-    """Performs identification by pre-filtering by SHAPE, then batch iterating."""
+def search_shortlist(img, catalogue, pill_index, top_k=SHORTLIST_SIZE, timings=None, estimate=None):
+    """
+    Local retrieval: one feature-reading call (imprint only when the local estimate
+    already gives shape and colour), a millisecond index lookup, then ONE call with
+    the top_k shortlist. Returns (status, row) like identify_pill, with status None
+    when the features could not be read (caller falls back to batches).
+    """
+    with timed_phase(timings, "shape"):
+        features = get_pill_features(img, estimate)
+    if features is None:
+        return None, None
+    with timed_phase(timings, "local_search"):
+        top, scores = pill_index.search(top_k, shape=features.get("shape"), color=features.get("color"),
+                                        imprint_front=features.get("imprint_front"),
+                                        imprint_back=features.get("imprint_back"))
+        if len(top) == 0:
+            print("No local candidates.")
+            return "NO_MATCH", None
+        print(f"\n---------------------------\nSTEP 1: 🔎 Checking the {len(top)} closest local candidates "
+              f"(best score {scores[0]:.2f})...")
+        try:
+            response = model.generate_content(build_local_prompt(catalogue.prompt_text(top), img))
+            matched_row = match_local_result(response.text.strip(), catalogue)
+            if matched_row is not None:
+                print(f"✅ Match found in shortlist! Pill ID: {matched_row['품목일련번호']}")
+                return "LOCAL_SUCCESS", matched_row
+            print("No definitive match found in the shortlist.")
+        except Exception as e:
+            print(f"An error occurred during the shortlist search: {e}")
+    return "NO_MATCH", None
+
+def identify_pill(image_path, catalogue, pill_index=None, async_mode=False,
+                  concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, timings=None, use_vision=True):
+    """
+    Identifies via the local index shortlist when pill_index is given; otherwise (or
+    if the pill's features cannot be read) pre-filters by SHAPE, then batch iterates.
+    With async_mode the batches are sent concurrently (see async_search). If a
+    timings dict is given, seconds per phase (shape, local_search, web) are added to it.
+    With use_vision the shape (and colour) come from the photo itself when the local
+    estimate is confident, saving the shape call.
+    """
     if not os.path.exists(image_path):
         return f"❌ ERROR: Image file not found at '{image_path}'", None
 
     img = PIL.Image.open(image_path)
+    return identify_image(img, catalogue, pill_index, async_mode, concurrency, rate, timings, use_vision)
 
-    # --- UPDATED: Phase 1: Pre-filter database by SHAPE ---
-    extracted_shape = get_pill_shape(img)
+def identify_image(img, catalogue, pill_index=None, async_mode=False,
+                   concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, timings=None, use_vision=True):
+    """identify_pill for an already opened image (used by the server)."""
+    # --- Cached final answer for this exact image: no API calls at all ---
+    if isinstance(model, CachedModel):
+        cached = model.get_final(img)
+        if cached is not None:
+            print("✅ Found this image in the response cache.")
+            if cached["status"] == "LOCAL_SUCCESS":
+                matched_row = catalogue.lookup(cached["value"])
+                if matched_row is not None:
+                    return "LOCAL_SUCCESS", matched_row
+            elif cached["status"] == "WEB_SUCCESS":
+                return "WEB_SUCCESS", cached["value"]
+
+    status, result = search_pill(img, catalogue, pill_index, async_mode, concurrency, rate, timings, use_vision)
+    if isinstance(model, CachedModel):
+        if status == "LOCAL_SUCCESS":
+            model.put_final(img, status, int(result['품목일련번호']))
+        elif status == "WEB_SUCCESS":
+            model.put_final(img, status, result)
+    return status, result
+
+def search_pill(img, catalogue, pill_index=None, async_mode=False,
+                concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, timings=None, use_vision=True):
+    """The search steps of identify_pill for an opened image."""
+    with timed_phase(timings, "shape"):
+        estimate = estimate_locally(img) if use_vision else None
+    if pill_index is not None:
+        status, matched_row = search_shortlist(img, catalogue, pill_index, timings=timings, estimate=estimate)
+        if status == "LOCAL_SUCCESS":
+            return status, matched_row
+        if status == "NO_MATCH":
+            with timed_phase(timings, "web"):
+                return web_search(img)
+        print("⚠️ Falling back to shape-filtered batch search.")
+
+    # --- UPDATED: Phase 1: Pre-filter database by SHAPE (locally when the photo is clear) ---
+    with timed_phase(timings, "shape"):
+        if estimate is not None and estimate.shape_confident:
+            extracted_shape = estimate.shape
+            print(f"Detected shape locally: {extracted_shape} (confidence {estimate.shape_confidence:.2f})")
+        else:
+            extracted_shape = get_pill_shape(img)
     if extracted_shape:
-        # Use an exact match for the shape category
-        candidates_df = pill_database_df[pill_database_df['제형'] == extracted_shape].copy()
-        print(f"Found {len(candidates_df)} candidates matching the shape '{extracted_shape}'.")
+        # Use an exact match for the shape category (precomputed row positions)
+        candidates = catalogue.rows_for_shape(extracted_shape)
+        print(f"Found {len(candidates)} candidates matching the shape '{extracted_shape}'.")
     else:
         print("⚠️ Could not determine shape. All pills in the database will be searched.")
-        candidates_df = pill_database_df.copy()
+        candidates = catalogue.all_rows()
+
+    # --- Candidates of the detected colour go first; the rest of the shape only if they fail ---
+    color_rows = None
+    if estimate is not None and estimate.color_confident:
+        color_rows = catalogue.rows_for_colors(estimate.colors, within=candidates)
+        print(f"{len(color_rows)} of them match the color '{estimate.color}' and are searched first.")
+
+    with timed_phase(timings, "local_search"):
+        matched_row = None
+        if color_rows is not None and len(color_rows):
+            matched_row = search_batches(img, catalogue, color_rows, async_mode, concurrency, rate)
+            candidates = candidates[~np.isin(candidates, color_rows)]
+        if matched_row is None:
+            matched_row = search_batches(img, catalogue, candidates, async_mode, concurrency, rate)
+    if matched_row is not None:
+        return "LOCAL_SUCCESS", matched_row
+    with timed_phase(timings, "web"):
+        return web_search(img)
 
-    # --- Iterative Batch Search Logic (Unchanged) ---
-    if not candidates_df.empty:
-        num_batches = math.ceil(len(candidates_df) / LOCAL_SEARCH_BATCH_SIZE)
+def search_batches(img, catalogue, candidates, async_mode=False,
+                   concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE):
+    """Sends the candidate row positions to the model in batches; returns the matched row or None."""
+    # --- Iterative Batch Search Logic (batches are slices of row positions) ---
+    if len(candidates) and async_mode:
+        batches = [candidates[start:start + LOCAL_SEARCH_BATCH_SIZE]
+                   for start in range(0, len(candidates), LOCAL_SEARCH_BATCH_SIZE)]
+        print(f"\n---------------------------\nSTEP 1: 🔎 Searching {len(batches)} batch(es) concurrently "
+              f"(up to {concurrency} at a time, {rate:g} requests/s)...")
+        number, matched_row, stats = asyncio.run(search_batches_async(
+            model, batches,
+            build_prompt=lambda positions: build_local_prompt(catalogue.prompt_text(positions), img),
+            match=lambda text: match_local_result(text, catalogue),
+            concurrency=concurrency, rate=rate))
+        print(f"Batch calls: {stats.summary()}")
+        if matched_row is not None:
+            print(f"✅ Match found in Batch {number}! Pill ID: {matched_row['품목일련번호']}")
+            return matched_row
+    elif len(candidates):
+        num_batches = math.ceil(len(candidates) / LOCAL_SEARCH_BATCH_SIZE)
         print(f"Beginning local search in {num_batches} batch(es)...")
 
         for i in range(num_batches):
             print(f"\n---------------------------\nSTEP 1: 🔎 Searching Batch {i+1} of {num_batches}...")
             start_index = i * LOCAL_SEARCH_BATCH_SIZE
             end_index = start_index + LOCAL_SEARCH_BATCH_SIZE
-            batch_df = candidates_df.iloc[start_index:end_index]
-            database_text = format_database_for_prompt(batch_df)
-            local_prompt = [
-                "You are a pill identification expert. Your task is to identify the pill in the image using ONLY the provided database text.",
-                "Carefully compare the image's features (shape, color, imprint) to each entry in the list.",
-                "If you find a confident match, respond with ONLY the '품목일련번호 (ID)' of that pill and nothing else.",
-                "If you CANNOT find a confident match in this batch, respond with the exact keyword: NO_MATCH_FOUND",
-                "\n--- Database Batch ---\n", database_text,
-                "\n--- Image to Analyze ---\n", img
-            ]
+            database_text = catalogue.prompt_text(candidates[start_index:end_index])
+            local_prompt = build_local_prompt(database_text, img)
             try:
                 response = model.generate_content(local_prompt)
-                local_result = response.text.strip()
-                if local_result != "NO_MATCH_FOUND" and local_result.isdigit():
-                    pill_id = int(local_result)
-                    matched_row = pill_database_df[pill_database_df['품목일련번호'] == pill_id]
-                    if not matched_row.empty:
-                        print(f"✅ Match found in Batch {i+1}! Pill ID: {pill_id}")
-                        return "LOCAL_SUCCESS", matched_row.iloc[0]
-                else:
-                    print(f"No definitive match found in Batch {i+1}.")
+                matched_row = match_local_result(response.text.strip(), catalogue)
+                if matched_row is not None:
+                    print(f"✅ Match found in Batch {i+1}! Pill ID: {matched_row['품목일련번호']}")
+                    return matched_row
+                print(f"No definitive match found in Batch {i+1}.")
             except Exception as e:
                 print(f"An error occurred during local search on Batch {i+1}: {e}")
                 print("Moving to the next batch or web search.")
 
+    return None
+
+def web_search(img):
     # --- Step 2: Web Search (Unchanged) ---
     print("\n---------------------------\nSTEP 2: 🌐 Local search complete. No match found. Performing web search...")
     web_prompt = [
@@ -167,15 +384,46 @@ def identify_pill(image_path, pill_database_df):
     except Exception as e:
         return f"An error occurred during web search API call: {e}", None
 
+# --- Startup (shared with server.py) ---
+def add_search_arguments(parser):
+    """The search, model and cache options common to the CLI and the server."""
+    parser.add_argument("--no-index", action="store_true", help="Skip the local index and search all shape-matched batches.")
+    parser.add_argument("--async", dest="async_mode", action="store_true", help="Send the batch queries concurrently.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Batch requests in flight at once (--async).")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Maximum requests per second (--async).")
+    parser.add_argument("--fake-model", metavar="PILL_ID", help="Offline test: a fake model that 'sees' this 품목일련번호.")
+    parser.add_argument("--no-vision", action="store_true", help="Always ask the model for the shape (no local pre-filter).")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the model, ignoring the response cache.")
+    parser.add_argument("--cache-size-mb", type=float, default=DEFAULT_MAX_BYTES / 2**20, help="Response cache size limit.")
+
+def load_resources(args):
+    """
+    Loads everything a lookup needs: the catalogue, the model (plus cache) and the
+    local index. Returns (catalogue, pill_index), or (None, None) if the database failed.
+    """
+    catalogue = PillCatalogue.load_or_build(DATABASE_PATH, load_pill_database)
+    if catalogue is None:
+        return None, None
+    configure_model(args.fake_model, catalogue.df)
+    db_version = database_version(DATABASE_PATH)
+    if not args.no_cache:
+        enable_cache(db_version, max_bytes=int(args.cache_size_mb * 2**20))
+    pill_index = None
+    if not args.no_index:
+        pill_index = PillIndex.load_or_build(catalogue.df, index_path_for(DATABASE_PATH), db_version)
+    return catalogue, pill_index
+
 # --- Main Execution (Unchanged) ---
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Identify a pill using an image and an Excel database, with a web fallback.")
     parser.add_argument("image_filename", help=f"The filename of the pill image (must be in the '{IMAGE_DIR}' folder).")
+    add_search_arguments(parser)
     args = parser.parse_args()
-    pill_db = load_pill_database(DATABASE_PATH)
-    if pill_db is not None:
+    catalogue, pill_index = load_resources(args)
+    if catalogue is not None:
         image_path = os.path.join(IMAGE_DIR, args.image_filename)
-        status, result = identify_pill(image_path, pill_db)
+        status, result = identify_pill(image_path, catalogue, pill_index, args.async_mode,
+                                       args.concurrency, args.rate, use_vision=not args.no_vision)
         print("\n--- Identification Result ---")
         if status == "LOCAL_SUCCESS":
             formatted_details = format_pill_details(result)
@@ -186,4 +434,6 @@ if __name__ == "__main__":
         else:
             print(status)
         print("---------------------------\n")
+        if isinstance(model, CachedModel):
+            print(model.cache.report())
         print("IMPORTANT: This is an experimental tool. Always consult a doctor or pharmacist for definitive pill ID.")
\ No newline at end of file
@@ -0,0 +1,202 @@
+# pill_index.py (Local Retrieval Index for Shortlisting Candidates)
+
+import os
+import re
+import hashlib
+import unicodedata
+import numpy as np
+import pandas as pd
+
+# --- Constants ---
+INDEX_FORMAT = 2
+NGRAM_SIZES = (1, 2, 3)
+# Score = imprint similarity and categorical matches, weighted.
+IMPRINT_WEIGHT = 0.6
+COLOR_WEIGHT = 0.25
+SHAPE_WEIGHT = 0.15
+COLOR_LIST = "하양, 노랑, 주황, 분홍, 빨강, 갈색, 연두, 초록, 청록, 파랑, 남색, 자주, 보라, 회색, 검정, 투명"
+
+# Words the database uses for non-text marks; they are not part of the imprint text.
+_IMPRINT_STOPWORDS = ("분할선", "마크", "없음")
+
+
+# --- Normalisation helpers ---
+def normalize_imprint(text):
+    """Upper-cased NFKC imprint with marks, spaces and punctuation removed ('dx-2 분할선' -> 'DX2')."""
+    if text is None or (isinstance(text, float) and np.isnan(text)):
+        return ""
+    text = unicodedata.normalize("NFKC", str(text)).upper()
+    if text.strip() == "NAN":  # a missing value written out as text, not an imprint
+        return ""
+    for word in _IMPRINT_STOPWORDS:
+        text = text.replace(word.upper(), " ")
+    return "".join(ch for ch in text if ch.isalnum())
+
+
+def imprint_ngrams(front, back):
+    """
+    Character n-grams of both faces. Front and back are pooled, so a photo of either
+    side (or a model that swaps them) still matches.
+    """
+    grams = set()
+    for face in (normalize_imprint(front), normalize_imprint(back)):
+        for n in NGRAM_SIZES:
+            grams.update(face[i:i + n] for i in range(len(face) - n + 1))
+    return grams
+
+
+def color_tokens(text):
+    """'하양, 노랑' / '하양|노랑' / '하양 노랑' -> {'하양', '노랑'}"""
+    if text is None or (isinstance(text, float) and np.isnan(text)):
+        return set()
+    return {t for t in re.split(r"[\s,|/·]+", str(text).strip()) if t}
+
+
+def database_version(xlsx_path):
+    """Content hash of the database file: any edit invalidates indexes and caches built from it."""
+    digest = hashlib.sha1()
+    with open(xlsx_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def index_path_for(xlsx_path):
+    return os.path.splitext(xlsx_path)[0] + ".index.npz"
+
+
+# --- Index ---
+class PillIndex:
+    """
+    Local retrieval over the pill table by imprint, colour and shape.
+
+    Imprints become character 1-3 grams weighted by IDF and stored as an inverted
+    index (one array of row numbers per n-gram), so a query touches only the rows
+    that share an n-gram with it and scores them with one np.bincount. Colour and
+    shape are integer-coded categorical columns compared with numpy. The arrays are
+    saved as one .npz next to the database and reused while the database is unchanged.
+    """
+    def __init__(self, grams, offsets, postings, idf, norms, color_codes, color_vocab, shape_codes, shape_vocab,
+                 version):
+        self.grams = grams
+        self.offsets = offsets
+        self.postings = postings
+        self.idf = idf
+        self.norms = norms
+        self.color_codes = color_codes    # (rows, max colours per pill), -1 padded
+        self.color_vocab = list(color_vocab)
+        self.shape_codes = shape_codes
+        self.shape_vocab = list(shape_vocab)
+        self.version = version
+        self._gram_lookup = {g: i for i, g in enumerate(self.grams)}
+        self._color_lookup = {c: i for i, c in enumerate(self.color_vocab)}
+        self._shape_lookup = {s: i for i, s in enumerate(self.shape_vocab)}
+
+    def __len__(self):
+        return len(self.norms)
+
+    # --- Building and persistence ---
+    @classmethod
+    def build(cls, df, version=None):
+        n = len(df)
+        front = df["표시앞"] if "표시앞" in df.columns else pd.Series([""] * n)
+        back = df["표시뒤"] if "표시뒤" in df.columns else pd.Series([""] * n)
+        row_grams = [imprint_ngrams(f, b) for f, b in zip(front.tolist(), back.tolist())]
+
+        # Inverted index: postings[offsets[g]:offsets[g+1]] are the rows containing gram g.
+        pairs = [(g, row) for row, grams in enumerate(row_grams) for g in grams]
+        grams = np.array(sorted({g for g, _ in pairs}), dtype=object)
+        lookup = {g: i for i, g in enumerate(grams)}
+        gram_ids = np.fromiter((lookup[g] for g, _ in pairs), dtype=np.int64, count=len(pairs))
+        rows = np.fromiter((row for _, row in pairs), dtype=np.int32, count=len(pairs))
+        order = np.argsort(gram_ids, kind="stable")
+        postings = rows[order]
+        counts = np.bincount(gram_ids, minlength=len(grams))
+        offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        idf = np.log((1.0 + n) / (1.0 + counts)) + 1.0
+        norms = np.sqrt(np.bincount(rows, weights=idf[gram_ids] ** 2, minlength=n))
+
+        colors = [sorted(color_tokens(c)) for c in (df["색상"] if "색상" in df.columns else [""] * n)]
+        color_vocab = sorted({c for cs in colors for c in cs})
+        color_lookup = {c: i for i, c in enumerate(color_vocab)}
+        width = max([len(cs) for cs in colors] + [1])
+        color_codes = np.full((n, width), -1, dtype=np.int16)
+        for row, cs in enumerate(colors):
+            color_codes[row, :len(cs)] = [color_lookup[c] for c in cs]
+
+        shapes = (df["제형"] if "제형" in df.columns else pd.Series([""] * n)).astype(str).str.strip()
+        shape_codes, shape_vocab = pd.factorize(shapes)
+        return cls(grams, offsets, postings, idf, norms, color_codes, color_vocab,
+                   shape_codes.astype(np.int16), shape_vocab, version)
+
+    def save(self, path):
+        np.savez(path, format=INDEX_FORMAT, version=str(self.version or ""),
+                 grams=self.grams.astype(str), offsets=self.offsets, postings=self.postings, idf=self.idf,
+                 norms=self.norms, color_codes=self.color_codes, color_vocab=np.array(self.color_vocab, dtype=str),
+                 shape_codes=self.shape_codes, shape_vocab=np.array(self.shape_vocab, dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            if int(z["format"]) != INDEX_FORMAT:
+                raise ValueError("index format changed")
+            return cls(z["grams"].astype(object), z["offsets"], z["postings"], z["idf"], z["norms"],
+                       z["color_codes"], z["color_vocab"].tolist(), z["shape_codes"], z["shape_vocab"].tolist(),
+                       str(z["version"]))
+
+    @classmethod
+    def load_or_build(cls, df, path, version):
+        """Loads the saved index if it was built from this database version, otherwise rebuilds and saves it."""
+        if os.path.exists(path):
+            try:
+                index = cls.load(path)
+                if index.version == version and len(index) == len(df):
+                    return index
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Ignoring unreadable index '{path}': {e}")
+        print("Building local pill index...")
+        index = cls.build(df, version)
+        try:
+            index.save(path)
+            print(f"✅ Saved pill index to {path}")
+        except OSError as e:
+            print(f"⚠️ Could not save pill index: {e}")
+        return index
+
+    # --- Query ---
+    def scores(self, shape=None, color=None, imprint_front=None, imprint_back=None):
+        """Similarity of every pill to the query, in [0, 1]."""
+        total = np.zeros(len(self))
+        query_grams = imprint_ngrams(imprint_front, imprint_back)
+        query = [self._gram_lookup[g] for g in query_grams if g in self._gram_lookup]
+        if query:
+            query = np.asarray(query)
+            starts, stops = self.offsets[query], self.offsets[query + 1]
+            rows = np.concatenate([self.postings[a:b] for a, b in zip(starts, stops)])
+            weights = np.repeat(self.idf[query] ** 2, stops - starts)
+            dot = np.bincount(rows, weights=weights, minlength=len(self))
+            # Normalise by the full query norm, including n-grams no pill has.
+            query_norm = np.sqrt(np.sum(self.idf[query] ** 2) + (len(query_grams) - len(query)) * self.idf.max() ** 2)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                total += IMPRINT_WEIGHT * np.nan_to_num(dot / (self.norms * query_norm))
+
+        wanted = [self._color_lookup[c] for c in color_tokens(color) if c in self._color_lookup]
+        if wanted:
+            have = (self.color_codes >= 0).sum(axis=1)
+            common = np.isin(self.color_codes, wanted).sum(axis=1)
+            union = have + len(color_tokens(color)) - common
+            total += COLOR_WEIGHT * np.where(union > 0, common / np.maximum(union, 1), 0.0)
+
+        if shape is not None and shape in self._shape_lookup:
+            total += SHAPE_WEIGHT * (self.shape_codes == self._shape_lookup[shape])
+        return total
+
+    def search(self, k=30, **query):
+        """Row positions and scores of the top-k pills, best first."""
+        scores = self.scores(**query)
+        k = min(k, len(scores))
+        if k == 0:
+            return np.zeros(0, dtype=np.int64), scores[:0]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return top, scores[top]
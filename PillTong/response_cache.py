@@ -0,0 +1,200 @@
+# response_cache.py (Persistent LLM Response Cache)
+
+import time
+import json
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import PIL.Image
+
+# --- Defaults ---
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MODEL_NAME = "gemini-1.5-flash"
+IMAGE_HASH_MEMO = 64  # images whose hash is remembered (a server sees a new image per request)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key         TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    value       TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    created     REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access);
+"""
+
+
+def prompt_kind(text):
+    """Which step a prompt belongs to, for the hit/miss report."""
+    if "--- Database Batch ---" in text:
+        return "batch"
+    if "JSON object" in text:
+        return "features"
+    if "2D shape" in text:
+        return "shape"
+    return "web"
+
+
+def image_hash(img):
+    """
+    Content hash of the decoded pixels (plus size), so the same photo hits the cache
+    even if it was re-saved losslessly or has different metadata.
+    """
+    rgb = img.convert("RGB")
+    digest = hashlib.sha1(f"{rgb.size}".encode())
+    digest.update(rgb.tobytes())
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite cache of model answers with size-based LRU eviction.
+
+    Keys combine the image hash, a hash of the prompt text, the database version
+    and the model name, so editing the pill database or a prompt simply misses.
+    Stored entries are shape answers, batch verdicts, web answers and final IDs;
+    whenever the total size exceeds max_bytes the least recently used entries go.
+    Hit/miss counts are kept per kind for the run (report()).
+    """
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = {}
+        self.misses = {}
+        self.evictions = 0
+        self._lock = threading.Lock()  # async mode may call from worker threads
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(kind, *parts):
+        digest = hashlib.sha1(kind.encode())
+        for part in parts:
+            digest.update(b"\x00" + str(part).encode("utf-8"))
+        return f"{kind}:{digest.hexdigest()}"
+
+    def get(self, key):
+        kind = key.split(":", 1)[0]
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses[kind] = self.misses.get(kind, 0) + 1
+                return None
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.hits[kind] = self.hits.get(kind, 0) + 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        kind = key.split(":", 1)[0]
+        text = json.dumps(value, ensure_ascii=False)
+        size = len(text.encode("utf-8")) + len(key)
+        now = time.time()
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                              (key, kind, text, size, now, now))
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        total, = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        doomed = []
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            if excess <= 0:
+                break
+            doomed.append((key,))
+            excess -= size
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def report(self):
+        kinds = sorted(set(self.hits) | set(self.misses))
+        hits, misses = sum(self.hits.values()), sum(self.misses.values())
+        parts = [f"{k} {self.hits.get(k, 0)}/{self.hits.get(k, 0) + self.misses.get(k, 0)}" for k in kinds]
+        rate = 100.0 * hits / (hits + misses) if hits + misses else 0.0
+        with self._lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return (f"Cache: {hits} hit(s), {misses} miss(es) ({rate:.0f}% hits; {', '.join(parts) or 'no lookups'}), "
+                f"{self.evictions} evicted, {entries} entries / {size / 1024:.0f} KB")
+
+    def close(self):
+        self.conn.close()
+
+
+class CachedResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class CachedModel:
+    """
+    Wraps a model so every generate_content call is looked up in the cache first.
+    The prompt is keyed by its text parts and the hashes of its images; answers are
+    stored only when the call succeeds. Keys include the wrapped model's name
+    (its model_name attribute), so answers from different models never mix.
+    """
+    def __init__(self, model, cache, db_version, model_name=None):
+        self.model = model
+        self.cache = cache
+        self.db_version = db_version
+        self.model_name = model_name or getattr(model, "model_name", DEFAULT_MODEL_NAME)
+        self._image_hashes = {}  # id(image) -> (image, hash); the image is kept so the id stays valid
+        self._hash_lock = threading.Lock()
+
+    def hash_image(self, img):
+        with self._hash_lock:
+            cached = self._image_hashes.get(id(img))
+        if cached is None or cached[0] is not img:
+            cached = (img, image_hash(img))
+            with self._hash_lock:
+                self._image_hashes[id(img)] = cached
+                while len(self._image_hashes) > IMAGE_HASH_MEMO:
+                    del self._image_hashes[next(iter(self._image_hashes))]
+        return cached[1]
+
+    def prompt_key(self, prompt):
+        parts = []
+        for part in (prompt if isinstance(prompt, (list, tuple)) else [prompt]):
+            if isinstance(part, PIL.Image.Image):
+                parts.append("image:" + self.hash_image(part))
+            else:
+                parts.append(str(part))
+        return self.cache.make_key(prompt_kind("\n".join(parts)), self.model_name, self.db_version, hashlib.sha1(
+            "\x00".join(parts).encode("utf-8")).hexdigest())
+
+    def generate_content(self, prompt, **kwargs):
+        key = self.prompt_key(prompt)
+        text = self.cache.get(key)
+        if text is None:
+            text = self.model.generate_content(prompt, **kwargs).text
+            self.cache.put(key, text)
+        return CachedResponse(text)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        key = self.prompt_key(prompt)
+        text = self.cache.get(key)
+        if text is None:
+            if hasattr(self.model, "generate_content_async"):
+                response = await self.model.generate_content_async(prompt, **kwargs)
+            else:
+                response = await asyncio.to_thread(self.model.generate_content, prompt, **kwargs)
+            text = response.text
+            self.cache.put(key, text)
+        return CachedResponse(text)
+
+    # --- Final results ---
+    def final_key(self, img):
+        return self.cache.make_key("final", self.model_name, self.db_version, self.hash_image(img))
+
+    def get_final(self, img):
+        return self.cache.get(self.final_key(img))
+
+    def put_final(self, img, status, value):
+        self.cache.put(self.final_key(img), {"status": status, "value": value})
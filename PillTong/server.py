@@ -0,0 +1,160 @@
+# server.py (Long-Running Identification Service)
+
+import io
+import json
+import time
+import argparse
+import threading
+import PIL.Image
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import main
+from main import add_search_arguments, format_pill_details, identify_image, load_resources
+from service_common import PhaseMetrics
+
+# --- Defaults ---
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_INFLIGHT = 8            # identifications running at once; the rest wait
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+
+
+class IdentifyService:
+    """
+    The warm state shared by every request: catalogue, local index and model stay
+    loaded for the life of the process. Any object with generate_content (e.g. a
+    FakeModel) can be passed as model to replace the configured one.
+    """
+    def __init__(self, catalogue, pill_index=None, model=None, async_mode=False,
+                 concurrency=main.DEFAULT_CONCURRENCY, rate=main.DEFAULT_RATE, max_inflight=DEFAULT_MAX_INFLIGHT,
+                 use_vision=True):
+        if model is not None:
+            main.model = model
+        self.catalogue = catalogue
+        self.pill_index = pill_index
+        self.async_mode = async_mode
+        self.concurrency = concurrency
+        self.rate = rate
+        self.use_vision = use_vision
+        self.slots = threading.BoundedSemaphore(max_inflight)
+        self.metrics = PhaseMetrics()
+
+    def identify(self, image_bytes):
+        """Identifies one encoded image; returns the JSON-ready reply."""
+        img = PIL.Image.open(io.BytesIO(image_bytes))
+        img.load()
+        timings = {}
+        self.metrics.begin()
+        status = "ERROR"
+        try:
+            with self.slots:
+                started = time.perf_counter()
+                status, result = identify_image(img, self.catalogue, self.pill_index, self.async_mode,
+                                                self.concurrency, self.rate, timings, self.use_vision)
+                timings["total"] = time.perf_counter() - started
+        finally:
+            self.metrics.end(status if status in ("LOCAL_SUCCESS", "WEB_SUCCESS") else "ERROR", timings)
+
+        reply = {"status": status, "timings": timings}
+        if status == "LOCAL_SUCCESS":
+            reply["pill"] = json.loads(result.to_json(force_ascii=False))
+            reply["details"] = format_pill_details(result)
+        elif status == "WEB_SUCCESS":
+            reply["text"] = result
+        else:
+            reply["status"] = "ERROR"
+            reply["error"] = status
+        return reply
+
+    def metrics_report(self):
+        report = self.metrics.snapshot()
+        if isinstance(main.model, main.CachedModel):
+            report["cache"] = main.model.cache.report()
+        return report
+
+
+class IdentifyHandler(BaseHTTPRequestHandler):
+    """
+    POST /identify   body: the image file (any format PIL reads) -> JSON result
+    GET  /metrics    per-phase latency (count, mean, median, p95, max in seconds)
+    GET  /health     200 once the service is loaded
+    """
+    service = None  # set by make_server
+
+    def send_json(self, code, payload):
+        body = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self.send_json(200, {"status": "ok", "pills": len(self.service.catalogue)})
+        elif path == "/metrics":
+            self.send_json(200, self.service.metrics_report())
+        else:
+            self.send_json(404, {"error": f"Unknown path '{path}'"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/identify":
+            self.send_json(404, {"error": f"Unknown path '{url.path}'"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            self.send_json(400, {"error": "Send the image file as the request body."})
+            return
+        if length > MAX_IMAGE_BYTES:
+            self.send_json(413, {"error": f"Image larger than {MAX_IMAGE_BYTES // 2**20} MB."})
+            return
+        image_bytes = self.rfile.read(length)
+        try:
+            reply = self.service.identify(image_bytes)
+        except PIL.UnidentifiedImageError:
+            self.send_json(400, {"error": "The request body is not an image."})
+            return
+        except Exception as e:
+            self.send_json(500, {"error": f"Identification failed: {e}"})
+            return
+        if "verbose" not in parse_qs(url.query):
+            reply.pop("details", None)
+        self.send_json(200 if reply["status"] != "ERROR" else 502, reply)
+
+    def log_message(self, format, *args):
+        print(f"[{self.log_date_time_string()}] {self.address_string()} {format % args}")
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    handler = type("BoundIdentifyHandler", (IdentifyHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve pill identification over HTTP with the model and database kept loaded.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Address to listen on (default: localhost only).")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on.")
+    parser.add_argument("--max-inflight", type=int, default=DEFAULT_MAX_INFLIGHT,
+                        help="Identifications processed at once; further requests wait.")
+    add_search_arguments(parser)
+    args = parser.parse_args()
+    catalogue, pill_index = load_resources(args)
+    if catalogue is not None:
+        service = IdentifyService(catalogue, pill_index, async_mode=args.async_mode, concurrency=args.concurrency,
+                                  rate=args.rate, max_inflight=args.max_inflight, use_vision=not args.no_vision)
+        server = make_server(service, args.host, args.port)
+        print(f"✅ Serving on http://{args.host}:{args.port} (POST /identify, GET /metrics, GET /health)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Shutting down.")
+        finally:
+            server.server_close()
+            if isinstance(main.model, main.CachedModel):
+                print(main.model.cache.report())
@@ -0,0 +1,48 @@
+# service_common.py (Shared by server.py and bulk.py; no OpenCV or HTTP imports)
+
+import time
+import threading
+import statistics
+import collections
+
+# --- Constants ---
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".webp")
+METRICS_WINDOW = 1000               # latest samples kept per phase
+PHASES = ("shape", "local_search", "web", "total")
+
+
+class PhaseMetrics:
+    """Thread-safe latency samples per phase, plus request and status counts."""
+    def __init__(self, window=METRICS_WINDOW):
+        self._lock = threading.Lock()
+        self.samples = {name: collections.deque(maxlen=window) for name in PHASES}
+        self.statuses = collections.Counter()
+        self.requests = 0
+        self.in_flight = 0
+        self.started_at = time.time()
+
+    def begin(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def end(self, status, timings):
+        with self._lock:
+            self.in_flight -= 1
+            self.statuses[status] += 1
+            for name, seconds in timings.items():
+                self.samples.setdefault(name, collections.deque(maxlen=METRICS_WINDOW)).append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            phases = {}
+            for name, samples in self.samples.items():
+                lat = sorted(samples)
+                if not lat:
+                    phases[name] = {"count": 0}
+                    continue
+                p95 = lat[min(len(lat) - 1, int(round(0.95 * (len(lat) - 1))))]
+                phases[name] = {"count": len(lat), "mean": statistics.mean(lat), "median": statistics.median(lat),
+                                "p95": p95, "max": lat[-1]}
+            return {"uptime_s": time.time() - self.started_at, "requests": self.requests,
+                    "in_flight": self.in_flight, "statuses": dict(self.statuses), "phases": phases}
@@ -0,0 +1,265 @@
+# vision.py (Local Shape and Colour Pre-Filter)
+
+import os
+import csv
+import time
+import argparse
+import collections
+import cv2
+import numpy as np
+import PIL.Image
+from service_common import IMAGE_EXTENSIONS
+
+# --- Constants ---
+ANALYSIS_SIZE = 256          # longest side the image is reduced to before analysis
+MIN_CONFIDENCE = 0.6         # below this the caller should ask the LLM instead
+MIN_AREA_FRACTION = 0.01     # a pill must cover at least this much of the photo
+SECOND_COLOR_SHARE = 0.3     # share of pixels a second colour needs (two-tone capsules)
+PROFILE_BINS = 180
+CORNER_PROMINENCE = 0.03     # relative radius a corner must stand out from its neighbourhood
+
+
+class VisionEstimate:
+    """Shape and colour guesses with a 0..1 confidence each."""
+    def __init__(self, shape=None, shape_confidence=0.0, colors=(), color_confidence=0.0, details=None):
+        self.shape = shape
+        self.shape_confidence = shape_confidence
+        self.colors = list(colors)
+        self.color_confidence = color_confidence
+        self.details = details or {}
+
+    @property
+    def shape_confident(self):
+        return self.shape is not None and self.shape_confidence >= MIN_CONFIDENCE
+
+    @property
+    def color_confident(self):
+        return bool(self.colors) and self.color_confidence >= MIN_CONFIDENCE
+
+    @property
+    def color(self):
+        """The 색상 text as the database writes it ('하양' or '하양, 빨강')."""
+        return ", ".join(self.colors) if self.colors else None
+
+    def __repr__(self):
+        return (f"VisionEstimate(shape={self.shape!r} ({self.shape_confidence:.2f}), "
+                f"color={self.color!r} ({self.color_confidence:.2f}))")
+
+
+# --- Segmentation ---
+def to_analysis_array(img):
+    """RGB uint8 array of a PIL image (or path), reduced to ANALYSIS_SIZE on the longest side."""
+    if not isinstance(img, PIL.Image.Image):
+        img = PIL.Image.open(img)
+    rgb = np.asarray(img.convert("RGB"))
+    scale = ANALYSIS_SIZE / max(rgb.shape[:2])
+    if scale < 1.0:
+        rgb = cv2.resize(rgb, (round(rgb.shape[1] * scale), round(rgb.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+    return rgb
+
+
+def segment_pill(rgb):
+    """
+    Mask of the pill: pixels whose Lab colour is far from the background, estimated as
+    the median of the image border, thresholded with Otsu. Returns (mask, contour)
+    for the largest blob, or (None, None).
+    """
+    lab = cv2.cvtColor(rgb, cv2.COLOR_RGB2LAB).astype(np.float32)
+    border = np.concatenate([lab[:4].reshape(-1, 3), lab[-4:].reshape(-1, 3),
+                             lab[:, :4].reshape(-1, 3), lab[:, -4:].reshape(-1, 3)])
+    distance = np.linalg.norm(lab - np.median(border, axis=0), axis=2)
+    if distance.max() < 10:
+        return None, None  # nothing stands out from the background
+    scaled = np.clip(distance * (255.0 / distance.max()), 0, 255).astype(np.uint8)
+    _, mask = cv2.threshold(scaled, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    if not contours:
+        return None, None
+    contour = max(contours, key=cv2.contourArea)
+    if cv2.contourArea(contour) < MIN_AREA_FRACTION * mask.size:
+        return None, None
+    pill_mask = np.zeros_like(mask)
+    cv2.drawContours(pill_mask, [contour], -1, 255, thickness=cv2.FILLED)
+    return pill_mask, contour
+
+
+# --- Shape ---
+def radial_profile(contour, center, bins=PROFILE_BINS):
+    """Largest contour radius per angle bin, normalised to a maximum of 1 (gaps interpolated)."""
+    points = contour[:, 0, :].astype(np.float64) - center
+    angles = np.arctan2(points[:, 1], points[:, 0])
+    radii = np.hypot(points[:, 0], points[:, 1])
+    idx = ((angles + np.pi) / (2 * np.pi) * bins).astype(int) % bins
+    profile = np.zeros(bins)
+    np.maximum.at(profile, idx, radii)
+    filled = np.flatnonzero(profile)
+    profile = np.interp(np.arange(bins), filled, profile[filled], period=bins)
+    return profile / profile.max()
+
+
+def count_corners(profile, prominence=CORNER_PROMINENCE):
+    """Local maxima of the radial profile that stand out by `prominence` within +-1/16 turn."""
+    bins = len(profile)
+    smooth = np.convolve(np.concatenate([profile[-2:], profile, profile[:2]]), np.ones(5) / 5, mode="valid")
+    window = bins // 16
+    corners = 0
+    for i in range(bins):
+        neighbours = smooth[np.arange(i - window, i + window + 1) % bins]
+        if smooth[i] == neighbours.max() and smooth[i] - neighbours.min() >= prominence:
+            if smooth[i] != smooth[i - 1]:  # count a flat top once
+                corners += 1
+    return corners
+
+
+def _margin(value, threshold, scale):
+    """How far value is from a decision threshold, as 0..1."""
+    return float(np.clip(abs(value - threshold) / scale, 0.0, 1.0))
+
+
+def classify_shape(contour):
+    """
+    One of the database's 제형 words from the pill outline, with a confidence: the
+    smallest margin of the decisions taken (elongation, fill of the bounding
+    rectangle, corner count).
+    """
+    area = cv2.contourArea(contour)
+    (cx, cy), (w, h), _ = cv2.minAreaRect(contour)
+    aspect = max(w, h) / max(min(w, h), 1e-6)
+    fill = area / max(w * h, 1e-6)
+    moments = cv2.moments(contour)
+    centroid = np.array([moments["m10"] / moments["m00"], moments["m01"] / moments["m00"]])
+    corners = count_corners(radial_profile(contour, centroid))
+    offset = np.hypot(centroid[0] - cx, centroid[1] - cy) / max(min(w, h), 1e-6)
+    details = {"aspect": aspect, "fill": fill, "corners": corners, "centroid_offset": offset}
+
+    margins = [_margin(aspect, 1.2, 0.1)]
+    if corners == 3 and fill < 0.7:  # a triangle fills half its rectangle
+        shape = "삼각형"
+        margins = [_margin(fill, 0.7, 0.1)]
+    elif aspect >= 1.2:
+        margins.append(_margin(fill, 0.86, 0.05))
+        if fill >= 0.86:
+            shape = "장방형"
+        elif corners == 4 and fill < 0.74:  # an ellipse fills pi/4 of its rectangle, a rhombus less
+            shape = "마름모형"
+            margins.append(_margin(fill, 0.74, 0.04))
+        elif corners == 2 and offset > 0.04:
+            shape = "반원형"
+            margins.append(_margin(offset, 0.04, 0.03))
+        else:
+            shape = "타원형"
+    else:
+        shape = {0: "원형", 4: "사각형", 5: "오각형", 6: "육각형", 8: "팔각형"}.get(corners, "기타")
+        if shape == "사각형":
+            margins.append(_margin(fill, 0.85, 0.1))
+            if fill < 0.85:
+                shape = "마름모형"
+        elif shape == "기타":
+            margins.append(0.0)
+    return shape, min(margins), details
+
+
+# --- Colour ---
+def classify_colors(rgb, mask):
+    """
+    Per-pixel colour names (HSV rules) over the eroded pill mask. Returns the dominant
+    colour (plus a second one covering SECOND_COLOR_SHARE of the pill) and the share
+    of pixels they cover as the confidence.
+    """
+    inner = cv2.erode(mask, np.ones((5, 5), np.uint8)) > 0
+    if inner.sum() == 0:
+        inner = mask > 0
+    hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)[inner].astype(np.int32)
+    hue, sat, val = hsv[:, 0] * 2, hsv[:, 1], hsv[:, 2]
+    names = np.select(
+        [val < 50,
+         (sat < 40) & (val > 190),
+         sat < 40,
+         ((hue < 10) | (hue >= 340)) & (sat < 110) & (val > 170),
+         (hue >= 290) & (sat < 110) & (val > 170),
+         (hue < 40) & (val < 150),
+         (hue < 10) | (hue >= 340),
+         hue < 40,
+         hue < 70,
+         hue < 100,
+         hue < 160,
+         hue < 195,
+         hue < 230,
+         hue < 260,
+         hue < 290],
+        ["검정", "하양", "회색", "분홍", "분홍", "갈색", "빨강", "주황", "노랑", "연두", "초록", "청록", "파랑", "남색", "보라"],
+        default="자주")
+    counts = collections.Counter(names.tolist()).most_common(2)
+    total = len(names)
+    colors = [counts[0][0]]
+    share = counts[0][1] / total
+    if len(counts) > 1 and counts[1][1] / total >= SECOND_COLOR_SHARE:
+        colors.append(counts[1][0])
+        share += counts[1][1] / total
+    return colors, share
+
+
+def estimate_features(img):
+    """Shape and colour of the pill in a PIL image (or path); confidences 0 if it cannot be segmented."""
+    rgb = to_analysis_array(img)
+    mask, contour = segment_pill(rgb)
+    if mask is None:
+        return VisionEstimate()
+    shape, shape_confidence, details = classify_shape(contour)
+    colors, color_confidence = classify_colors(rgb, mask)
+    return VisionEstimate(shape, shape_confidence, colors, color_confidence, details)
+
+
+# --- Benchmark ---
+def list_images(folder):
+    return sorted(name for name in os.listdir(folder) if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def load_labels(path):
+    """CSV with columns filename, 제형, 색상 (the true values for the benchmark)."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return {row["filename"]: row for row in csv.DictReader(f)}
+
+
+def benchmark(folder, labels=None, min_confidence=MIN_CONFIDENCE):
+    """Runs estimate_features on every image in folder and prints timing (and accuracy with labels)."""
+    timings = []
+    confident = 0
+    shape_hits = color_hits = labelled = 0
+    for name in list_images(folder):
+        started = time.perf_counter()
+        estimate = estimate_features(os.path.join(folder, name))
+        timings.append(time.perf_counter() - started)
+        confident += estimate.shape_confidence >= min_confidence
+        line = f"{name}: {estimate} in {timings[-1] * 1000:.1f} ms"
+        if labels and name in labels:
+            truth = labels[name]
+            labelled += 1
+            shape_ok = estimate.shape == truth.get("제형")
+            color_ok = set(estimate.colors) == {c.strip() for c in str(truth.get("색상", "")).split(",") if c.strip()}
+            shape_hits += shape_ok
+            color_hits += color_ok
+            line += f"  [shape {'✅' if shape_ok else '❌'} color {'✅' if color_ok else '❌'}]"
+        print(line)
+    if not timings:
+        print(f"❌ No images found in '{folder}'")
+        return
+    ms = np.array(timings) * 1000
+    print(f"\n{len(ms)} image(s): mean {ms.mean():.1f} ms, median {np.median(ms):.1f} ms, max {ms.max():.1f} ms; "
+          f"{confident} confident enough to skip the LLM shape call (>= {min_confidence:.2f})")
+    if labelled:
+        print(f"Accuracy on {labelled} labelled image(s): shape {100 * shape_hits / labelled:.0f}%, "
+              f"color {100 * color_hits / labelled:.0f}%")
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the local shape/colour pre-filter on a folder of pill photos.")
+    parser.add_argument("folder", nargs="?", default="sample_images", help="Folder of images (default: sample_images).")
+    parser.add_argument("--labels", help="CSV with filename, 제형, 색상 columns to measure accuracy.")
+    parser.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE)
+    args = parser.parse_args()
+    benchmark(args.folder, load_labels(args.labels) if args.labels else None, args.min_confidence)
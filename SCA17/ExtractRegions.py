@@ -0,0 +1,163 @@
+import os
+import csv
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import bamnostic
+
+# Reads are extracted per sample in worker processes; each worker keeps its alignment
+# files (and their .crai/.bai index) open for every region of the samples it gets.
+_reference_path = None
+_open_files = {}
+
+
+def ReadSampleManifest(manifest_path: str) -> list:
+    """
+    Reads a sample manifest and returns [(sample_name, alignment_path), ...].
+    Accepts a TSV/CSV with 'sample' and 'path' columns, or a plain list of CRAM/BAM
+    paths (one per line, sample name = file name without extension).
+    Relative paths are resolved from the manifest's folder.
+    """
+    base_directory = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, 'r', newline='') as file:
+        first_line = file.readline()
+        file.seek(0)
+        delimiter = '\t' if '\t' in first_line else ','
+        if 'path' in [column.strip().lower() for column in first_line.split(delimiter)]:
+            reader = csv.DictReader(file, delimiter=delimiter)
+            rows = [{k.strip().lower(): v.strip() for k, v in row.items()} for row in reader]
+            samples = [(row.get('sample') or os.path.splitext(os.path.basename(row['path']))[0], row['path'])
+                       for row in rows if row.get('path')]
+        else:
+            paths = [line.strip() for line in file if line.strip() and not line.startswith('#')]
+            samples = [(os.path.splitext(os.path.basename(path))[0], path) for path in paths]
+    return [(name, path if os.path.isabs(path) else os.path.join(base_directory, path)) for name, path in samples]
+
+
+def ReadBedRegions(bed_path: str) -> list:
+    """
+    Reads a BED file and returns [(chromosome, start, end, name), ...] with BED
+    coordinates (0-based start, exclusive end). Unnamed regions are called chr:start-end.
+    """
+    regions = []
+    with open(bed_path, 'r') as file:
+        for line in file:
+            if not line.strip() or line.startswith(('#', 'track', 'browser')):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            chromosome, start, end = fields[0], int(fields[1]), int(fields[2])
+            name = fields[3] if len(fields) > 3 and fields[3] else f"{chromosome}:{start}-{end}"
+            regions.append((chromosome, start, end, name))
+    return regions
+
+
+def _InitWorker(reference_path: str):
+    global _reference_path
+    _reference_path = reference_path
+
+
+def GetAlignmentFile(alignment_path: str):
+    """Opens a CRAM/BAM once per worker process and reuses the handle (and its index) afterwards."""
+    alignment = _open_files.get(alignment_path)
+    if alignment is None:
+        if alignment_path.lower().endswith('.cram'):
+            alignment = bamnostic.AlignmentFile(alignment_path, 'rc', reference_filename=_reference_path)
+        else:
+            alignment = bamnostic.AlignmentFile(alignment_path, 'rb')
+        _open_files[alignment_path] = alignment
+    return alignment
+
+
+def StreamReads(alignment, chromosome: str, start: int, end: int, min_mapq: int = 0):
+    """Yields (name, sequence, mapping quality, reference start, strand) for reads overlapping the region."""
+    for read in alignment.fetch(chromosome, start, end):
+        if read.is_unmapped or read.mapping_quality < min_mapq or not read.query_sequence:
+            continue
+        yield (read.query_name, read.query_sequence, read.mapping_quality, read.reference_start,
+               '-' if read.is_reverse else '+')
+
+
+def SafeFileName(name: str) -> str:
+    return ''.join(ch if ch.isalnum() or ch in '-_.' else '_' for ch in name)
+
+
+def ExtractSample(sample_name: str, alignment_path: str, regions: list, out_directory: str,
+                  out_format: str = 'fasta', min_mapq: int = 0) -> list:
+    """
+    Writes the reads of one sample for every region to
+    out_directory/<region>/<sample>.fa (or .tsv), streaming each read straight to
+    disk. Returns [(sample, region name, read count), ...].
+    """
+    alignment = GetAlignmentFile(alignment_path)
+    extension = '.fa' if out_format == 'fasta' else '.tsv'
+    counts = []
+    for chromosome, start, end, region_name in regions:
+        region_directory = os.path.join(out_directory, SafeFileName(region_name))
+        os.makedirs(region_directory, exist_ok=True)
+        out_path = os.path.join(region_directory, SafeFileName(sample_name) + extension)
+        temp_path = f"{out_path}.tmp{os.getpid()}"
+        count = 0
+        with open(temp_path, 'w') as out_file:
+            if out_format != 'fasta':
+                out_file.write("read\tref_start\tstrand\tmapq\tsequence\n")
+            for name, sequence, mapq, ref_start, strand in StreamReads(alignment, chromosome, start, end, min_mapq):
+                if out_format == 'fasta':
+                    out_file.write(f">{name} {chromosome}:{ref_start + 1} {strand} mq={mapq}\n{sequence}\n")
+                else:
+                    out_file.write(f"{name}\t{ref_start}\t{strand}\t{mapq}\t{sequence}\n")
+                count += 1
+        os.replace(temp_path, out_path)  # only complete region files appear under their final name
+        counts.append((sample_name, region_name, count))
+    return counts
+
+
+def ExtractRegions(samples: list, regions: list, out_directory: str, reference_path: str = None,
+                   workers: int = 4, out_format: str = 'fasta', min_mapq: int = 0) -> list:
+    """
+    Fans the samples out over a process pool (one task per sample, all regions) and
+    writes out_directory/summary.tsv with the read count per sample and region.
+    Samples that fail are reported and skipped. Returns the summary rows.
+    """
+    os.makedirs(out_directory, exist_ok=True)
+    summary = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_InitWorker, initargs=(reference_path,)) as pool:
+        futures = {pool.submit(ExtractSample, name, path, regions, out_directory, out_format, min_mapq): name
+                   for name, path in samples}
+        for future in as_completed(futures):
+            sample_name = futures[future]
+            try:
+                counts = future.result()
+            except Exception as e:
+                print(f"Error in sample {sample_name}: {e}")
+                continue
+            summary.extend(counts)
+            print(f"{sample_name}: " + ", ".join(f"{region} {count} reads" for _, region, count in counts))
+
+    summary.sort()
+    with open(os.path.join(out_directory, 'summary.tsv'), 'w') as file:
+        file.write("sample\tregion\treads\n")
+        for sample_name, region_name, count in summary:
+            file.write(f"{sample_name}\t{region_name}\t{count}\n")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract the reads of BED regions from every CRAM/BAM in a sample manifest.")
+    parser.add_argument("manifest", help="Sample manifest: TSV/CSV with sample and path columns, or one CRAM/BAM path per line.")
+    parser.add_argument("bed", help="BED file of regions (e.g. chr6 170561889 170562035 TBP_CAG).")
+    parser.add_argument("--reference", help="Reference FASTA the CRAMs were compressed against (e.g. GRCh38 full analysis set).")
+    parser.add_argument("--out", default="regions_out", help="Output folder (one subfolder per region).")
+    parser.add_argument("--workers", type=int, default=4, help="Samples processed in parallel.")
+    parser.add_argument("--format", choices=['fasta', 'tsv'], default='fasta', help="Per-region output format.")
+    parser.add_argument("--min-mapq", type=int, default=0, help="Skip reads below this mapping quality.")
+    args = parser.parse_args()
+
+    samples = ReadSampleManifest(args.manifest)
+    regions = ReadBedRegions(args.bed)
+    missing = [path for _, path in samples if not os.path.exists(path)]
+    if missing:
+        for path in missing:
+            print(f"File not found: {path}")
+        exit()
+    print(f"Extracting {len(regions)} region(s) from {len(samples)} sample(s) with {args.workers} worker(s)...")
+    summary = ExtractRegions(samples, regions, args.out, args.reference, args.workers, args.format, args.min_mapq)
+    print(f"Wrote {sum(count for _, _, count in summary)} reads; summary in {os.path.join(args.out, 'summary.tsv')}")